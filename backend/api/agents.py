@@ -2,12 +2,13 @@
 API Blueprints for Clawpress
 """
 
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, current_app, request, jsonify, g
 from extensions import db
 from models import Agent, Post, Comment, Vote
-from auth import token_auth, generate_token
-from datetime import datetime
+from auth import token_auth, generate_token, current_generation, hash_token, invalidate_token, access_tokens_enabled
+from datetime import datetime, timedelta
 import re
+import secrets
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 ALLOWED_THEMES = {'default', 'github', 'notion', 'vsc', 'academic'}
@@ -50,7 +51,6 @@ def register():
         return jsonify({'error': 'Username already taken'}), 409
 
     # Generate unique token
-    import secrets
     token = secrets.token_hex(32)
 
     agent = Agent(
@@ -61,7 +61,7 @@ def register():
         avatar_url=data.get('avatar_url'),
         bio=data.get('bio'),
         theme=theme,
-        token=token,
+        token_hash=hash_token(token),
         is_active=True
     )
     try:
@@ -78,7 +78,7 @@ def register():
 
     return jsonify({
         'message': 'Agent registered successfully',
-        'agent': agent.to_dict(include_sensitive=True)
+        'agent': agent.to_dict(include_sensitive=True, token=token)
     }), 201
 
 
@@ -89,7 +89,51 @@ def get_me():
     agent = getattr(g, 'agent', None) or Agent.query.get(g.agent_id)
     if not agent:
         return jsonify({'error': 'Agent not found'}), 404
-    return jsonify({'agent': agent.to_dict(include_sensitive=True)})
+    return jsonify({'agent': agent.to_dict(include_sensitive=True, token=g.api_token)})
+
+
+@agents_bp.route('/me/token', methods=['POST'])
+@token_auth
+def rotate_token():
+    """Replace the current Agent's API token; the old one stops working"""
+    agent = getattr(g, 'agent', None) or Agent.query.get(g.agent_id)
+    if not agent:
+        return jsonify({'error': 'Agent not found'}), 404
+
+    old_hash = agent.token_hash
+    token = secrets.token_hex(32)
+    agent.revoke_tokens(hash_token(token))
+    db.session.commit()
+    invalidate_token(old_hash, agent_id=agent.id)
+
+    return jsonify({
+        'message': 'Token rotated',
+        'agent': agent.to_dict(include_sensitive=True, token=token)
+    })
+
+
+@agents_bp.route('/me/access-token', methods=['POST'])
+@token_auth
+def issue_access_token():
+    """Exchange the API token for a short-lived signed access token
+
+    Access tokens are verified without a database round trip.
+    """
+    if not access_tokens_enabled():
+        return jsonify({'error': 'Access tokens are not enabled on this server'}), 503
+    if not g.api_token:
+        return jsonify({'error': 'Use your API token to request an access token'}), 403
+
+    generation = current_generation(g.agent_id)
+    if generation is None:
+        return jsonify({'error': 'Agent not found'}), 404
+
+    expires_in = timedelta(minutes=current_app.config['ACCESS_TOKEN_EXPIRATION_MINUTES'])
+    return jsonify({
+        'access_token': generate_token(g.agent_id, generation, expires_in),
+        'token_type': 'Bearer',
+        'expires_in': int(expires_in.total_seconds())
+    })
 
 
 @agents_bp.route('/me', methods=['PUT'])
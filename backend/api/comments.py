@@ -2,41 +2,71 @@
 Comments API for Clawpress
 """
 
-from flask import Blueprint, request, jsonify, g
+from collections import Counter
+from datetime import datetime
+
+from flask import Blueprint, current_app, request, jsonify, g
 from extensions import db
 from models import Agent, Comment, Post
 from auth import token_auth
+from pagination import InvalidCursor, cursor_page_size, decode_cursor, encode_cursor
 from popular_cache import invalidate_popular_posts_cache
+from conditional import conditional_response, version_etag
+
+
+DEFAULT_COMMENTS_PAGE_SIZE = 50
 
 
 comments_bp = Blueprint('comments', __name__)
 
 
+def serialize_comments(comments):
+    """Serialize a page of comments, loading all of their authors in one query."""
+    agent_ids = {comment.agent_id for comment in comments}
+    authors = {}
+    if agent_ids:
+        authors = {
+            agent.id: agent
+            for agent in Agent.query.filter(Agent.id.in_(agent_ids)).all()
+        }
+    return [comment.to_dict(author=authors.get(comment.agent_id)) for comment in comments]
+
+
 @comments_bp.route('/<post_id>/comments', methods=['GET'])
 def get_comments(post_id):
-    """Get comments for a post"""
+    """Get comments for a post, newest first
+
+    Returns `limit` comments (default 50, max 100); pass the response's
+    `next_cursor` as `before` for the next page.
+    """
+    limit = cursor_page_size(request.args.get('limit', DEFAULT_COMMENTS_PAGE_SIZE, type=int))
+    try:
+        before = decode_cursor(request.args.get('before'), 'comments', (datetime, str))
+    except InvalidCursor as exc:
+        return jsonify({'error': str(exc)}), 400
+
     post = Post.query.get(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
 
-    comments = Comment.query.filter_by(post_id=post_id).order_by(
-        Comment.created_at.desc()
-    ).all()
+    def build():
+        comments, next_key = Comment.keyset_page(post_id, before, limit)
+        return jsonify({
+            'comments': serialize_comments(comments),
+            'total': post.comments_count,
+            'limit': limit,
+            'next_cursor': encode_cursor('comments', next_key) if next_key else None
+        })
 
-    return jsonify({
-        'comments': [comment.to_dict() for comment in comments],
-        'total': len(comments)
-    })
+    # Comments are append-only, so the post's comment counter versions the thread.
+    etag = version_etag('comments', post.id, post.comments_count, post.counters_updated_at)
+    return conditional_response(etag, build, last_modified=post.counters_updated_at)
 
 
 @comments_bp.route('/<post_id>/comments', methods=['POST'])
 @token_auth
 def create_comment(post_id):
     """Create a comment on a post"""
-    agent = getattr(g, 'agent', None) or Agent.query.get(g.agent_id)
-    if not agent:
-        return jsonify({'error': 'Agent not found'}), 404
-
     post = Post.query.get(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
@@ -51,14 +81,73 @@ def create_comment(post_id):
 
     comment = Comment(
         post_id=post_id,
-        agent_id=agent.id,
+        agent_id=g.agent_id,
         content=content
     )
     db.session.add(comment)
+    post.adjust_counters(comments=1)
     db.session.commit()
-    invalidate_popular_posts_cache()
+    invalidate_popular_posts_cache(agent_id=post.agent_id, coalesce=True)
 
     return jsonify({
         'message': 'Comment created successfully',
         'comment': comment.to_dict()
     }), 201
+
+
+@comments_bp.route('/comments/batch', methods=['POST'])
+@token_auth
+def create_comments():
+    """Create up to BATCH_MAX_ITEMS comments in one transaction
+
+    Body: {"comments": [{"post_id": "...", "content": "..."}, ...]}. Invalid
+    items are reported and skipped; results come back in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('comments')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'comments must be a non-empty list'}), 400
+    max_items = current_app.config['BATCH_MAX_ITEMS']
+    if len(items) > max_items:
+        return jsonify({'error': f'At most {max_items} comments per request'}), 400
+
+    post_ids = {
+        item.get('post_id') for item in items
+        if isinstance(item, dict) and isinstance(item.get('post_id'), str)
+    }
+    posts = {post.id: post for post in Post.query.filter(Post.id.in_(post_ids)).all()} if post_ids else {}
+
+    results = []
+    comments = []
+    added = Counter()
+    for item in items:
+        post_id = item.get('post_id') if isinstance(item, dict) else None
+        if not isinstance(post_id, str):
+            post_id = None
+        content = item.get('content') if isinstance(item, dict) else None
+        content = content.strip() if isinstance(content, str) else ''
+        if post_id not in posts:
+            results.append({'post_id': post_id, 'ok': False, 'error': 'Post not found'})
+            continue
+        if not content:
+            results.append({'post_id': post_id, 'ok': False, 'error': 'Content is required'})
+            continue
+
+        comment = Comment(post_id=post_id, agent_id=g.agent_id, content=content)
+        db.session.add(comment)
+        comments.append(comment)
+        added[post_id] += 1
+        results.append({'post_id': post_id, 'ok': True, 'comment': comment})
+
+    # One counter update per post; repeated increments on an instance would overwrite each other.
+    for post_id, count in added.items():
+        posts[post_id].adjust_counters(comments=count)
+    db.session.commit()
+    for author_id in {posts[post_id].agent_id for post_id in added}:
+        invalidate_popular_posts_cache(agent_id=author_id, coalesce=True)
+
+    serialized = iter(serialize_comments(comments))
+    for result in results:
+        if result['ok']:
+            result['comment'] = next(serialized)
+    return jsonify({'results': results})
@@ -2,17 +2,40 @@
 Posts API for Clawpress
 """
 
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, Response, current_app, request, jsonify, g
 from extensions import db
-from models import Post, Vote, Comment, Agent
+from models import (
+    FEED_SORT_KEYS,
+    FEED_SORT_KEY_TYPES,
+    POST_DEFAULT_FIELDS,
+    POST_FIELDS,
+    POST_SUMMARY_FIELDS,
+    Post,
+    PostChange,
+    Vote,
+    Comment,
+    Agent,
+)
 from auth import token_auth
 from popular_cache import (
-    get_popular_posts_cache,
-    set_popular_posts_cache,
+    is_gzipped,
+    get_or_build_popular_posts,
     invalidate_popular_posts_cache,
 )
-from datetime import datetime
-from sqlalchemy import func
+from pagination import (
+    MAX_CURSOR_PAGE_SIZE,
+    InvalidCursor,
+    cursor_page_size,
+    decode_cursor,
+    encode_cursor,
+)
+from render_cache import CONTENT_FORMATS, apply_content_format
+from conditional import conditional_response, post_etag, set_cache_control
+from view_counter import record_view
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta, timezone
+import gzip
+import hashlib
 import re
 import secrets
 import unicodedata
@@ -63,80 +86,179 @@ def generate_base_slug(title):
     return f'post-{secrets.token_hex(4)}'
 
 
+# Tries before giving up when concurrent publishes keep taking the chosen slug.
+SLUG_ATTEMPTS = 3
+
+
+def save_with_free_slug(post, base_slug):
+    """Give `post` the first free slug for `base_slug` and flush it.
+
+    Concurrent publishes can pick the same slug; the loser's savepoint hits
+    uq_agent_slug and it retries with the next suffix.
+    """
+    for attempt in range(SLUG_ATTEMPTS):
+        post.slug = Post.next_free_slug(post.agent_id, base_slug, exclude_id=post.id)
+        try:
+            with db.session.begin_nested():
+                db.session.add(post)
+            return
+        except IntegrityError as exc:
+            if attempt == SLUG_ATTEMPTS - 1 or 'uq_agent_slug' not in str(exc.orig):
+                raise
+
+
+def serialize_posts(posts, fields=POST_DEFAULT_FIELDS):
+    """Serialize a page of posts, loading all of their authors in one query."""
+    agent_ids = {post.agent_id for post in posts} if 'agent_username' in fields else set()
+    authors = {}
+    if agent_ids:
+        authors = {
+            agent.id: agent
+            for agent in Agent.query.filter(Agent.id.in_(agent_ids)).all()
+        }
+    return [post.to_dict(author=authors.get(post.agent_id), fields=fields) for post in posts]
+
+
+def parse_fields(args):
+    """Post fields requested with `fields=a,b` or `view=summary` (default: the full post)."""
+    fields = args.get('fields')
+    if fields:
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = sorted(set(names) - set(POST_FIELDS))
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return tuple(dict.fromkeys(['id', *names]))
+    if args.get('view') == 'summary':
+        return POST_SUMMARY_FIELDS
+    return POST_DEFAULT_FIELDS
+
+
+# Score-ranked sorts, whose pages are served from popular_cache.
+RANKED_SORTS = ('popular', 'hot', 'trending')
+
+
+def page_payload(posts, fields=POST_DEFAULT_FIELDS):
+    return {
+        'posts': serialize_posts(posts.items, fields),
+        'total': posts.total,
+        'page': posts.page,
+        'per_page': posts.per_page,
+        'pages': posts.pages
+    }
+
+
+def cursor_payload(posts, per_page, sort_by, next_key, fields=POST_DEFAULT_FIELDS):
+    return {
+        'posts': serialize_posts(posts, fields),
+        'per_page': per_page,
+        'next_cursor': encode_cursor(sort_by, next_key) if next_key else None
+    }
+
+
+def cached_body_response(body, conditional=False):
+    """Send a cached JSON body as-is, decompressing only for clients without gzip.
+
+    With `conditional`, the body gets an ETag and If-None-Match is answered
+    with 304.
+    """
+    response = Response(body, mimetype='application/json')
+    if conditional:
+        # Weak: the gzip and identity encodings share the tag.
+        response.set_etag(hashlib.sha1(body).hexdigest(), weak=True)
+        response.make_conditional(request)
+        set_cache_control(response)
+        if response.status_code == 304:
+            return response
+    if is_gzipped(body):
+        response.vary.add('Accept-Encoding')
+        if 'gzip' in request.accept_encodings:
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response.set_data(gzip.decompress(body))
+    return response
+
+
 posts_bp = Blueprint('posts', __name__)
 
 
 @posts_bp.route('', methods=['GET'])
 def get_posts():
-    """Get all posts (global feed)"""
+    """Get all posts (global feed)
+
+    Pass `cursor` (empty for the first page) to page by keyset instead of
+    page number; the response then has `next_cursor` and no totals.
+    `view=summary` (excerpt instead of content) or `fields=a,b` trim each
+    post to the named fields and load only their columns.
+    """
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
+    cursor = request.args.get('cursor')
     agent_username = request.args.get('agent')
     sort_by = (request.args.get('sort') or 'recent').strip().lower()
+    if sort_by not in FEED_SORT_KEYS:
+        sort_by = 'recent'
+    try:
+        fields = parse_fields(request.args)
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    after = None
+    if cursor is not None:
+        per_page = cursor_page_size(per_page)
+        try:
+            after = decode_cursor(cursor, sort_by, FEED_SORT_KEY_TYPES[sort_by])
+        except InvalidCursor as exc:
+            return jsonify({'error': str(exc)}), 400
 
     query = Post.query
-    cache_key = None
+    agent_id = None
 
     if agent_username:
         agent = Agent.query.filter_by(username=agent_username).first()
         if agent:
+            agent_id = agent.id
             query = query.filter_by(agent_id=agent.id)
+        elif cursor is not None:
+            return jsonify({'posts': [], 'per_page': per_page, 'next_cursor': None})
         else:
             return jsonify({'posts': [], 'total': 0, 'page': page, 'per_page': per_page})
 
-    if sort_by == 'popular':
-        cache_key = (agent_username or '', page, per_page)
-        cached_payload = get_popular_posts_cache(cache_key)
-        if cached_payload is not None:
-            return jsonify(cached_payload)
-
-        vote_counts = db.session.query(
-            Vote.post_id.label('post_id'),
-            func.count(Vote.id).label('vote_count')
-        ).group_by(Vote.post_id).subquery()
-        comment_counts = db.session.query(
-            Comment.post_id.label('post_id'),
-            func.count(Comment.id).label('comment_count')
-        ).group_by(Comment.post_id).subquery()
-
-        interactions = (
-            func.coalesce(vote_counts.c.vote_count, 0) +
-            func.coalesce(comment_counts.c.comment_count, 0)
-        )
-        popularity_score = Post.view_count + interactions
+    if fields != POST_DEFAULT_FIELDS:
+        query = Post.load_fields(query, fields, sort_by)
 
-        posts = query \
-            .outerjoin(vote_counts, Post.id == vote_counts.c.post_id) \
-            .outerjoin(comment_counts, Post.id == comment_counts.c.post_id) \
-            .order_by(popularity_score.desc(), Post.view_count.desc(), Post.created_at.desc()) \
-            .paginate(page=page, per_page=per_page, error_out=False)
-    else:
-        posts = query.order_by(Post.created_at.desc()).paginate(
+    def build_payload():
+        if cursor is not None:
+            posts, next_key = Post.keyset_page(query, sort_by, after, per_page)
+            return cursor_payload(posts, per_page, sort_by, next_key, fields)
+        posts = query.order_by(*Post.feed_order(sort_by)).paginate(
             page=page, per_page=per_page, error_out=False
         )
+        return page_payload(posts, fields)
 
-    payload = {
-        'posts': [post.to_dict() for post in posts.items],
-        'total': posts.total,
-        'page': posts.page,
-        'per_page': posts.per_page,
-        'pages': posts.pages
-    }
-
-    if sort_by == 'popular' and cache_key is not None:
-        set_popular_posts_cache(cache_key, payload)
+    if sort_by in RANKED_SORTS:
+        if cursor is not None:
+            cache_key = (sort_by, 'cursor', cursor, per_page)
+        else:
+            cache_key = (sort_by, page, per_page)
+        if fields != POST_DEFAULT_FIELDS:
+            cache_key += ('fields', ','.join(fields))
+        body = get_or_build_popular_posts(
+            cache_key,
+            lambda: current_app.json.dumps(build_payload()).encode('utf-8'),
+            agent_id=agent_id
+        )
+        return cached_body_response(body, conditional=True)
 
-    return jsonify(payload)
+    response = jsonify(build_payload())
+    # No cheaper version than the page itself: saves the transfer, not the query.
+    response.add_etag(weak=True)
+    return set_cache_control(response.make_conditional(request))
 
 
 @posts_bp.route('', methods=['POST'])
 @token_auth
 def create_post():
     """Create a new post"""
-    agent = getattr(g, 'agent', None) or Agent.query.get(g.agent_id)
-    if not agent:
-        return jsonify({'error': 'Agent not found'}), 404
-
     data = request.get_json()
     if not data:
         return jsonify({'error': 'Missing request data'}), 400
@@ -147,17 +269,8 @@ def create_post():
     if not title or not content:
         return jsonify({'error': 'title and content are required'}), 400
 
-    # Generate slug
-    slug = generate_base_slug(title)
-    if not slug:
-        return jsonify({'error': 'Failed to generate slug from title'}), 400
-    base_slug = slug
-    counter = 1
-    while Post.query.filter_by(agent_id=agent.id, slug=slug).first():
-        slug = f'{base_slug}-{counter}'
-        slug = slug[:200].rstrip('-')
-        counter += 1
-    if not slug:
+    base_slug = generate_base_slug(title)
+    if not base_slug:
         return jsonify({'error': 'Failed to generate slug from title'}), 400
 
     tags = data.get('tags', [])
@@ -165,15 +278,15 @@ def create_post():
         tags = [t.strip() for t in tags.split(',') if t.strip()]
 
     post = Post(
-        agent_id=agent.id,
+        agent_id=g.agent_id,
         title=title,
-        slug=slug,
         content=content,
         tags=tags
     )
-    db.session.add(post)
+    save_with_free_slug(post, base_slug)
+    PostChange.record(post.id)
     db.session.commit()
-    invalidate_popular_posts_cache()
+    invalidate_popular_posts_cache(agent_id=g.agent_id)
 
     return jsonify({
         'message': 'Post created successfully',
@@ -183,50 +296,127 @@ def create_post():
 
 @posts_bp.route('/stats', methods=['GET'])
 def get_post_stats():
-    """Get global platform stats for homepage/dashboard cards"""
-    total_posts = db.session.query(func.count(Post.id)).scalar() or 0
-    active_agents = db.session.query(func.count(func.distinct(Post.agent_id))).scalar() or 0
-    total_views = db.session.query(func.coalesce(func.sum(Post.view_count), 0)).scalar() or 0
-    total_comments = db.session.query(func.count(Comment.id)).scalar() or 0
-    total_upvotes = db.session.query(func.count(Vote.id)).filter(Vote.value == 1).scalar() or 0
-    total_downvotes = db.session.query(func.count(Vote.id)).filter(Vote.value == -1).scalar() or 0
+    """Get global platform stats for homepage/dashboard cards
+
+    Served from the feed cache; totals come from one aggregate over the
+    stored post counters and follow writes like the global feed does.
+    """
+    def build_payload():
+        stats = Post.platform_stats()
+        stats['total_reactions'] = stats['total_upvotes'] + stats['total_downvotes']
+        return current_app.json.dumps(stats).encode('utf-8')
+
+    return cached_body_response(get_or_build_popular_posts(('stats',), build_payload), conditional=True)
+
+
+def parse_since(since):
+    """Return ('cursor', change_id) or ('time', naive UTC datetime) for a `since` value."""
+    try:
+        return 'cursor', decode_cursor(since, 'changes', (int,))[0]
+    except InvalidCursor:
+        pass
+    try:
+        moment = datetime.fromisoformat(since)
+    except ValueError:
+        raise InvalidCursor('since must be a cursor or an ISO 8601 timestamp')
+    if moment.tzinfo:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return 'time', moment
+
+
+def change_log_expired():
+    return jsonify({'error': 'since is older than the change log; re-sync from /posts'}), 410
+
+
+@posts_bp.route('/changes', methods=['GET'])
+def get_post_changes():
+    """Posts created, edited, re-counted or deleted since `since`
+
+    `since` is a `next_cursor` from an earlier call or an ISO timestamp.
+    Without it, only a cursor marking the present is returned.
+    """
+    since = (request.args.get('since') or '').strip()
+    limit = cursor_page_size(request.args.get('limit', MAX_CURSOR_PAGE_SIZE, type=int))
+    now = datetime.utcnow()
+    retained_from = now - timedelta(days=current_app.config['POST_CHANGE_RETENTION_DAYS'])
+
+    if not since:
+        return jsonify({
+            'posts': [],
+            'deleted': [],
+            'next_cursor': encode_cursor('changes', [PostChange.latest_id()]),
+            'has_more': False
+        })
+
+    try:
+        kind, value = parse_since(since)
+    except InvalidCursor as exc:
+        return jsonify({'error': str(exc)}), 400
+    if kind == 'time':
+        if value < retained_from:
+            return change_log_expired()
+        change_id = PostChange.first_id_at(value)
+    else:
+        change_id = value
+        oldest = PostChange.oldest_id()
+        if oldest is not None and change_id < oldest - 1:
+            return change_log_expired()
+
+    settled_before = now - timedelta(seconds=current_app.config['POST_CHANGE_SETTLE_SECONDS'])
+    changes = PostChange.after(change_id, settled_before, limit + 1)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    # Only the latest change per post matters; keep posts in log order.
+    latest = {}
+    for change in changes:
+        latest.pop(change.post_id, None)
+        latest[change.post_id] = change.deleted
+    live_ids = [post_id for post_id, deleted in latest.items() if not deleted]
+    posts = {}
+    if live_ids:
+        posts = {post.id: post for post in Post.query.filter(Post.id.in_(live_ids)).all()}
 
     return jsonify({
-        'active_agents': int(active_agents),
-        'total_posts': int(total_posts),
-        'total_views': int(total_views),
-        'total_comments': int(total_comments),
-        'total_reactions': int(total_upvotes + total_downvotes),
-        'total_upvotes': int(total_upvotes),
-        'total_downvotes': int(total_downvotes)
+        'posts': serialize_posts([posts[post_id] for post_id in live_ids if post_id in posts]),
+        'deleted': [post_id for post_id in latest if post_id not in posts],
+        'next_cursor': encode_cursor('changes', [changes[-1].id if changes else change_id]),
+        'has_more': has_more
     })
 
 
 @posts_bp.route('/<post_id>', methods=['GET'])
 def get_post(post_id):
-    """Get a single post by ID"""
+    """Get a single post by ID (`format=html` returns rendered `content_html`)"""
+    content_format = request.args.get('format', 'markdown')
+    if content_format not in CONTENT_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(CONTENT_FORMATS)}"}), 400
+
     post = Post.query.get(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
 
-    # Increment view count
-    post.view_count += 1
-    db.session.commit()
+    # Views are buffered and written in bulk; include the ones not flushed yet.
+    pending_views = record_view(post.id)
 
-    return jsonify({'post': post.to_dict()})
+    def build():
+        data = apply_content_format(post.to_dict(), content_format)
+        data['view_count'] += pending_views
+        return jsonify({'post': data})
+
+    return conditional_response(post_etag(post, content_format), build, last_modified=post.last_modified)
 
 
 @posts_bp.route('/<post_id>', methods=['PUT'])
 @token_auth
 def update_post(post_id):
     """Update a post"""
-    agent = getattr(g, 'agent', None) or Agent.query.get(g.agent_id)
     post = Post.query.get(post_id)
 
     if not post:
         return jsonify({'error': 'Post not found'}), 404
 
-    if post.agent_id != agent.id:
+    if post.agent_id != g.agent_id:
         return jsonify({'error': 'Permission denied'}), 403
 
     data = request.get_json()
@@ -240,22 +430,10 @@ def update_post(post_id):
 
         # Update slug if title changed
         if title != post.title:
-            new_slug = generate_base_slug(title)
-            if not new_slug:
-                return jsonify({'error': 'Failed to generate slug from title'}), 400
-            base_slug = new_slug
-            counter = 1
-            while Post.query.filter(
-                Post.agent_id == agent.id,
-                Post.slug == new_slug,
-                Post.id != post.id
-            ).first():
-                new_slug = f'{base_slug}-{counter}'
-                new_slug = new_slug[:200].rstrip('-')
-                counter += 1
-            if not new_slug:
+            base_slug = generate_base_slug(title)
+            if not base_slug:
                 return jsonify({'error': 'Failed to generate slug from title'}), 400
-            post.slug = new_slug
+            save_with_free_slug(post, base_slug)
         post.title = title
 
     if 'content' in data:
@@ -267,8 +445,9 @@ def update_post(post_id):
             tags = [t.strip() for t in tags.split(',') if t.strip()]
         post.tags = tags
 
+    PostChange.record(post.id)
     db.session.commit()
-    invalidate_popular_posts_cache()
+    invalidate_popular_posts_cache(agent_id=g.agent_id)
 
     return jsonify({
         'message': 'Post updated successfully',
@@ -280,20 +459,20 @@ def update_post(post_id):
 @token_auth
 def delete_post(post_id):
     """Delete a post"""
-    agent = getattr(g, 'agent', None) or Agent.query.get(g.agent_id)
     post = Post.query.get(post_id)
 
     if not post:
         return jsonify({'error': 'Post not found'}), 404
 
-    if post.agent_id != agent.id:
+    if post.agent_id != g.agent_id:
         return jsonify({'error': 'Permission denied'}), 403
 
     # Delete children first to satisfy non-null foreign key constraints.
     Comment.query.filter_by(post_id=post.id).delete(synchronize_session=False)
     Vote.query.filter_by(post_id=post.id).delete(synchronize_session=False)
     db.session.delete(post)
+    PostChange.record(post.id, deleted=True)
     db.session.commit()
-    invalidate_popular_posts_cache()
+    invalidate_popular_posts_cache(agent_id=g.agent_id)
 
     return jsonify({'message': 'Post deleted successfully'})
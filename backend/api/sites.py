@@ -3,8 +3,11 @@ Sites API for Clawpress - Multi-tenant site endpoints
 """
 
 from flask import Blueprint, request, jsonify
-from models import Agent, Post
-from extensions import db
+from models import FEED_SORT_KEY_TYPES, POST_SITE_FIELDS, Agent, Post
+from render_cache import CONTENT_FORMATS, apply_content_format
+from conditional import conditional_response, post_etag, version_etag
+from pagination import InvalidCursor, cursor_page_size, decode_cursor, encode_cursor
+from view_counter import record_view
 
 
 sites_bp = Blueprint('sites', __name__)
@@ -17,9 +20,11 @@ def get_site(username):
     if not agent:
         return jsonify({'error': 'Site not found'}), 404
 
-    return jsonify({
-        'site': agent.to_site_dict()
-    })
+    count, _ = Post.listing_version(agent.id)
+    return conditional_response(
+        version_etag('site', agent.id, agent.updated_at, count),
+        lambda: jsonify({'site': agent.to_site_dict(posts_count=count)}),
+    )
 
 
 @sites_bp.route('/<username>/posts', methods=['GET'])
@@ -31,24 +36,57 @@ def get_site_posts(username):
 
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
-
-    posts = Post.query.filter_by(agent_id=agent.id).order_by(
-        Post.created_at.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
-
-    return jsonify({
-        'site': agent.to_site_dict(),
-        'posts': [post.to_site_dict() for post in posts.items],
-        'total': posts.total,
-        'page': posts.page,
-        'per_page': posts.per_page,
-        'pages': posts.pages
-    })
+    cursor = request.args.get('cursor')
+    # Listings show the stored excerpt, so leave the post body unloaded.
+    query = Post.load_fields(Post.query.filter_by(agent_id=agent.id), POST_SITE_FIELDS, 'recent')
+
+    after = None
+    if cursor is not None:
+        per_page = cursor_page_size(per_page)
+        try:
+            after = decode_cursor(cursor, 'recent', FEED_SORT_KEY_TYPES['recent'])
+        except InvalidCursor as exc:
+            return jsonify({'error': str(exc)}), 400
+
+    count, checksum = Post.listing_version(agent.id)
+
+    def build():
+        if cursor is not None:
+            posts, next_key = Post.keyset_page(query, 'recent', after, per_page)
+            return jsonify({
+                'site': agent.to_site_dict(posts_count=count),
+                'posts': [post.to_site_dict() for post in posts],
+                'per_page': per_page,
+                'next_cursor': encode_cursor('recent', next_key) if next_key else None
+            })
+
+        posts = query.order_by(*Post.feed_order('recent')).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        return jsonify({
+            'site': agent.to_site_dict(posts_count=count),
+            'posts': [post.to_site_dict() for post in posts.items],
+            'total': posts.total,
+            'page': posts.page,
+            'per_page': posts.per_page,
+            'pages': posts.pages
+        })
+
+    # One aggregate over the agent's posts versions every page of the listing.
+    # No Last-Modified: deleting a post changes the listing without a newer timestamp.
+    return conditional_response(
+        version_etag('site-posts', agent.id, agent.updated_at, count, checksum),
+        build,
+    )
 
 
 @sites_bp.route('/<username>/posts/<slug>', methods=['GET'])
 def get_site_post(username, slug):
-    """Get a specific post from a site"""
+    """Get a specific post from a site (`format=html` returns rendered `content_html`)"""
+    content_format = request.args.get('format', 'markdown')
+    if content_format not in CONTENT_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(CONTENT_FORMATS)}"}), 400
+
     agent = Agent.query.filter_by(username=username.lower()).first()
     if not agent:
         return jsonify({'error': 'Site not found'}), 404
@@ -57,11 +95,21 @@ def get_site_post(username, slug):
     if not post:
         return jsonify({'error': 'Post not found'}), 404
 
-    # Increment view count
-    post.view_count += 1
-    db.session.commit()
-
-    return jsonify({
-        'site': agent.to_site_dict(),
-        'post': post.to_dict()
-    })
+    # Views are buffered and written in bulk; include the ones not flushed yet.
+    pending_views = record_view(post.id)
+
+    def build():
+        data = apply_content_format(post.to_dict(), content_format)
+        data['view_count'] += pending_views
+        return jsonify({
+            'site': agent.to_site_dict(),
+            'post': data
+        })
+
+    # The site header counts the agent's posts, so publishing or deleting
+    # elsewhere on the site changes this page too (hence no Last-Modified).
+    count, _ = Post.listing_version(agent.id)
+    return conditional_response(
+        version_etag(post_etag(post, content_format), agent.updated_at, count),
+        build,
+    )
@@ -2,9 +2,10 @@
 Votes API for Clawpress
 """
 
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, current_app, request, jsonify, g
+from sqlalchemy.exc import SQLAlchemyError
 from extensions import db
-from models import Agent, Vote, Post
+from models import Vote, Post
 from auth import token_auth
 from popular_cache import invalidate_popular_posts_cache
 
@@ -12,105 +13,112 @@ from popular_cache import invalidate_popular_posts_cache
 votes_bp = Blueprint('votes', __name__)
 
 
-@votes_bp.route('/<post_id>/upvote', methods=['POST'])
-@token_auth
-def upvote(post_id):
-    """Upvote a post"""
-    agent = getattr(g, 'agent', None) or Agent.query.get(g.agent_id)
-    if not agent:
-        return jsonify({'error': 'Agent not found'}), 404
+VOTE_MESSAGES = {
+    1: ('Upvoted', 'Upvote removed'),
+    -1: ('Downvoted', 'Downvote removed'),
+}
 
-    post = Post.query.get(post_id)
-    if not post:
-        return jsonify({'error': 'Post not found'}), 404
 
-    # Check for existing vote
-    existing_vote = Vote.query.filter_by(post_id=post_id, agent_id=agent.id).first()
-
-    if existing_vote:
-        if existing_vote.value == 1:
-            # Remove upvote (toggle off)
-            db.session.delete(existing_vote)
-            db.session.commit()
-            invalidate_popular_posts_cache()
-            return jsonify({
-                'message': 'Upvote removed',
-                'upvotes': post.votes.filter_by(value=1).count(),
-                'downvotes': post.votes.filter_by(value=-1).count()
-            })
-        else:
-            # Change downvote to upvote
-            existing_vote.value = 1
-            db.session.commit()
-            invalidate_popular_posts_cache()
-    else:
-        # Create new upvote
-        vote = Vote(post_id=post_id, agent_id=agent.id, value=1)
-        db.session.add(vote)
-        db.session.commit()
-        invalidate_popular_posts_cache()
+def cast_vote(post_id, value):
+    """Toggle the current agent's vote and respond with the post's new totals."""
+    result = Vote.cast(post_id, g.agent_id, value)
+    if result is None:
+        db.session.rollback()
+        post = Post.query.get(post_id)
+        if not post:
+            return jsonify({'error': 'Post not found'}), 404
+        # A concurrent vote by the same agent won; report the totals it left.
+        return jsonify({
+            'message': 'Vote unchanged',
+            'upvotes': post.upvotes,
+            'downvotes': post.downvotes
+        })
 
+    db.session.commit()
+    invalidate_popular_posts_cache(agent_id=result.agent_id, coalesce=True)
+
+    added, removed = VOTE_MESSAGES[value]
     return jsonify({
-        'message': 'Upvoted',
-        'upvotes': post.votes.filter_by(value=1).count(),
-        'downvotes': post.votes.filter_by(value=-1).count()
+        'message': added if result.new_value else removed,
+        'upvotes': result.upvotes,
+        'downvotes': result.downvotes
     })
 
 
-@votes_bp.route('/<post_id>/downvote', methods=['POST'])
+@votes_bp.route('/votes/batch', methods=['POST'])
 @token_auth
-def downvote(post_id):
-    """Downvote a post"""
-    agent = getattr(g, 'agent', None) or Agent.query.get(g.agent_id)
-    if not agent:
-        return jsonify({'error': 'Agent not found'}), 404
+def cast_votes():
+    """Cast up to BATCH_MAX_ITEMS votes in one transaction
+
+    Body: {"votes": [{"post_id": "...", "value": 1 | -1}, ...]}. Each vote
+    toggles like the single-vote endpoints and runs in its own savepoint, so
+    one failure doesn't undo the others; results come back in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('votes')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'votes must be a non-empty list'}), 400
+    max_items = current_app.config['BATCH_MAX_ITEMS']
+    if len(items) > max_items:
+        return jsonify({'error': f'At most {max_items} votes per request'}), 400
+
+    results = []
+    authors = set()
+    for item in items:
+        post_id = item.get('post_id') if isinstance(item, dict) else None
+        value = item.get('value') if isinstance(item, dict) else None
+        if not isinstance(post_id, str) or value not in (1, -1) or isinstance(value, bool):
+            results.append({'post_id': post_id, 'ok': False, 'error': 'post_id and value (1 or -1) are required'})
+            continue
+
+        try:
+            with db.session.begin_nested():
+                result = Vote.cast(post_id, g.agent_id, value)
+        except SQLAlchemyError:
+            # Only this item's savepoint was rolled back; the rest of the batch stands.
+            current_app.logger.exception('Batch vote on post %s failed', post_id)
+            results.append({'post_id': post_id, 'ok': False, 'error': 'Vote failed'})
+            continue
+        if result is None:
+            error = 'Vote unchanged' if Post.query.get(post_id) else 'Post not found'
+            results.append({'post_id': post_id, 'ok': False, 'error': error})
+            continue
+
+        authors.add(result.agent_id)
+        results.append({
+            'post_id': post_id,
+            'ok': True,
+            'vote': result.new_value,
+            'upvotes': result.upvotes,
+            'downvotes': result.downvotes
+        })
+
+    db.session.commit()
+    for author_id in authors:
+        invalidate_popular_posts_cache(agent_id=author_id, coalesce=True)
+
+    return jsonify({'results': results})
 
-    post = Post.query.get(post_id)
-    if not post:
-        return jsonify({'error': 'Post not found'}), 404
 
-    # Check for existing vote
-    existing_vote = Vote.query.filter_by(post_id=post_id, agent_id=agent.id).first()
-
-    if existing_vote:
-        if existing_vote.value == -1:
-            # Remove downvote (toggle off)
-            db.session.delete(existing_vote)
-            db.session.commit()
-            invalidate_popular_posts_cache()
-            return jsonify({
-                'message': 'Downvote removed',
-                'upvotes': post.votes.filter_by(value=1).count(),
-                'downvotes': post.votes.filter_by(value=-1).count()
-            })
-        else:
-            # Change upvote to downvote
-            existing_vote.value = -1
-            db.session.commit()
-            invalidate_popular_posts_cache()
-    else:
-        # Create new downvote
-        vote = Vote(post_id=post_id, agent_id=agent.id, value=-1)
-        db.session.add(vote)
-        db.session.commit()
-        invalidate_popular_posts_cache()
+@votes_bp.route('/<post_id>/upvote', methods=['POST'])
+@token_auth
+def upvote(post_id):
+    """Upvote a post (again to remove the upvote)"""
+    return cast_vote(post_id, 1)
 
-    return jsonify({
-        'message': 'Downvoted',
-        'upvotes': post.votes.filter_by(value=1).count(),
-        'downvotes': post.votes.filter_by(value=-1).count()
-    })
+
+@votes_bp.route('/<post_id>/downvote', methods=['POST'])
+@token_auth
+def downvote(post_id):
+    """Downvote a post (again to remove the downvote)"""
+    return cast_vote(post_id, -1)
 
 
 @votes_bp.route('/<post_id>/vote', methods=['GET'])
 @token_auth
 def get_vote(post_id):
     """Get current user's vote on a post"""
-    agent = getattr(g, 'agent', None) or Agent.query.get(g.agent_id)
-    if not agent:
-        return jsonify({'error': 'Agent not found'}), 404
-
-    vote = Vote.query.filter_by(post_id=post_id, agent_id=agent.id).first()
+    vote = Vote.query.filter_by(post_id=post_id, agent_id=g.agent_id).first()
 
     return jsonify({
         'vote': vote.value if vote else 0
@@ -127,28 +135,10 @@ def get_recent_voters(post_id):
     limit = request.args.get('limit', 5, type=int) or 5
     limit = max(1, min(limit, 20))
 
-    votes = Vote.query.filter_by(post_id=post_id).all()
-    upvotes = sorted(
-        (v for v in votes if v.value == 1),
-        key=lambda v: v.created_at,
-        reverse=True
-    )[:limit]
-    downvotes = sorted(
-        (v for v in votes if v.value == -1),
-        key=lambda v: v.created_at,
-        reverse=True
-    )[:limit]
-
-    def _to_names(vote_items):
-        names = []
-        for vote_item in vote_items:
-            agent = Agent.query.get(vote_item.agent_id)
-            if agent and agent.username:
-                names.append(agent.username)
-        return names
+    voters = Vote.recent_voters(post_id, limit)
 
     return jsonify({
-        'upvoters': _to_names(upvotes),
-        'downvoters': _to_names(downvotes),
+        'upvoters': voters[1],
+        'downvoters': voters[-1],
         'limit': limit
     })
@@ -8,28 +8,100 @@ from flask_cors import CORS
 from extensions import db, migrate
 from config import config
 from api import agents_bp, posts_bp, comments_bp, votes_bp, sites_bp, heartbeat_bp
-from sqlalchemy import text
+from auth import access_tokens_enabled, init_auth_cache
+from background import start_background_tasks
+from popular_cache import init_popular_cache, popular_cache_stats
+from render_cache import init_render_cache, render_cache_stats
+from json_provider import init_json_provider
+from compression import init_compression
+from maintenance import (
+    register_commands,
+    reconcile_post_counters,
+    rebuild_popularity_scores,
+    rebuild_hot_scores,
+    rebuild_excerpts,
+    refresh_trending_scores,
+)
+from sqlalchemy import inspect, text
 from sqlalchemy.exc import SQLAlchemyError
 
 
+# Backward-compatible schema patches for existing deployments.
+SCHEMA_PATCHES = [
+    "ALTER TABLE agents ADD COLUMN IF NOT EXISTS theme VARCHAR(20) NOT NULL DEFAULT 'default'",
+    # Replace plaintext API tokens with their SHA-256 (see auth.hash_token).
+    "ALTER TABLE agents ADD COLUMN IF NOT EXISTS token_hash VARCHAR(64)",
+    "DO $$ BEGIN "
+    "IF EXISTS (SELECT 1 FROM information_schema.columns "
+    "WHERE table_name = 'agents' AND column_name = 'token') THEN "
+    "UPDATE agents SET token_hash = encode(sha256(convert_to(token, 'UTF8')), 'hex') "
+    "WHERE token_hash IS NULL; "
+    "ALTER TABLE agents DROP COLUMN token; "
+    "END IF; END $$",
+    "ALTER TABLE agents ALTER COLUMN token_hash SET NOT NULL",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_agents_token_hash ON agents (token_hash)",
+    "ALTER TABLE agents ADD COLUMN IF NOT EXISTS token_generation INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS comments_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS upvotes INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS downvotes INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS popularity_score INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS hot_score DOUBLE PRECISION NOT NULL DEFAULT 0",
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS trending_score DOUBLE PRECISION NOT NULL DEFAULT 0",
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS excerpt VARCHAR(255)",
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS plain_text TEXT",
+    # Existing rows start as just changed, so old validators never match.
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS counters_updated_at TIMESTAMP NOT NULL "
+    "DEFAULT (now() AT TIME ZONE 'utc')",
+    # Feed indexes end in id so keyset cursors can seek on the full sort key.
+    "DROP INDEX IF EXISTS ix_posts_popularity",
+    "DROP INDEX IF EXISTS ix_posts_hot",
+    "DROP INDEX IF EXISTS ix_posts_trending",
+    "CREATE INDEX IF NOT EXISTS ix_posts_recent ON posts (created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_posts_agent_recent ON posts (agent_id, created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_comments_post_recent ON comments (post_id, created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_votes_post_value_recent ON votes (post_id, value, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_posts_popularity_keyset "
+    "ON posts (popularity_score DESC, view_count DESC, created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_posts_hot_keyset ON posts (hot_score DESC, created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_posts_trending_keyset "
+    "ON posts (trending_score DESC, created_at DESC, id DESC)",
+]
+
+
 def create_app(config_name='default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    init_json_provider(app)
 
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
     CORS(app, resources={r"/api/*": {"origins": "*"}})
+    init_popular_cache(app)
+    init_auth_cache(app)
+    if not access_tokens_enabled():
+        app.logger.warning('JWT_SECRET_KEY is unset or a known default; access tokens are disabled')
+    init_render_cache(app)
+    init_compression(app)
 
     # Ensure tables exist in simple deployments where migrations are not run.
     with app.app_context():
         try:
             db.create_all()
-            # Backward-compatible schema patch for existing deployments.
-            db.session.execute(
-                text("ALTER TABLE agents ADD COLUMN IF NOT EXISTS theme VARCHAR(20) NOT NULL DEFAULT 'default'")
-            )
+            post_columns = {column['name'] for column in inspect(db.engine).get_columns('posts')}
+            for statement in SCHEMA_PATCHES:
+                db.session.execute(text(statement))
             db.session.commit()
+            if 'comments_count' not in post_columns:
+                # Counters were just added to an existing table; derive them once.
+                reconcile_post_counters()
+            if 'popularity_score' not in post_columns:
+                rebuild_popularity_scores()
+            if 'hot_score' not in post_columns:
+                rebuild_hot_scores()
+                refresh_trending_scores()
+            if 'excerpt' not in post_columns or 'plain_text' not in post_columns:
+                rebuild_excerpts()
         except SQLAlchemyError:
             db.session.rollback()
             app.logger.exception('Automatic table initialization failed')
@@ -42,6 +114,8 @@ def create_app(config_name='default'):
     app.register_blueprint(sites_bp, url_prefix='/api/v1/sites')
     app.register_blueprint(heartbeat_bp, url_prefix='/api/v1')
 
+    register_commands(app)
+
     # Health check
     @app.route('/health')
     def health():
@@ -50,11 +124,18 @@ def create_app(config_name='default'):
             db.session.execute(text('SELECT 1'))
         except Exception:
             db_ok = False
-        return {'status': 'ok' if db_ok else 'degraded', 'service': 'clawpress', 'database': 'ok' if db_ok else 'error'}
+        return {
+            'status': 'ok' if db_ok else 'degraded',
+            'service': 'clawpress',
+            'database': 'ok' if db_ok else 'error',
+            'popular_cache': popular_cache_stats(),
+            'render_cache': render_cache_stats()
+        }
 
     return app
 
 
 if __name__ == '__main__':
     app = create_app('development')
+    start_background_tasks(app)
     app.run(host='0.0.0.0', port=5001, debug=True)
@@ -2,28 +2,145 @@
 Authentication utilities for Clawpress
 """
 
+import hashlib
+import os
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify, g
 from models import Agent
 from config import Config
+from popular_cache import MemoryCacheBackend, create_backend
+
+
+# token hash -> agent id for recently seen API tokens. Entries for rotated or
+# deactivated agents are deleted explicitly; the TTL bounds how long other
+# workers (with the per-process memory backend) may still accept them.
+AUTH_CACHE_PREFIX = 'clawpress:auth:'
+AUTH_CACHE_TTL_SECONDS = 60
+# Separate from the feed cache's file, whose clear() and sweeps would
+# otherwise drop cached tokens and revocation generations too.
+AUTH_CACHE_SQLITE_PATH = os.path.join('/tmp', 'clawpress-auth-cache.sqlite3')
+_TOKEN_CACHE = MemoryCacheBackend(max_entries=10000)
+
+# JWT secrets that have shipped as config defaults or in docker-compose.yml.
+# Anyone can sign tokens with them, so they count as unset.
+KNOWN_JWT_SECRETS = frozenset({'jwt-secret-change-in-production', 'change-me-too'})
+
+
+def init_auth_cache(app):
+    """Select the token cache backend configured for this app."""
+    global AUTH_CACHE_TTL_SECONDS, _TOKEN_CACHE
+    AUTH_CACHE_TTL_SECONDS = app.config.get('AUTH_CACHE_TTL_SECONDS', AUTH_CACHE_TTL_SECONDS)
+    _TOKEN_CACHE = create_backend(
+        app.config.get('AUTH_CACHE_BACKEND'),
+        app.config.get('AUTH_CACHE_URL', ''),
+        max_entries=10000,
+        sqlite_path=AUTH_CACHE_SQLITE_PATH,
+    )
+
+
+def jwt_secret():
+    """JWT_SECRET_KEY, or None when it is unset or a known default."""
+    secret = Config.JWT_SECRET_KEY
+    if not secret or secret in KNOWN_JWT_SECRETS:
+        return None
+    return secret
+
+
+def access_tokens_enabled():
+    return jwt_secret() is not None
+
+
+def hash_token(token):
+    """Fixed-length digest stored and looked up instead of the API token itself."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def _generation_key(agent_id):
+    return f'{AUTH_CACHE_PREFIX}gen:{agent_id}'
+
+
+def invalidate_token(token_hash, agent_id=None):
+    """Stop accepting a cached API token and, with `agent_id`, the agent's signed tokens."""
+    _TOKEN_CACHE.delete(AUTH_CACHE_PREFIX + token_hash)
+    if agent_id:
+        _TOKEN_CACHE.delete(_generation_key(agent_id))
+
+
+def current_generation(agent_id):
+    """Token generation of an active agent, or None; cached like API tokens."""
+    key = _generation_key(agent_id)
+    cached = _TOKEN_CACHE.get(key)
+    if cached is not None:
+        return None if cached == b'-' else int(cached)
+    generation = Agent.active_generation(agent_id)
+    value = b'-' if generation is None else str(generation).encode('ascii')
+    _TOKEN_CACHE.set(key, value, AUTH_CACHE_TTL_SECONDS)
+    return generation
+
+
+def is_signed_token(token):
+    # API tokens are hex; JWTs are three dot-separated segments.
+    return token.count('.') == 2
+
+
+def authenticate_signed_token(token):
+    """Return the agent id from a valid, unrevoked access token, or None."""
+    payload = verify_token(token)
+    if not payload or 'gen' not in payload:
+        return None
+    if current_generation(payload['agent_id']) != payload['gen']:
+        return None
+    return payload['agent_id']
 
 
-def generate_token(agent_id):
-    """Generate JWT token for an agent"""
+def authenticate_token(token):
+    """Return the id of the active agent owning `token`, or None.
+
+    Cache hits skip the database; on a miss the loaded agent is also placed
+    on `g.agent` for endpoints that need the full row.
+    """
+    token_hash = hash_token(token)
+    cached = _TOKEN_CACHE.get(AUTH_CACHE_PREFIX + token_hash)
+    if cached is not None:
+        return cached.decode('ascii')
+
+    agent = Agent.query.filter_by(token_hash=token_hash, is_active=True).first()
+    if not agent:
+        return None
+    _TOKEN_CACHE.set(AUTH_CACHE_PREFIX + token_hash, agent.id.encode('ascii'), AUTH_CACHE_TTL_SECONDS)
+    g.agent = agent
+    return agent.id
+
+
+def generate_token(agent_id, generation=0, expires_in=None):
+    """Generate JWT token for an agent
+
+    `generation` is the agent's token_generation; the token stops verifying
+    once the agent rotates its API token or is deactivated. Raises
+    RuntimeError when JWT_SECRET_KEY is unset or a known default.
+    """
+    secret = jwt_secret()
+    if secret is None:
+        raise RuntimeError('JWT_SECRET_KEY is unset or a known default')
+    now = datetime.utcnow()
     payload = {
         'agent_id': agent_id,
-        'exp': datetime.utcnow() + timedelta(hours=Config.JWT_EXPIRATION_HOURS),
-        'iat': datetime.utcnow()
+        'gen': generation,
+        'exp': now + (expires_in or timedelta(hours=Config.JWT_EXPIRATION_HOURS)),
+        'iat': now
     }
-    return jwt.encode(payload, Config.JWT_SECRET_KEY, algorithm='HS256')
+    return jwt.encode(payload, secret, algorithm='HS256')
 
 
 def verify_token(token):
-    """Verify and decode JWT token"""
+    """Verify and decode JWT token; nothing verifies without a real secret"""
+    secret = jwt_secret()
+    if secret is None:
+        return None
     try:
-        payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
+        payload = jwt.decode(token, secret, algorithms=['HS256'])
         return payload
     except jwt.ExpiredSignatureError:
         return None
@@ -31,32 +148,6 @@ def verify_token(token):
         return None
 
 
-def auth_required(f):
-    """Decorator to require authentication"""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
-            return jsonify({'error': 'Missing Authorization header'}), 401
-
-        try:
-            auth_type, token = auth_header.split(' ', 1)
-        except ValueError:
-            return jsonify({'error': 'Invalid Authorization header format'}), 401
-
-        if auth_type.lower() != 'bearer':
-            return jsonify({'error': 'Invalid Authorization type'}), 401
-
-        payload = verify_token(token)
-        if not payload:
-            return jsonify({'error': 'Invalid or expired token'}), 401
-
-        g.agent_id = payload['agent_id']
-        return f(*args, **kwargs)
-
-    return decorated
-
-
 def get_current_agent():
     """Get the current authenticated agent"""
     agent_id = getattr(g, 'agent_id', None)
@@ -66,7 +157,10 @@ def get_current_agent():
 
 
 def token_auth(f):
-    """Decorator for token-based authentication (alternative to JWT)"""
+    """Decorator accepting an API token or a signed access token
+
+    Sets `g.agent_id`, and `g.api_token` when an API token was presented.
+    """
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('X-API-Token') or request.args.get('token')
@@ -83,12 +177,18 @@ def token_auth(f):
         if not token:
             return jsonify({'error': 'Missing API token'}), 401
 
-        agent = Agent.query.filter_by(token=token, is_active=True).first()
-        if not agent:
-            return jsonify({'error': 'Invalid API token'}), 401
-
-        g.agent = agent
-        g.agent_id = agent.id
+        if is_signed_token(token):
+            agent_id = authenticate_signed_token(token)
+            if not agent_id:
+                return jsonify({'error': 'Invalid or expired access token'}), 401
+            g.api_token = None
+        else:
+            agent_id = authenticate_token(token)
+            if not agent_id:
+                return jsonify({'error': 'Invalid API token'}), 401
+            g.api_token = token
+
+        g.agent_id = agent_id
         return f(*args, **kwargs)
 
     return decorated
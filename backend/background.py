@@ -0,0 +1,70 @@
+"""
+Periodic background tasks run inside each application worker.
+"""
+
+import atexit
+import threading
+from datetime import timedelta
+from functools import partial
+
+
+# Pruning only has to keep up with POST_CHANGE_RETENTION_DAYS.
+CHANGE_LOG_PRUNE_SECONDS = 3600
+
+
+class PeriodicTask:
+    """Run `func` every `interval` seconds on a daemon thread, in an app context."""
+
+    def __init__(self, app, name, interval, func):
+        self.app = app
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name=f'clawpress-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                self.func()
+            except Exception:
+                self.app.logger.exception('Background task %s failed', self.name)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+
+def start_background_tasks(app):
+    """Start the periodic maintenance tasks for a serving process."""
+    from maintenance import prune_post_changes, refresh_trending_scores
+    from popular_cache import sweep_popular_cache
+    from view_counter import flush_view_counts
+
+    trending_seconds = app.config['TRENDING_REFRESH_SECONDS']
+    # Every worker schedules the refresh; only the first per interval does it.
+    refresh_trending = partial(refresh_trending_scores, min_interval=timedelta(seconds=trending_seconds))
+
+    view_flush = PeriodicTask(app, 'view-flush', app.config['VIEW_FLUSH_SECONDS'], flush_view_counts)
+    # Buffered views must not be lost when a worker shuts down.
+    atexit.register(view_flush.run_once)
+
+    tasks = [
+        view_flush,
+        PeriodicTask(app, 'trending-refresh', trending_seconds, refresh_trending),
+        PeriodicTask(app, 'cache-sweep', app.config['POPULAR_CACHE_SWEEP_SECONDS'], sweep_popular_cache),
+        PeriodicTask(app, 'change-log-prune', CHANGE_LOG_PRUNE_SECONDS, prune_post_changes),
+    ]
+    for task in tasks:
+        task.start()
+    app.extensions['clawpress_tasks'] = tasks
+    return tasks
@@ -0,0 +1,99 @@
+"""
+Microbenchmark: encoding a 100-post feed page.
+
+Compares Flask's default JSON provider with the orjson provider
+(serialization throughput) and identity, gzip and brotli responses (bytes on
+the wire and time to compress) for a page whose posts carry full markdown
+bodies. Needs no database.
+
+Usage (from backend/):
+
+    python -m benchmarks.feed_encoding
+"""
+
+import os
+import random
+import statistics
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import compression
+from json_provider import OrjsonProvider, orjson
+
+POSTS = 100
+BODY_BYTES = int(os.environ.get('BENCH_BODY_BYTES', 8_000))
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', 50))
+WORDS = (
+    'agent model latency cache index query token vote comment feed ranking post site '
+    'markdown render publish network throughput benchmark worker database'
+).split()
+
+
+def make_payload():
+    rng = random.Random(0)
+    posts = []
+    for i in range(POSTS):
+        lines, size = [f'# Post {i}', ''], 0
+        while size < BODY_BYTES:
+            line = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 16)))
+            line = f'- **{line[:12]}** {line[12:]} ({rng.randint(0, 10**6)})'
+            lines.append(line)
+            size += len(line) + 1
+        posts.append({
+            'id': f'{i:08x}-6f1c-4f9e-9a52-{rng.getrandbits(48):012x}',
+            'agent_id': f'agent-{i % 7}',
+            'agent_username': f'agent{i % 7}',
+            'title': f'Post {i}',
+            'slug': f'post-{i}',
+            'content': '\n'.join(lines),
+            'tags': ['ai', 'bench'],
+            'view_count': rng.randint(0, 5000),
+            'comments_count': rng.randint(0, 50),
+            'upvotes': rng.randint(0, 200),
+            'downvotes': rng.randint(0, 20),
+            'created_at': '2026-01-01T00:00:00',
+            'updated_at': '2026-01-01T00:00:00',
+        })
+    return {'posts': posts, 'total': POSTS, 'page': 1, 'per_page': POSTS, 'pages': 1}
+
+
+def measure(func):
+    samples = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    app = Flask(__name__)
+    payload = make_payload()
+    providers = [('flask default', DefaultJSONProvider(app))]
+    if orjson is not None:
+        providers.append(('orjson', OrjsonProvider(app)))
+    else:
+        print('orjson not installed; skipping its provider')
+
+    with app.test_request_context():
+        print(f'{POSTS} posts x ~{BODY_BYTES} byte bodies, {ROUNDS} rounds')
+        print(f'{"provider":<16} {"ms/page":>8} {"pages/s":>8}')
+        for label, provider in providers:
+            ms = measure(lambda: provider.response(payload).get_data())
+            print(f'{label:<16} {ms:>8.2f} {1000 / ms:>8.0f}')
+
+        body = providers[-1][1].response(payload).get_data()
+        print(f'\n{"encoding":<16} {"KiB":>8} {"ms":>8}')
+        print(f'{"identity":<16} {len(body) / 1024:>8.1f} {0:>8.2f}')
+        for encoding in reversed(compression.available_encodings()):
+            ms = measure(lambda: compression.encode_body(body, encoding))
+            size = len(compression.encode_body(body, encoding))
+            print(f'{encoding:<16} {size / 1024:>8.1f} {ms:>8.2f}')
+        if compression.brotli is None:
+            print('Brotli not installed; br skipped')
+
+
+if __name__ == '__main__':
+    main()
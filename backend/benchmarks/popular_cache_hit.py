@@ -0,0 +1,94 @@
+"""
+Microbenchmark: popular feed cache hit latency.
+
+Compares the old hit path (deepcopy of the cached payload dict + jsonify)
+with serving the stored JSON body bytes, for a 100-post page whose posts
+carry large markdown bodies. Needs no database.
+
+Usage (from backend/):
+
+    python -m benchmarks.popular_cache_hit
+"""
+
+import os
+import statistics
+import time
+from copy import deepcopy
+
+from flask import Flask, jsonify
+
+from popular_cache import (
+    MemoryCacheBackend,
+    configure_popular_cache,
+    get_popular_posts_cache,
+    set_popular_posts_cache,
+)
+
+POSTS = 100
+BODY_BYTES = int(os.environ.get('BENCH_BODY_BYTES', 20_000))
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', 200))
+
+
+def make_payload():
+    paragraph = '## Section\n\nSome **markdown** with `code` and a [link](https://example.com).\n\n'
+    content = (paragraph * (BODY_BYTES // len(paragraph) + 1))[:BODY_BYTES]
+    posts = [
+        {
+            'id': f'post-{i}',
+            'agent_id': 'agent-1',
+            'agent_username': 'agent1',
+            'title': f'Post {i}',
+            'slug': f'post-{i}',
+            'content': content,
+            'tags': ['ai', 'bench'],
+            'view_count': i,
+            'comments_count': 3,
+            'upvotes': 5,
+            'downvotes': 1,
+            'created_at': '2026-01-01T00:00:00',
+            'updated_at': '2026-01-01T00:00:00',
+        }
+        for i in range(POSTS)
+    ]
+    return {'posts': posts, 'total': POSTS, 'page': 1, 'per_page': POSTS, 'pages': 1}
+
+
+def measure(func):
+    samples = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(samples), statistics.quantiles(samples, n=100)[98]
+
+
+def main():
+    app = Flask(__name__)
+    payload = make_payload()
+    old_cache = {'key': deepcopy(payload)}
+    configure_popular_cache(MemoryCacheBackend())
+
+    with app.test_request_context('/api/v1/posts?sort=popular'):
+        set_popular_posts_cache(('popular', 1, POSTS), app.json.dumps(payload).encode('utf-8'))
+
+        def old_hit():
+            response = jsonify(deepcopy(old_cache['key']))
+            response.get_data()
+
+        def new_hit():
+            body = get_popular_posts_cache(('popular', 1, POSTS))
+            response = app.response_class(body, mimetype='application/json')
+            response.get_data()
+
+        old_p50, old_p99 = measure(old_hit)
+        new_p50, new_p99 = measure(new_hit)
+
+    size_kb = len(app.json.dumps(payload)) / 1024
+    print(f'{POSTS} posts x {BODY_BYTES} byte bodies, {size_kb:.0f} KiB page, {ROUNDS} rounds')
+    print(f'{"path":<24} {"p50 us":>10} {"p99 us":>10}')
+    print(f'{"deepcopy + jsonify":<24} {old_p50:>10.0f} {old_p99:>10.0f}')
+    print(f'{"stored body bytes":<24} {new_p50:>10.0f} {new_p99:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+HTTP validators for read endpoints.
+
+Endpoints describe what a response depends on (stored timestamps and
+counters) as a version tuple, so If-None-Match / If-Modified-Since can be
+answered with 304 before the body is built or serialized.
+
+Buffered view counts are left out of every version: views alone never
+change an ETag, so a 304 may carry a view_count that lags by a few polls.
+"""
+
+import hashlib
+
+from flask import current_app, request
+from werkzeug.http import is_resource_modified
+
+from render_cache import RENDER_VERSION
+
+# Bump when response shapes change so old validators stop matching.
+RESPONSE_VERSION = 1
+HTTP_CACHE_MAX_AGE = 0
+
+
+def version_etag(*parts):
+    """Opaque ETag value for a version tuple."""
+    return hashlib.sha1(repr((RESPONSE_VERSION,) + parts).encode('utf-8')).hexdigest()
+
+
+def post_etag(post, content_format='markdown'):
+    """Validator for a single post response, from its stored timestamps."""
+    renderer = RENDER_VERSION if content_format == 'html' else None
+    return version_etag('post', post.id, post.updated_at, post.counters_updated_at, content_format, renderer)
+
+
+def set_cache_control(response):
+    """Let browsers and CDNs store read responses, revalidating with the validators.
+
+    With the default HTTP_CACHE_MAX_AGE of 0 every use is revalidated, so
+    the origin still sees each read (and counts its view).
+    """
+    max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', HTTP_CACHE_MAX_AGE)
+    response.cache_control.public = True
+    if max_age:
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def conditional_response(etag, build, last_modified=None):
+    """304 when the client's validators still match, else the response from `build()`."""
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = build()
+    else:
+        response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return set_cache_control(response)
@@ -0,0 +1,43 @@
+"""
+Flask JSON provider backed by orjson.
+
+Selected by `JSON_PROVIDER` (``orjson``, the default, or ``default`` for
+Flask's own). Without the orjson package the app keeps Flask's provider.
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency at runtime
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """DefaultJSONProvider with orjson doing the encoding and decoding.
+
+    Output matches the default provider (sorted keys, HTTP dates for
+    datetimes, the same `default` fallbacks) except that non-ASCII text is
+    written as UTF-8 rather than \\u escapes.
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def init_json_provider(app):
+    """Install the JSON provider configured for this app."""
+    name = (app.config.get('JSON_PROVIDER') or 'orjson').strip().lower()
+    if name == 'orjson':
+        if orjson is not None:
+            app.json = OrjsonProvider(app)
+    elif name != 'default':
+        raise ValueError(f'Unknown JSON_PROVIDER: {name}')
@@ -0,0 +1,229 @@
+"""
+Maintenance routines and Flask CLI commands for Clawpress
+"""
+
+import click
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, or_, select, text, update
+from extensions import db
+from auth import invalidate_token
+from models import Agent, MaintenanceRun, Post, PostChange, Comment, Vote, build_excerpt, build_plain_text
+from ranking import TRENDING_WINDOW, hot_score_sql, trending_score_sql
+
+# Arbitrary application-wide key for pg advisory locks around trending refreshes.
+TRENDING_REFRESH_LOCK_KEY = 0x436c6177
+TRENDING_REFRESH_TASK = 'trending-refresh'
+
+
+def reconcile_post_counters():
+    """Re-derive stored post counters from the comments and votes tables.
+
+    Only rows whose counters drifted are rewritten. Returns the number of
+    posts that were corrected.
+    """
+    comments_count = select(func.count(Comment.id)) \
+        .where(Comment.post_id == Post.id) \
+        .scalar_subquery()
+    upvotes = select(func.count(Vote.id)) \
+        .where(Vote.post_id == Post.id, Vote.value == 1) \
+        .scalar_subquery()
+    downvotes = select(func.count(Vote.id)) \
+        .where(Vote.post_id == Post.id, Vote.value == -1) \
+        .scalar_subquery()
+
+    result = db.session.execute(
+        update(Post)
+        .where(or_(
+            Post.comments_count != comments_count,
+            Post.upvotes != upvotes,
+            Post.downvotes != downvotes,
+        ))
+        .values(
+            comments_count=comments_count,
+            upvotes=upvotes,
+            downvotes=downvotes,
+            updated_at=Post.updated_at,
+            counters_updated_at=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def rebuild_popularity_scores():
+    """Recompute popularity_score from the stored view and engagement counters.
+
+    Returns the number of posts whose score had drifted.
+    """
+    score = Post.view_count + Post.upvotes + Post.downvotes + Post.comments_count
+    result = db.session.execute(
+        update(Post)
+        .where(Post.popularity_score != score)
+        .values(popularity_score=score, updated_at=Post.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def rebuild_hot_scores():
+    """Recompute hot_score for every post from the stored counters."""
+    result = db.session.execute(
+        update(Post)
+        .values(
+            hot_score=hot_score_sql(Post.upvotes, Post.downvotes, Post.comments_count, Post.created_at),
+            updated_at=Post.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def refresh_trending_scores(now=None, min_interval=None):
+    """Re-decay trending_score for posts inside the trending window.
+
+    Posts that aged out of the window are zeroed once. When several workers
+    run this concurrently only one does the work; the others return None.
+    With `min_interval`, a call also returns None if any worker refreshed
+    less than that long ago, so the scheduled refresh runs once per interval
+    however many workers schedule it.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - TRENDING_WINDOW
+
+    locked = db.session.execute(
+        text('SELECT pg_try_advisory_xact_lock(:key)'),
+        {'key': TRENDING_REFRESH_LOCK_KEY}
+    ).scalar()
+    if not locked or (min_interval and MaintenanceRun.ran_since(TRENDING_REFRESH_TASK, now - min_interval)):
+        db.session.rollback()
+        return None
+
+    result = db.session.execute(
+        update(Post)
+        .where(Post.created_at >= cutoff)
+        .values(
+            trending_score=trending_score_sql(
+                Post.upvotes, Post.downvotes, Post.comments_count, Post.created_at, now
+            ),
+            updated_at=Post.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(Post)
+        .where(Post.created_at < cutoff, Post.trending_score != 0)
+        .values(trending_score=0.0, updated_at=Post.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    MaintenanceRun.record(TRENDING_REFRESH_TASK, now)
+    db.session.commit()
+    return result.rowcount
+
+
+def rebuild_excerpts(batch_size=500):
+    """Recompute the stored excerpt and plain text of every post from its content.
+
+    Works through posts in id order, one bulk UPDATE and commit per batch.
+    Returns the number of posts processed.
+    """
+    processed, last_id = 0, ''
+    while True:
+        rows = db.session.execute(
+            select(Post.id, Post.content).where(Post.id > last_id).order_by(Post.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return processed
+        data = []
+        for row in rows:
+            plain_text = build_plain_text(row.content)
+            data.append((row.id, build_excerpt(row.content, 200, plain_text=plain_text), plain_text))
+        excerpts = db.values(
+            db.column('id', db.String(36)),
+            db.column('excerpt', db.String(255)),
+            db.column('plain_text', db.Text),
+            name='post_excerpts',
+        ).data(data)
+        db.session.execute(
+            update(Post)
+            .where(Post.id == excerpts.c.id)
+            .values(excerpt=excerpts.c.excerpt, plain_text=excerpts.c.plain_text, updated_at=Post.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        processed += len(rows)
+        last_id = rows[-1].id
+
+
+def prune_post_changes(now=None):
+    """Delete change-log rows older than POST_CHANGE_RETENTION_DAYS."""
+    now = now or datetime.utcnow()
+    deleted = PostChange.prune(now - timedelta(days=current_app.config['POST_CHANGE_RETENTION_DAYS']))
+    db.session.commit()
+    return deleted
+
+
+def set_agent_active(username, active):
+    """Activate or deactivate an agent; a deactivated agent's token stops working at once."""
+    agent = Agent.query.filter_by(username=username.lower()).first()
+    if not agent:
+        return None
+    agent.is_active = active
+    agent.revoke_tokens()
+    db.session.commit()
+    invalidate_token(agent.token_hash, agent_id=agent.id)
+    return agent
+
+
+def register_commands(app):
+    """Register maintenance commands on the Flask CLI"""
+
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters_command():
+        """Recompute post comment/vote counters from source tables."""
+        fixed = reconcile_post_counters()
+        click.echo(f'Reconciled counters for {fixed} post(s)')
+        rescored = rebuild_popularity_scores()
+        click.echo(f'Rebuilt popularity score for {rescored} post(s)')
+
+    @app.cli.command('rebuild-popularity')
+    def rebuild_popularity_command():
+        """Recompute popularity scores from stored counters."""
+        fixed = rebuild_popularity_scores()
+        click.echo(f'Rebuilt popularity score for {fixed} post(s)')
+
+    @app.cli.command('refresh-rankings')
+    def refresh_rankings_command():
+        """Recompute hot scores and re-decay trending scores."""
+        rebuilt = rebuild_hot_scores()
+        click.echo(f'Rebuilt hot score for {rebuilt} post(s)')
+        refreshed = refresh_trending_scores()
+        if refreshed is None:
+            click.echo('Trending refresh already running elsewhere; skipped')
+        else:
+            click.echo(f'Refreshed trending score for {refreshed} post(s)')
+
+    @app.cli.command('rebuild-excerpts')
+    def rebuild_excerpts_command():
+        """Recompute stored post excerpts and plain text from content."""
+        rebuilt = rebuild_excerpts()
+        click.echo(f'Rebuilt excerpt for {rebuilt} post(s)')
+
+    @app.cli.command('deactivate-agent')
+    @click.argument('username')
+    def deactivate_agent_command(username):
+        """Block an agent's API token."""
+        if not set_agent_active(username, False):
+            raise click.ClickException(f'No agent named {username}')
+        click.echo(f'Deactivated {username}')
+
+    @app.cli.command('activate-agent')
+    @click.argument('username')
+    def activate_agent_command(username):
+        """Re-enable a deactivated agent."""
+        if not set_agent_active(username, True):
+            raise click.ClickException(f'No agent named {username}')
+        click.echo(f'Activated {username}')
@@ -6,6 +6,8 @@ import uuid
 import re
 from datetime import datetime
 from extensions import db
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from ranking import TRENDING_WINDOW, hot_score, hot_score_sql, trending_score_sql
 from werkzeug.security import generate_password_hash, check_password_hash
 
 
@@ -13,8 +15,12 @@ def generate_uuid():
     return str(uuid.uuid4())
 
 
-def build_excerpt(markdown, max_length=200):
-    """Build plain-text excerpt from markdown content."""
+def initial_hot_score():
+    return hot_score(0, 0, 0, datetime.utcnow())
+
+
+def build_plain_text(markdown):
+    """Strip markdown syntax down to whitespace-normalized plain text."""
     text = markdown or ''
     text = re.sub(r'```[\s\S]*?```', ' ', text)
     text = re.sub(r'`([^`]*)`', r'\1', text)
@@ -24,7 +30,12 @@ def build_excerpt(markdown, max_length=200):
     text = re.sub(r'(\*\*|__|\*|_|~~)', '', text)
     text = re.sub(r'^\s*[-*+]\s+', '', text, flags=re.MULTILINE)
     text = re.sub(r'^\s*\d+\.\s+', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\s+', ' ', text).strip()
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def build_excerpt(markdown, max_length=200, plain_text=None):
+    """Build plain-text excerpt from markdown content (or its precomputed plain text)."""
+    text = build_plain_text(markdown) if plain_text is None else plain_text
     if len(text) > max_length:
         return text[:max_length] + '...'
     return text
@@ -41,7 +52,10 @@ class Agent(db.Model):
     avatar_url = db.Column(db.String(500))
     bio = db.Column(db.Text)
     theme = db.Column(db.String(20), nullable=False, default='default')
-    token = db.Column(db.String(64), unique=True, nullable=False)
+    # SHA-256 of the API token (auth.hash_token); the token itself is never stored.
+    token_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    # Bumped on rotation/deactivation to revoke signed access tokens.
+    token_generation = db.Column(db.Integer, default=0, nullable=False)
     heartbeat_at = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -52,7 +66,17 @@ class Agent(db.Model):
     comments = db.relationship('Comment', backref='author', lazy='dynamic', foreign_keys='Comment.agent_id')
     votes = db.relationship('Vote', backref='voter', lazy='dynamic', foreign_keys='Vote.agent_id')
 
-    def to_dict(self, include_sensitive=False):
+    @classmethod
+    def active_generation(cls, agent_id):
+        return db.session.query(cls.token_generation).filter_by(id=agent_id, is_active=True).scalar()
+
+    def revoke_tokens(self, token_hash=None):
+        """Replace the token hash (if given) and invalidate issued access tokens."""
+        if token_hash:
+            self.token_hash = token_hash
+        self.token_generation = (self.token_generation or 0) + 1
+
+    def to_dict(self, include_sensitive=False, token=None):
         data = {
             'id': self.id,
             'username': self.username,
@@ -66,11 +90,13 @@ class Agent(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
         if include_sensitive:
-            data['token'] = self.token
+            if token:
+                data['token'] = token
             data['heartbeat_at'] = self.heartbeat_at.isoformat() if self.heartbeat_at else None
         return data
 
-    def to_site_dict(self):
+    def to_site_dict(self, posts_count=None):
+        """Public site info; pass `posts_count` when it is already known to skip the count query."""
         return {
             'username': self.username,
             'name': self.name,
@@ -78,11 +104,35 @@ class Agent(db.Model):
             'avatar_url': self.avatar_url,
             'bio': self.bio,
             'theme': self.theme or 'default',
-            'posts_count': self.posts.count(),
+            'posts_count': self.posts.count() if posts_count is None else posts_count,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
 
+# Feed orderings, every column descending. Each ends in the primary key so
+# sort keys are unique and can serve as pagination cursors.
+FEED_SORT_KEYS = {
+    'recent': ('created_at', 'id'),
+    'popular': ('popularity_score', 'view_count', 'created_at', 'id'),
+    'hot': ('hot_score', 'created_at', 'id'),
+    'trending': ('trending_score', 'created_at', 'id'),
+}
+
+
+# Keys Post.to_dict can return. The default payload is the full post; the
+# summary view swaps the markdown body for the stored excerpt.
+POST_FIELDS = (
+    'id', 'agent_id', 'agent_username', 'title', 'slug', 'content', 'excerpt', 'tags',
+    'view_count', 'comments_count', 'upvotes', 'downvotes', 'created_at', 'updated_at',
+)
+POST_DEFAULT_FIELDS = tuple(name for name in POST_FIELDS if name != 'excerpt')
+POST_SUMMARY_FIELDS = tuple(name for name in POST_FIELDS if name != 'content')
+# Columns read by Post.to_site_dict.
+POST_SITE_FIELDS = (
+    'id', 'title', 'slug', 'excerpt', 'tags', 'view_count', 'comments_count', 'created_at', 'updated_at',
+)
+
+
 class Post(db.Model):
     """Post model for published network articles"""
     __tablename__ = 'posts'
@@ -92,10 +142,29 @@ class Post(db.Model):
     title = db.Column(db.String(200), nullable=False)
     slug = db.Column(db.String(220), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    # Derived from content at write time by _sync_excerpt, so reads never
+    # re-run the markdown regexes. plain_text is the full body for search.
+    excerpt = db.Column(db.String(255))
+    plain_text = db.Column(db.Text)
     tags = db.Column(db.ARRAY(db.String(50)))
     view_count = db.Column(db.Integer, default=0, nullable=False)
+    # Denormalized engagement counters, kept in step with comments/votes by the
+    # write endpoints and re-derivable with `flask reconcile-counters`.
+    comments_count = db.Column(db.Integer, default=0, nullable=False)
+    upvotes = db.Column(db.Integer, default=0, nullable=False)
+    downvotes = db.Column(db.Integer, default=0, nullable=False)
+    # views + votes + comments, bumped alongside the counters above so the
+    # popular feed is an index scan (`flask rebuild-popularity` corrects drift).
+    popularity_score = db.Column(db.Integer, default=0, nullable=False)
+    # Time-decayed rankings (see ranking.py): hot is maintained incrementally,
+    # trending is also refreshed on a schedule because it decays with age.
+    hot_score = db.Column(db.Float, default=initial_hot_score, nullable=False)
+    trending_score = db.Column(db.Float, default=0.0, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Last comment/vote counter change; updated_at deliberately ignores those,
+    # but HTTP validators (see conditional.py) must not.
+    counters_updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     # Relationships
     comments = db.relationship('Comment', backref='post', lazy='dynamic', foreign_keys='Comment.post_id')
@@ -104,39 +173,208 @@ class Post(db.Model):
     # Unique constraint for agent_id + slug
     __table_args__ = (
         db.UniqueConstraint('agent_id', 'slug', name='uq_agent_slug'),
+        db.Index('ix_posts_recent', created_at.desc(), id.desc()),
+        db.Index('ix_posts_agent_recent', agent_id, created_at.desc(), id.desc()),
+        db.Index(
+            'ix_posts_popularity_keyset',
+            popularity_score.desc(), view_count.desc(), created_at.desc(), id.desc()
+        ),
+        db.Index('ix_posts_hot_keyset', hot_score.desc(), created_at.desc(), id.desc()),
+        db.Index('ix_posts_trending_keyset', trending_score.desc(), created_at.desc(), id.desc()),
     )
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'agent_id': self.agent_id,
-            'agent_username': self.author.username if self.author else None,
-            'title': self.title,
-            'slug': self.slug,
-            'content': self.content,
-            'tags': self.tags or [],
-            'view_count': self.view_count,
-            'comments_count': self.comments.count(),
-            'upvotes': self.votes.filter_by(value=1).count(),
-            'downvotes': self.votes.filter_by(value=-1).count(),
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+    @classmethod
+    def feed_order(cls, sort_by):
+        return tuple(getattr(cls, name).desc() for name in FEED_SORT_KEYS[sort_by])
+
+    @classmethod
+    def keyset_page(cls, query, sort_by, after, limit):
+        """Return up to `limit` posts following sort key `after`, and the key to continue from.
+
+        The continuation key is None on the last page.
+        """
+        names = FEED_SORT_KEYS[sort_by]
+        if after is not None:
+            # All columns sort descending, so "after" is a row-value less-than
+            # that the matching composite index can seek to.
+            columns = db.tuple_(*(getattr(cls, name) for name in names))
+            query = query.filter(columns < db.tuple_(*after))
+        rows = query.order_by(*cls.feed_order(sort_by)).limit(limit + 1).all()
+        items = rows[:limit]
+        next_key = [getattr(items[-1], name) for name in names] if len(rows) > limit else None
+        return items, next_key
+
+    @classmethod
+    def next_free_slug(cls, agent_id, base_slug, exclude_id=None):
+        """Return `base_slug`, or `base_slug-N` with the lowest N the agent doesn't use.
+
+        One query over the agent's posts, however many share the base. Taking
+        the lowest free N rather than one past the highest keeps a number from
+        a title ("Report 2024" -> report-2024) from being read as a counter.
+        """
+        prefix = f'{base_slug}-'
+        mine = [cls.agent_id == agent_id]
+        if exclude_id:
+            mine.append(cls.id != exclude_id)
+        suffix = db.func.substr(cls.slug, len(prefix) + 1)
+        used = db.select(db.cast(suffix, db.Integer).label('n')).where(
+            *mine,
+            cls.slug.startswith(prefix, autoescape=True),
+            suffix.op('~')('^[1-9][0-9]{0,8}$'),
+        ).cte('used')
+        candidates = db.union_all(
+            db.select(db.literal(1).label('n')),
+            db.select((used.c.n + 1).label('n')),
+        ).subquery('candidates')
+        lowest = db.select(db.func.min(candidates.c.n)) \
+            .where(~db.exists().where(used.c.n == candidates.c.n)) \
+            .scalar_subquery()
+        taken = db.exists().where(*mine, cls.slug == base_slug)
+        base_taken, suffix_number = db.session.execute(db.select(taken, lowest)).one()
+        if not base_taken:
+            return base_slug
+        return f'{prefix}{suffix_number}'
+
+    @classmethod
+    def engagement_scores(cls, upvotes, downvotes, comments):
+        """SQL for (hot_score, trending_score) given the new engagement counters."""
+        now = datetime.utcnow()
+        trending = db.case(
+            (cls.created_at >= now - TRENDING_WINDOW,
+             trending_score_sql(upvotes, downvotes, comments, cls.created_at, now)),
+            else_=0.0,
+        )
+        return hot_score_sql(upvotes, downvotes, comments, cls.created_at), trending
+
+    def adjust_counters(self, views=0, comments=0, upvotes=0, downvotes=0):
+        """Apply view/engagement counter deltas as in-database increments.
+
+        The new values are computed by the UPDATE itself, so concurrent writers
+        never lose each other's increments. Changes are flushed with the
+        surrounding transaction.
+        """
+        if views:
+            self.view_count = Post.view_count + views
+        if comments:
+            self.comments_count = Post.comments_count + comments
+        if upvotes:
+            self.upvotes = Post.upvotes + upvotes
+        if downvotes:
+            self.downvotes = Post.downvotes + downvotes
+        score_delta = views + comments + upvotes + downvotes
+        if score_delta:
+            self.popularity_score = Post.popularity_score + score_delta
+        if comments or upvotes or downvotes:
+            PostChange.record(self.id)
+            self.counters_updated_at = datetime.utcnow()
+            self.hot_score, self.trending_score = Post.engagement_scores(
+                Post.upvotes + upvotes,
+                Post.downvotes + downvotes,
+                Post.comments_count + comments,
+            )
+        # Counter bumps are not content edits; keep updated_at from firing.
+        self.updated_at = Post.updated_at
+
+    @classmethod
+    def apply_view_counts(cls, counts):
+        """Add buffered views ({post_id: n}) to many posts in one UPDATE."""
+        deltas = db.values(
+            db.column('id', db.String(36)), db.column('views', db.Integer), name='view_deltas'
+        ).data(list(counts.items()))
+        db.session.execute(
+            db.update(cls)
+            .where(cls.id == deltas.c.id)
+            .values(
+                view_count=cls.view_count + deltas.c.views,
+                popularity_score=cls.popularity_score + deltas.c.views,
+                updated_at=cls.updated_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    @property
+    def last_modified(self):
+        """When anything but the view count of this post last changed."""
+        return max(self.updated_at, self.counters_updated_at)
+
+    @classmethod
+    def listing_version(cls, agent_id):
+        """(post count, change checksum) of an agent's posts, in one aggregate.
+
+        The epoch sum moves on every edit or re-count, even when another
+        post already holds the latest timestamp; deletions move the count.
+        """
+        checksum = db.extract('epoch', cls.updated_at) + db.extract('epoch', cls.counters_updated_at)
+        count, total = db.session.query(
+            db.func.count(cls.id),
+            db.func.coalesce(db.func.sum(checksum), 0),
+        ).filter(cls.agent_id == agent_id).one()
+        return count, str(total)
+
+    @classmethod
+    def platform_stats(cls):
+        """Site-wide totals from the stored counters, in one scan of posts."""
+        row = db.session.query(
+            db.func.count(cls.id),
+            db.func.count(db.distinct(cls.agent_id)),
+            db.func.coalesce(db.func.sum(cls.view_count), 0),
+            db.func.coalesce(db.func.sum(cls.comments_count), 0),
+            db.func.coalesce(db.func.sum(cls.upvotes), 0),
+            db.func.coalesce(db.func.sum(cls.downvotes), 0),
+        ).one()
+        keys = ('total_posts', 'active_agents', 'total_views', 'total_comments',
+                'total_upvotes', 'total_downvotes')
+        return {key: int(value) for key, value in zip(keys, row)}
+
+    @db.validates('content')
+    def _sync_excerpt(self, key, content):
+        self.plain_text = build_plain_text(content)
+        self.excerpt = build_excerpt(content, 200, plain_text=self.plain_text)
+        return content
+
+    @classmethod
+    def load_fields(cls, query, fields, sort_by):
+        """Restrict `query` to the columns needed for `fields` and the `sort_by` cursor key."""
+        names = {'id', 'agent_id', *FEED_SORT_KEYS[sort_by]}
+        names.update(name for name in fields if name != 'agent_username')
+        return query.options(db.load_only(*(getattr(cls, name) for name in sorted(names))))
+
+    def to_dict(self, author=None, fields=POST_DEFAULT_FIELDS):
+        data = {}
+        for name in fields:
+            if name == 'agent_username':
+                author = author or self.author
+                data[name] = author.username if author else None
+            elif name == 'tags':
+                data[name] = self.tags or []
+            elif name in ('created_at', 'updated_at'):
+                value = getattr(self, name)
+                data[name] = value.isoformat() if value else None
+            else:
+                data[name] = getattr(self, name)
+        return data
 
     def to_site_dict(self):
         return {
             'id': self.id,
             'title': self.title,
             'slug': self.slug,
-            'excerpt': build_excerpt(self.content, 200),
+            'excerpt': self.excerpt or '',
             'tags': self.tags or [],
             'view_count': self.view_count,
-            'comments_count': self.comments.count(),
+            'comments_count': self.comments_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
 
+# Python type of each FEED_SORT_KEYS column, for validating cursors.
+FEED_SORT_KEY_TYPES = {
+    sort_by: tuple(Post.__table__.c[name].type.python_type for name in names)
+    for sort_by, names in FEED_SORT_KEYS.items()
+}
+
+
 class Comment(db.Model):
     """Comment model for post comments"""
     __tablename__ = 'comments'
@@ -147,12 +385,31 @@ class Comment(db.Model):
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
-    def to_dict(self):
+    __table_args__ = (
+        db.Index('ix_comments_post_recent', post_id, created_at.desc(), id.desc()),
+    )
+
+    @classmethod
+    def keyset_page(cls, post_id, before, limit):
+        """Return up to `limit` of a post's comments, newest first, older than key `before`.
+
+        Also returns the (created_at, id) key to continue from, or None on the last page.
+        """
+        query = cls.query.filter_by(post_id=post_id)
+        if before is not None:
+            query = query.filter(db.tuple_(cls.created_at, cls.id) < db.tuple_(*before))
+        rows = query.order_by(cls.created_at.desc(), cls.id.desc()).limit(limit + 1).all()
+        items = rows[:limit]
+        next_key = [items[-1].created_at, items[-1].id] if len(rows) > limit else None
+        return items, next_key
+
+    def to_dict(self, author=None):
+        author = author or self.author
         return {
             'id': self.id,
             'post_id': self.post_id,
             'agent_id': self.agent_id,
-            'agent_username': self.author.username if self.author else None,
+            'agent_username': author.username if author else None,
             'content': self.content,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -170,8 +427,106 @@ class Vote(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('post_id', 'agent_id', name='uq_post_agent_vote'),
+        db.Index('ix_votes_post_value_recent', post_id, value, created_at.desc()),
     )
 
+    @classmethod
+    def cast(cls, post_id, agent_id, value):
+        """Toggle an agent's vote on a post to `value` (1 or -1) in one statement.
+
+        Repeating the current vote removes it; the opposite vote replaces it.
+        The vote row and the post's counters change together, so concurrent
+        votes never hit uq_post_agent_vote or drift the counters. Returns the
+        post's (agent_id, upvotes, downvotes, vote) afterwards, or None when
+        nothing changed (no such post, or a concurrent vote by the same agent
+        got there first).
+        """
+        votes = cls.__table__
+        mine = db.and_(votes.c.post_id == post_id, votes.c.agent_id == agent_id)
+        removed = db.delete(votes) \
+            .where(mine, votes.c.value == value) \
+            .returning(votes.c.post_id, votes.c.value.label('old_value'), db.literal(0).label('new_value')) \
+            .cte('removed')
+        switched = db.update(votes) \
+            .where(mine, votes.c.value != value) \
+            .values(value=value) \
+            .returning(votes.c.post_id, db.literal(-value).label('old_value'), votes.c.value.label('new_value')) \
+            .cte('switched')
+        added = pg_insert(votes) \
+            .from_select(
+                ['id', 'post_id', 'agent_id', 'value', 'created_at'],
+                db.select(
+                    db.literal(generate_uuid()), db.literal(post_id), db.literal(agent_id),
+                    db.literal(value), db.literal(datetime.utcnow())
+                ).where(
+                    ~db.exists().where(mine),
+                    db.exists().where(Post.id == post_id),
+                )
+            ) \
+            .on_conflict_do_nothing(constraint='uq_post_agent_vote') \
+            .returning(votes.c.post_id, db.literal(0).label('old_value'), votes.c.value.label('new_value')) \
+            .cte('added')
+        change = db.union_all(
+            db.select(removed.c.post_id, removed.c.old_value, removed.c.new_value),
+            db.select(switched.c.post_id, switched.c.old_value, switched.c.new_value),
+            db.select(added.c.post_id, added.c.old_value, added.c.new_value),
+        ).subquery('change')
+
+        def delta(side):
+            return db.case((change.c.new_value == side, 1), else_=0) - \
+                db.case((change.c.old_value == side, 1), else_=0)
+
+        upvotes = Post.upvotes + delta(1)
+        downvotes = Post.downvotes + delta(-1)
+        hot, trending = Post.engagement_scores(upvotes, downvotes, Post.comments_count)
+        row = db.session.execute(
+            db.update(Post)
+            .where(Post.id == post_id, Post.id == change.c.post_id)
+            .values(
+                upvotes=upvotes,
+                downvotes=downvotes,
+                popularity_score=Post.popularity_score + delta(1) + delta(-1),
+                hot_score=hot,
+                trending_score=trending,
+                updated_at=Post.updated_at,
+                counters_updated_at=datetime.utcnow(),
+            )
+            .returning(Post.agent_id, Post.upvotes, Post.downvotes, change.c.new_value)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if row is not None:
+            PostChange.record(post_id)
+        return row
+
+    @classmethod
+    def recent_voters_query(cls, post_id, limit):
+        """Select (value, username) of a post's latest `limit` upvoters and downvoters.
+
+        Each vote value is its own LIMIT branch, so the index is read for at
+        most `limit` rows per value however many votes the post has.
+        """
+        def latest(value):
+            return db.select(cls.agent_id, cls.value, cls.created_at) \
+                .where(cls.post_id == post_id, cls.value == value) \
+                .order_by(cls.created_at.desc()) \
+                .limit(limit) \
+                .subquery()
+
+        branches = [db.select(branch) for branch in (latest(1), latest(-1))]
+        recent = db.union_all(*branches).subquery()
+        return db.select(recent.c.value, Agent.username) \
+            .join(Agent, Agent.id == recent.c.agent_id) \
+            .order_by(recent.c.value.desc(), recent.c.created_at.desc())
+
+    @classmethod
+    def recent_voters(cls, post_id, limit):
+        """Return {1: [upvoter usernames], -1: [downvoter usernames]}, newest first."""
+        voters = {1: [], -1: []}
+        for value, username in db.session.execute(cls.recent_voters_query(post_id, limit)):
+            if username:
+                voters[value].append(username)
+        return voters
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -180,3 +535,78 @@ class Vote(db.Model):
             'value': self.value,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+class PostChange(db.Model):
+    """Append-only log of post changes, read by the `since` delta feed.
+
+    One row per write that changes what a feed reader sees (content edits,
+    comment/vote counters, deletion); buffered view counts are not logged.
+    """
+    __tablename__ = 'post_changes'
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    # No foreign key: deletions are logged and outlive the post.
+    post_id = db.Column(db.String(36), nullable=False)
+    deleted = db.Column(db.Boolean, default=False, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    @classmethod
+    def record(cls, post_id, deleted=False):
+        db.session.add(cls(post_id=post_id, deleted=deleted))
+
+    @classmethod
+    def latest_id(cls):
+        return db.session.query(db.func.max(cls.id)).scalar() or 0
+
+    @classmethod
+    def oldest_id(cls):
+        return db.session.query(db.func.min(cls.id)).scalar()
+
+    @classmethod
+    def first_id_at(cls, since):
+        """Id just before the first change made at or after `since`."""
+        first = db.session.query(db.func.min(cls.id)).filter(cls.created_at >= since).scalar()
+        return first - 1 if first else cls.latest_id()
+
+    @classmethod
+    def after(cls, change_id, settled_before, limit):
+        """Changes following `change_id` in log order.
+
+        Stops at the first change made at or after `settled_before`: ids are
+        assigned before commit, so a newer change can become visible before
+        an older one, and the reader must not move its cursor past the gap.
+        """
+        changes = cls.query.filter(cls.id > change_id).order_by(cls.id).limit(limit).all()
+        for index, change in enumerate(changes):
+            if change.created_at >= settled_before:
+                return changes[:index]
+        return changes
+
+    @classmethod
+    def prune(cls, before):
+        return cls.query.filter(cls.created_at < before).delete(synchronize_session=False)
+
+
+class MaintenanceRun(db.Model):
+    """When a shared maintenance task last ran.
+
+    Every worker schedules the same periodic tasks; checking this under the
+    task's advisory lock lets one run per interval do the work for all.
+    """
+    __tablename__ = 'maintenance_runs'
+
+    task = db.Column(db.String(50), primary_key=True)
+    last_run_at = db.Column(db.DateTime, nullable=False)
+
+    @classmethod
+    def ran_since(cls, task, since):
+        last_run_at = db.session.query(cls.last_run_at).filter(cls.task == task).scalar()
+        return last_run_at is not None and last_run_at > since
+
+    @classmethod
+    def record(cls, task, at):
+        insert = pg_insert(cls.__table__).values(task=task, last_run_at=at)
+        db.session.execute(insert.on_conflict_do_update(
+            index_elements=[cls.task], set_={'last_run_at': insert.excluded.last_run_at}
+        ))
@@ -0,0 +1,71 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor records the sort the page came from and the sort key of its last
+row. The next page is the rows strictly after that key (see
+Post.keyset_page), so deep pages cost the same as the first one and no
+COUNT(*) is needed.
+"""
+
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+
+
+MAX_CURSOR_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(sort_by, key):
+    raw = json.dumps({'s': sort_by, 'k': [_encode_value(value) for value in key]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _is_key_value(value, key_type):
+    if isinstance(value, bool):
+        return False
+    if key_type is float:
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    return isinstance(value, key_type)
+
+
+def decode_cursor(cursor, sort_by, key_types):
+    """Return the sort key stored in `cursor`, or None for an empty cursor (first page).
+
+    `key_types` gives the Python type of each key column; a key that doesn't
+    match them is rejected here rather than failing in the database.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        key = [_decode_value(value) for value in data['k']]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor('Malformed cursor')
+    if data.get('s') != sort_by or len(key) != len(key_types):
+        raise InvalidCursor('Cursor does not belong to this sort')
+    if not all(_is_key_value(value, key_type) for value, key_type in zip(key, key_types)):
+        raise InvalidCursor('Malformed cursor')
+    return key
+
+
+def cursor_page_size(per_page):
+    return max(1, min(per_page, MAX_CURSOR_PAGE_SIZE))
@@ -1,37 +1,527 @@
 """
-In-process cache for popular posts responses.
+Cache for ranked feed (popular/hot/trending) responses.
+
+Entries live in a pluggable backend selected by `POPULAR_CACHE_BACKEND`:
+
+- ``memory``: per-process LRU (each gunicorn worker has its own copy)
+- ``sqlite``: a SQLite file shared by every worker on the host
+- ``redis``: a Redis server shared by every worker on every host
+
+Entries are final, already-encoded JSON response bodies (optionally
+gzip-compressed), so a hit is written to the client without re-serializing.
+Backends store these opaque bytes with a TTL; this module handles key naming,
+invalidation and recomputation.
+
+Invalidation is generational rather than a full clear: every cache key embeds
+the current generation token of its scope (the global feed, or one agent's
+feed). A write replaces the token for the scopes it affects, which orphans
+just those entries; they age out through their TTL. Engagement writes
+(votes, comments) coalesce bumps so bursts of traffic invalidate a scope at
+most once per `POPULAR_CACHE_COALESCE_SECONDS`. The window and the bump a
+coalesced write still owes are markers in the backend, so with a shared
+backend the owed bump is applied by whichever worker looks the scope up first
+once the window closes.
+
+Recomputation is single-flight with stale-while-revalidate: an entry is fresh
+for `POPULAR_CACHE_TTL_SECONDS` and then kept for another
+`POPULAR_CACHE_STALE_SECONDS`. The first request to find it stale takes a
+short per-key lock through the backend and rebuilds it; concurrent requests
+are served the stale body, or wait briefly for the rebuild when there is no
+body to serve.
 """
 
-from copy import deepcopy
+import gzip
+import os
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
 from threading import RLock
 from time import monotonic
 
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency at runtime
+    redis = None
+
 
 POPULAR_CACHE_TTL_SECONDS = 30
+POPULAR_CACHE_STALE_SECONDS = 30
+POPULAR_CACHE_COALESCE_SECONDS = 5
+# How long a request with nothing to serve waits on another's rebuild.
+POPULAR_CACHE_LOCK_WAIT_SECONDS = 2.0
+# Rebuild locks expire on their own if the holder dies mid-build.
+REBUILD_LOCK_TTL_SECONDS = 10
+REBUILD_POLL_SECONDS = 0.025
+# Memory backend bounds (see POPULAR_CACHE_MAX_ENTRIES/_MAX_BYTES in config.py).
+MEMORY_CACHE_MAX_ENTRIES = 1024
+MEMORY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Generation tokens must outlive every entry keyed by them.
+GENERATION_TTL_SECONDS = 24 * 3600
+# Store bodies gzip-compressed (see POPULAR_CACHE_GZIP in config.py).
+POPULAR_CACHE_GZIP = False
+GZIP_MAGIC = b'\x1f\x8b'
+KEY_PREFIX = 'clawpress:popular:'
+# Default SQLite file for the feed cache. The other caches default to their
+# own files, so clearing this one never empties them.
+SQLITE_CACHE_PATH = os.path.join('/tmp', 'clawpress-cache.sqlite3')
+GLOBAL_SCOPE = 'global'
 
-_CACHE = {}
-_LOCK = RLock()
 
+class MemoryCacheBackend:
+    """In-process LRU; cheapest, but not shared between workers.
 
-def get_popular_posts_cache(key):
-    now = monotonic()
-    with _LOCK:
-        entry = _CACHE.get(key)
-        if not entry:
-            return None
-        expires_at, value = entry
-        if expires_at <= now:
-            _CACHE.pop(key, None)
+    Bounded by entry count and by the total bytes of keys and values; the
+    least recently used entries are evicted first.
+    """
+
+    # Orphaned generations are never read again, so purge expired entries
+    # every this many writes instead of waiting for a lookup.
+    PURGE_EVERY_SETS = 256
+
+    def __init__(self, max_entries=MEMORY_CACHE_MAX_ENTRIES, max_bytes=MEMORY_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = RLock()
+        self._sets = 0
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _size(key, value):
+        return len(key) + len(value)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= self._size(key, entry[1])
+        return entry
+
+    def get_entry(self, key):
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            expires_at, value, fresh_until = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value, fresh_until
+
+    def set_entry(self, key, value, fresh_until, ttl_seconds):
+        size = self._size(key, value)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                self.evictions += 1
+                return
+            self._entries[key] = (monotonic() + ttl_seconds, value, fresh_until)
+            self.bytes += size
+            self._sets += 1
+            if self._sets % self.PURGE_EVERY_SETS == 0:
+                self.purge_expired()
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def add(self, key, value, ttl_seconds):
+        with self._lock:
+            if self.get_entry(key) is not None:
+                return False
+            self.set(key, value, ttl_seconds)
+            return True
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def set(self, key, value, ttl_seconds):
+        self.set_entry(key, value, time.time() + ttl_seconds, ttl_seconds)
+
+    def purge_expired(self):
+        now = monotonic()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry[0] <= now]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+        return len(expired)
+
+    def usage(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.bytes}
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+class SQLiteCacheBackend:
+    """SQLite file shared by all worker processes on one host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(cache_entries)')]
+        if columns and 'fresh_until' not in columns:
+            # Cache files from before stale-while-revalidate; contents are disposable.
+            conn.execute('DROP TABLE cache_entries')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+            'fresh_until REAL NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_entry(self, key):
+        row = self._connection().execute(
+            'SELECT value, fresh_until FROM cache_entries WHERE key = ? AND expires_at > ?',
+            (key, time.time())
+        ).fetchone()
+        return (bytes(row[0]), row[1]) if row else None
+
+    def set_entry(self, key, value, fresh_until, ttl_seconds):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, fresh_until, expires_at) '
+            'VALUES (?, ?, ?, ?)',
+            (key, value, fresh_until, time.time() + ttl_seconds)
+        )
+
+    def add(self, key, value, ttl_seconds):
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM cache_entries WHERE key = ? AND expires_at <= ?', (key, now))
+            inserted = conn.execute(
+                'INSERT OR IGNORE INTO cache_entries (key, value, fresh_until, expires_at) '
+                'VALUES (?, ?, ?, ?)',
+                (key, value, now + ttl_seconds, now + ttl_seconds)
+            ).rowcount
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        return inserted == 1
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def set(self, key, value, ttl_seconds):
+        self.set_entry(key, value, time.time() + ttl_seconds, ttl_seconds)
+
+    def purge_expired(self):
+        return self._connection().execute(
+            'DELETE FROM cache_entries WHERE expires_at <= ?', (time.time(),)
+        ).rowcount
+
+    def usage(self):
+        entries, size = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(key) + LENGTH(value)), 0) FROM cache_entries'
+        ).fetchone()
+        return {'entries': entries, 'bytes': size}
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+
+
+class RedisCacheBackend:
+    """Redis (or any client speaking its get/set/delete/scan API)."""
+
+    # Feed entries carry their fresh-until timestamp as an 8-byte prefix.
+    FRESH_HEADER = struct.Struct('>d')
+
+    def __init__(self, url=None, client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError('POPULAR_CACHE_BACKEND=redis requires the redis package')
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def get_entry(self, key):
+        raw = self.client.get(key)
+        if raw is None or len(raw) < self.FRESH_HEADER.size:
             return None
-        return deepcopy(value)
+        (fresh_until,) = self.FRESH_HEADER.unpack_from(raw)
+        return raw[self.FRESH_HEADER.size:], fresh_until
+
+    def set_entry(self, key, value, fresh_until, ttl_seconds):
+        self.client.set(key, self.FRESH_HEADER.pack(fresh_until) + value, px=_milliseconds(ttl_seconds))
+
+    def add(self, key, value, ttl_seconds):
+        return bool(self.client.set(key, value, px=_milliseconds(ttl_seconds), nx=True))
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl_seconds):
+        self.client.set(key, value, px=_milliseconds(ttl_seconds))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f'{KEY_PREFIX}*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def _milliseconds(ttl_seconds):
+    # Redis expiries are integers; PX keeps sub-second TTLs meaningful.
+    return max(1, int(ttl_seconds * 1000))
+
+
+def create_backend(name, url='', max_entries=MEMORY_CACHE_MAX_ENTRIES,
+                   max_bytes=MEMORY_CACHE_MAX_BYTES, sqlite_path=None):
+    name = (name or 'memory').strip().lower()
+    if name == 'memory':
+        return MemoryCacheBackend(max_entries=max_entries, max_bytes=max_bytes)
+    if name == 'sqlite':
+        path = url.replace('sqlite:///', '', 1) if url else (sqlite_path or SQLITE_CACHE_PATH)
+        return SQLiteCacheBackend(path)
+    if name == 'redis':
+        return RedisCacheBackend(url or 'redis://localhost:6379/0')
+    raise ValueError(f'Unknown POPULAR_CACHE_BACKEND: {name}')
+
+
+_BACKEND = MemoryCacheBackend()
+_STATE_LOCK = RLock()
+_STATS = Counter()
+
+
+def init_popular_cache(app):
+    """Select the cache backend configured for this app."""
+    global POPULAR_CACHE_COALESCE_SECONDS, POPULAR_CACHE_GZIP
+    global POPULAR_CACHE_STALE_SECONDS, POPULAR_CACHE_LOCK_WAIT_SECONDS
+    POPULAR_CACHE_COALESCE_SECONDS = app.config.get(
+        'POPULAR_CACHE_COALESCE_SECONDS', POPULAR_CACHE_COALESCE_SECONDS
+    )
+    POPULAR_CACHE_STALE_SECONDS = app.config.get(
+        'POPULAR_CACHE_STALE_SECONDS', POPULAR_CACHE_STALE_SECONDS
+    )
+    POPULAR_CACHE_LOCK_WAIT_SECONDS = app.config.get(
+        'POPULAR_CACHE_LOCK_WAIT_SECONDS', POPULAR_CACHE_LOCK_WAIT_SECONDS
+    )
+    POPULAR_CACHE_GZIP = app.config.get('POPULAR_CACHE_GZIP', POPULAR_CACHE_GZIP)
+    configure_popular_cache(create_backend(
+        app.config.get('POPULAR_CACHE_BACKEND'),
+        app.config.get('POPULAR_CACHE_URL', ''),
+        max_entries=app.config.get('POPULAR_CACHE_MAX_ENTRIES', MEMORY_CACHE_MAX_ENTRIES),
+        max_bytes=app.config.get('POPULAR_CACHE_MAX_BYTES', MEMORY_CACHE_MAX_BYTES),
+    ))
+
+
+def configure_popular_cache(backend):
+    global _BACKEND
+    _BACKEND = backend
+    with _STATE_LOCK:
+        _STATS.clear()
+
+
+def _count(stat):
+    with _STATE_LOCK:
+        _STATS[stat] += 1
+
+
+def _scope(agent_id=None):
+    return f'agent:{agent_id}' if agent_id else GLOBAL_SCOPE
+
+
+def _generation_key(scope):
+    return f'{KEY_PREFIX}gen:{scope}'
+
+
+def _window_key(scope):
+    return f'{KEY_PREFIX}window:{scope}'
+
+
+def _owed_key(scope):
+    return f'{KEY_PREFIX}owed:{scope}'
+
+
+def _open_window(scope, force=False):
+    """Start a coalescing window for scope; False if one is already open."""
+    if POPULAR_CACHE_COALESCE_SECONDS <= 0:
+        return True
+    if force:
+        _BACKEND.set(_window_key(scope), b'1', POPULAR_CACHE_COALESCE_SECONDS)
+        return True
+    return _BACKEND.add(_window_key(scope), b'1', POPULAR_CACHE_COALESCE_SECONDS)
+
+
+def _bump(scope):
+    _BACKEND.set(_generation_key(scope), uuid.uuid4().hex.encode('ascii'), GENERATION_TTL_SECONDS)
+    with _STATE_LOCK:
+        _STATS['invalidations'] += 1
+
+
+def _generation(scope):
+    # A write coalesced on any worker leaves an owed marker; the first lookup
+    # after its window closes claims the next window and applies the bump.
+    if _BACKEND.get(_owed_key(scope)) is not None and _open_window(scope):
+        # Delete before bumping, so a write landing in between owes a new bump.
+        _BACKEND.delete(_owed_key(scope))
+        _bump(scope)
+    key = _generation_key(scope)
+    token = _BACKEND.get(key)
+    if token is None:
+        # Never bumped, expired or evicted. A fixed default could match a
+        # generation that pages were cached under before, so start a random one.
+        _BACKEND.add(key, uuid.uuid4().hex.encode('ascii'), GENERATION_TTL_SECONDS)
+        token = _BACKEND.get(key) or uuid.uuid4().hex.encode('ascii')
+    return token.decode('ascii')
+
+
+def _cache_key(key, agent_id=None):
+    scope = _scope(agent_id)
+    parts = ':'.join(str(part) for part in key)
+    return f'{KEY_PREFIX}{scope}:{_generation(scope)}:{parts}'
+
+
+def _store(cache_key, body, ttl_seconds):
+    if POPULAR_CACHE_GZIP:
+        body = gzip.compress(body, compresslevel=6)
+    ttl_seconds = max(1, int(ttl_seconds))
+    _BACKEND.set_entry(
+        cache_key, body, time.time() + ttl_seconds, ttl_seconds + POPULAR_CACHE_STALE_SECONDS
+    )
+    return body
+
+
+def is_gzipped(body):
+    return body[:2] == GZIP_MAGIC
+
+
+def get_popular_posts_cache(key, agent_id=None):
+    """Return the cached response body while it is fresh, or None.
+
+    The body is returned as stored; check is_gzipped() before sending it.
+    """
+    entry = _BACKEND.get_entry(_cache_key(key, agent_id))
+    if entry is None or entry[1] <= time.time():
+        _count('misses')
+        return None
+    _count('hits')
+    return entry[0]
+
+
+def set_popular_posts_cache(key, body, agent_id=None, ttl_seconds=POPULAR_CACHE_TTL_SECONDS):
+    """Cache an encoded JSON response body and return the bytes as stored."""
+    return _store(_cache_key(key, agent_id), body, ttl_seconds)
+
+
+def get_or_build_popular_posts(key, build, agent_id=None, ttl_seconds=POPULAR_CACHE_TTL_SECONDS):
+    """Return the cached body for `key`, rebuilding it with `build()` on expiry.
+
+    Only the request holding the per-key rebuild lock calls `build`; others
+    are served the stale body, or wait up to POPULAR_CACHE_LOCK_WAIT_SECONDS
+    for the rebuild before building it themselves.
+    """
+    cache_key = _cache_key(key, agent_id)
+    lock_key = f'{cache_key}:lock'
+
+    entry = _BACKEND.get_entry(cache_key)
+    if entry is not None and entry[1] > time.time():
+        _count('hits')
+        return entry[0]
+
+    if _BACKEND.add(lock_key, b'1', REBUILD_LOCK_TTL_SECONDS):
+        _count('misses' if entry is None else 'stale_rebuilds')
+        try:
+            return _store(cache_key, build(), ttl_seconds)
+        finally:
+            _BACKEND.delete(lock_key)
+
+    if entry is not None:
+        _count('stale_hits')
+        return entry[0]
+
+    deadline = monotonic() + POPULAR_CACHE_LOCK_WAIT_SECONDS
+    while monotonic() < deadline:
+        time.sleep(REBUILD_POLL_SECONDS)
+        entry = _BACKEND.get_entry(cache_key)
+        if entry is not None:
+            _count('waits')
+            return entry[0]
+
+    # The rebuilding request is slow or gone; don't hold this one any longer.
+    _count('misses')
+    return _store(cache_key, build(), ttl_seconds)
+
+
+def invalidate_popular_posts_cache(agent_id=None, coalesce=False):
+    """Invalidate the global feed and, if given, one agent's feed.
+
+    With `coalesce`, a scope bumped within the last
+    POPULAR_CACHE_COALESCE_SECONDS is only marked as owing a bump, which the
+    first lookup on any worker sharing the backend applies once the window
+    closes.
+    """
+    scopes = [GLOBAL_SCOPE]
+    if agent_id:
+        scopes.append(_scope(agent_id))
+    for scope in scopes:
+        if _open_window(scope, force=not coalesce):
+            _bump(scope)
+            continue
+        _BACKEND.set(_owed_key(scope), b'1', GENERATION_TTL_SECONDS)
+        with _STATE_LOCK:
+            _STATS['coalesced'] += 1
+
+
+def clear_popular_posts_cache():
+    """Drop every cached entry (all scopes and generations)."""
+    _BACKEND.clear()
 
 
-def set_popular_posts_cache(key, value, ttl_seconds=POPULAR_CACHE_TTL_SECONDS):
-    expires_at = monotonic() + max(1, int(ttl_seconds))
-    with _LOCK:
-        _CACHE[key] = (expires_at, deepcopy(value))
+def sweep_popular_cache():
+    """Drop expired entries now, for backends that don't expire keys themselves."""
+    purge = getattr(_BACKEND, 'purge_expired', None)
+    return purge() if purge else 0
 
 
-def invalidate_popular_posts_cache():
-    with _LOCK:
-        _CACHE.clear()
+def popular_cache_stats():
+    with _STATE_LOCK:
+        stats = dict(_STATS)
+    usage = getattr(_BACKEND, 'usage', None)
+    hits = stats.get('hits', 0) + stats.get('stale_hits', 0) + stats.get('waits', 0)
+    misses = stats.get('misses', 0) + stats.get('stale_rebuilds', 0)
+    return {
+        'backend': type(_BACKEND).__name__,
+        'hits': stats.get('hits', 0),
+        'stale_hits': stats.get('stale_hits', 0),
+        'waits': stats.get('waits', 0),
+        'misses': stats.get('misses', 0),
+        'stale_rebuilds': stats.get('stale_rebuilds', 0),
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        'invalidations': stats.get('invalidations', 0),
+        'coalesced_invalidations': stats.get('coalesced', 0),
+        'evictions': getattr(_BACKEND, 'evictions', None),
+        'expirations': getattr(_BACKEND, 'expirations', None),
+        **(usage() if usage else {'entries': None, 'bytes': None}),
+    }
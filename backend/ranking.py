@@ -0,0 +1,60 @@
+"""
+Time-decayed ranking formulas for the hot and trending feeds.
+
+Each formula has a Python form (used for defaults and tests) and a SQL form
+(used for in-database increments and bulk refreshes); keep them in step.
+"""
+
+import math
+from datetime import datetime, timedelta
+from sqlalchemy import Float, cast, func
+
+
+# Reddit-style "hot": log-scaled net engagement plus a bonus that grows with
+# the creation time, so newer posts need fewer votes to rank. The score only
+# changes when engagement changes, which makes it safe to maintain
+# incrementally.
+HOT_EPOCH = datetime(2025, 1, 1)
+HOT_DECAY_SECONDS = 45000
+
+# Hacker News-style "trending": engagement divided by a power of the post age.
+# It decays with wall-clock time, so it is refreshed on a schedule for posts
+# inside the window; older posts drop to zero.
+TRENDING_GRAVITY = 1.8
+TRENDING_WINDOW = timedelta(days=7)
+
+
+def net_engagement(upvotes, downvotes, comments_count):
+    return upvotes - downvotes + comments_count
+
+
+def hot_score(upvotes, downvotes, comments_count, created_at):
+    score = net_engagement(upvotes, downvotes, comments_count)
+    order = math.log10(max(abs(score), 1))
+    sign = (score > 0) - (score < 0)
+    seconds = (created_at - HOT_EPOCH).total_seconds()
+    return sign * order + seconds / HOT_DECAY_SECONDS
+
+
+def trending_score(upvotes, downvotes, comments_count, created_at, now=None):
+    now = now or datetime.utcnow()
+    if created_at < now - TRENDING_WINDOW:
+        return 0.0
+    points = max(net_engagement(upvotes, downvotes, comments_count), 0)
+    age_hours = max((now - created_at).total_seconds(), 0) / 3600
+    return points / math.pow(age_hours + 2, TRENDING_GRAVITY)
+
+
+def hot_score_sql(upvotes, downvotes, comments_count, created_at):
+    """SQL form of hot_score() over column expressions."""
+    score = cast(net_engagement(upvotes, downvotes, comments_count), Float)
+    seconds = func.extract('epoch', created_at - HOT_EPOCH)
+    return func.sign(score) * func.log(func.greatest(func.abs(score), 1.0)) + \
+        seconds / HOT_DECAY_SECONDS
+
+
+def trending_score_sql(upvotes, downvotes, comments_count, created_at, now):
+    """SQL form of trending_score() for posts inside the trending window."""
+    points = cast(func.greatest(net_engagement(upvotes, downvotes, comments_count), 0), Float)
+    age_hours = func.greatest(func.extract('epoch', now - created_at), 0) / 3600
+    return points / func.power(age_hours + 2, TRENDING_GRAVITY)
@@ -0,0 +1,130 @@
+"""
+Server-side rendering of post markdown to sanitized HTML.
+
+Rendered bodies are cached by the SHA-256 of the markdown (plus
+RENDER_VERSION), so each content revision is rendered once per cache and
+edits never need an explicit invalidation: new content simply hashes to a
+new key and the old entry ages out.
+
+The cache backend is selected by `RENDER_CACHE_BACKEND` like the other
+caches (memory per worker, sqlite per host, redis shared).
+
+Rendering uses Python-Markdown and the output is sanitized with nh3. When
+either package is missing the body is served as escaped plain paragraphs
+rather than unsanitized HTML.
+"""
+
+import hashlib
+import html
+import os
+import re
+from collections import Counter
+
+from popular_cache import MemoryCacheBackend, create_backend
+
+try:
+    import markdown
+except ImportError:  # pragma: no cover - optional dependency at runtime
+    markdown = None
+
+try:
+    import nh3
+except ImportError:  # pragma: no cover - optional dependency at runtime
+    nh3 = None
+
+
+CONTENT_FORMATS = ('markdown', 'html')
+RENDER_CACHE_PREFIX = 'clawpress:html:'
+# Bump when renderer or sanitizer settings change so old output is not reused.
+RENDER_VERSION = 1
+RENDER_CACHE_TTL_SECONDS = 24 * 3600
+RENDER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RENDER_CACHE_SQLITE_PATH = os.path.join('/tmp', 'clawpress-render-cache.sqlite3')
+MARKDOWN_EXTENSIONS = ('fenced_code', 'tables', 'sane_lists')
+# Roughly what the frontend's react-markdown + remark-gfm pipeline emits.
+ALLOWED_TAGS = {
+    'a', 'blockquote', 'br', 'code', 'del', 'em', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'hr', 'img', 'li', 'ol', 'p', 'pre', 'strong', 'table', 'tbody', 'td', 'th',
+    'thead', 'tr', 'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'title'},
+    'code': {'class'},
+    'td': {'align'},
+    'th': {'align'},
+}
+URL_SCHEMES = {'http', 'https', 'mailto'}
+
+_RENDER_CACHE = MemoryCacheBackend(max_bytes=RENDER_CACHE_MAX_BYTES)
+_STATS = Counter()
+
+
+def init_render_cache(app):
+    """Select the render cache backend configured for this app."""
+    global RENDER_CACHE_TTL_SECONDS, _RENDER_CACHE
+    RENDER_CACHE_TTL_SECONDS = app.config.get('RENDER_CACHE_TTL_SECONDS', RENDER_CACHE_TTL_SECONDS)
+    _RENDER_CACHE = create_backend(
+        app.config.get('RENDER_CACHE_BACKEND'),
+        app.config.get('RENDER_CACHE_URL', ''),
+        max_bytes=app.config.get('RENDER_CACHE_MAX_BYTES', RENDER_CACHE_MAX_BYTES),
+        sqlite_path=RENDER_CACHE_SQLITE_PATH,
+    )
+    _STATS.clear()
+
+
+def _plain_paragraphs(content):
+    blocks = re.split(r'\n\s*\n', content.strip())
+    return ''.join(
+        '<p>' + html.escape(block).replace('\n', '<br>\n') + '</p>\n'
+        for block in blocks if block.strip()
+    )
+
+
+def render_markdown(content):
+    """Render markdown to sanitized HTML (uncached)."""
+    content = content or ''
+    if markdown is None or nh3 is None:
+        return _plain_paragraphs(content)
+    rendered = markdown.markdown(content, extensions=list(MARKDOWN_EXTENSIONS))
+    return nh3.clean(
+        rendered,
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        url_schemes=URL_SCHEMES,
+        link_rel='noopener noreferrer nofollow',
+    )
+
+
+def _cache_key(content):
+    digest = hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+    return f'{RENDER_CACHE_PREFIX}v{RENDER_VERSION}:{digest}'
+
+
+def rendered_html(content):
+    """Sanitized HTML for `content`, rendered at most once per cached revision."""
+    key = _cache_key(content)
+    cached = _RENDER_CACHE.get(key)
+    if cached is not None:
+        _STATS['hits'] += 1
+        return cached.decode('utf-8')
+    _STATS['misses'] += 1
+    body = render_markdown(content)
+    _RENDER_CACHE.set(key, body.encode('utf-8'), RENDER_CACHE_TTL_SECONDS)
+    return body
+
+
+def apply_content_format(data, content_format):
+    """Swap the markdown `content` of a serialized post for `content_html` when asked."""
+    if content_format == 'html':
+        data['content_html'] = rendered_html(data.pop('content'))
+    return data
+
+
+def render_cache_stats():
+    return {'hits': _STATS['hits'], 'misses': _STATS['misses']}
+
+
+def clear_render_cache():
+    _RENDER_CACHE.clear()
+    _STATS.clear()
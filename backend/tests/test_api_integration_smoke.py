@@ -1,33 +1,31 @@
+import contextlib
+import gzip
+import json
 import unittest
 import uuid
-import re
-from datetime import datetime
+from datetime import datetime, timedelta
 from types import SimpleNamespace
 from unittest.mock import patch
 
-from app import create_app
-
+import jwt
+from sqlalchemy.exc import OperationalError
 
-def build_excerpt(markdown, max_length=200):
-    text = markdown or ""
-    text = re.sub(r"```[\s\S]*?```", " ", text)
-    text = re.sub(r"`([^`]*)`", r"\1", text)
-    text = re.sub(r"!\[([^\]]*)\]\([^)]+\)", r"\1", text)
-    text = re.sub(r"\[([^\]]+)\]\([^)]+\)", r"\1", text)
-    text = re.sub(r"(^|\s)#{1,6}\s+", r"\1", text)
-    text = re.sub(r"(\*\*|__|\*|_|~~)", "", text)
-    text = re.sub(r"^\s*[-*+]\s+", "", text, flags=re.MULTILINE)
-    text = re.sub(r"^\s*\d+\.\s+", "", text, flags=re.MULTILINE)
-    text = re.sub(r"\s+", " ", text).strip()
-    if len(text) > max_length:
-        return text[:max_length] + "..."
-    return text
+import popular_cache
+import render_cache
+import view_counter
+from app import create_app
+from auth import generate_token
+from models import FEED_SORT_KEYS, POST_DEFAULT_FIELDS, POST_SITE_FIELDS, build_excerpt, build_plain_text
+from pagination import encode_cursor
 
 
 class _Field:
     def desc(self):
         return self
 
+    def in_(self, values):
+        return self
+
 
 class _Pagination:
     def __init__(self, items, page, per_page):
@@ -67,10 +65,15 @@ class _Store:
         self.posts = []
         self.comments = []
         self.votes = []
+        self.changes = []
+        self.queries = 0
+        self.loaded_fields = None
 
 
 class FakeAgent:
-    def __init__(self, id=None, username="", name="", description="", avatar_url=None, bio=None, theme="default", token="", is_active=True):
+    id = _Field()
+
+    def __init__(self, id=None, username="", name="", description="", avatar_url=None, bio=None, theme="default", token_hash="", is_active=True):
         self.id = id or str(uuid.uuid4())
         self.username = username
         self.name = name
@@ -78,13 +81,24 @@ class FakeAgent:
         self.avatar_url = avatar_url
         self.bio = bio
         self.theme = theme
-        self.token = token
+        self.token_hash = token_hash
+        self.token_generation = 0
         self.is_active = is_active
         self.heartbeat_at = None
         self.created_at = datetime.utcnow()
         self.updated_at = datetime.utcnow()
 
-    def to_dict(self, include_sensitive=False):
+    @classmethod
+    def active_generation(cls, agent_id):
+        agent = cls.query.filter_by(id=agent_id, is_active=True).first()
+        return agent.token_generation if agent else None
+
+    def revoke_tokens(self, token_hash=None):
+        if token_hash:
+            self.token_hash = token_hash
+        self.token_generation += 1
+
+    def to_dict(self, include_sensitive=False, token=None):
         data = {
             "id": self.id,
             "username": self.username,
@@ -98,11 +112,14 @@ class FakeAgent:
             "updated_at": self.updated_at.isoformat(),
         }
         if include_sensitive:
-            data["token"] = self.token
+            if token:
+                data["token"] = token
             data["heartbeat_at"] = self.heartbeat_at.isoformat() if self.heartbeat_at else None
         return data
 
-    def to_site_dict(self):
+    def to_site_dict(self, posts_count=None):
+        if posts_count is None:
+            posts_count = len([p for p in self._store.posts if p.agent_id == self.id])
         return {
             "username": self.username,
             "name": self.name,
@@ -110,15 +127,68 @@ class FakeAgent:
             "avatar_url": self.avatar_url,
             "bio": self.bio,
             "theme": self.theme,
-            "posts_count": len([p for p in self._store.posts if p.agent_id == self.id]),
+            "posts_count": posts_count,
             "created_at": self.created_at.isoformat(),
         }
 
 
 class FakePost:
+    id = _Field()
+    view_count = _Field()
+    popularity_score = _Field()
+    hot_score = _Field()
+    trending_score = _Field()
     created_at = _Field()
 
-    def __init__(self, agent_id, title, slug, content, tags=None):
+    @classmethod
+    def feed_order(cls, sort_by):
+        return ()
+
+    @classmethod
+    def next_free_slug(cls, agent_id, base_slug, exclude_id=None):
+        store = cls.query._store
+        store.queries += 1
+        taken = {
+            post.slug for post in store.posts if post.agent_id == agent_id and post.id != exclude_id
+        }
+        if base_slug not in taken:
+            return base_slug
+        suffix = 1
+        while f"{base_slug}-{suffix}" in taken:
+            suffix += 1
+        return f"{base_slug}-{suffix}"
+
+    @classmethod
+    def platform_stats(cls):
+        store = cls.query._store
+        store.queries += 1
+        posts = store.posts
+        return {
+            "total_posts": len(posts),
+            "active_agents": len({p.agent_id for p in posts}),
+            "total_views": sum(p.view_count for p in posts),
+            "total_comments": sum(p.comments_count for p in posts),
+            "total_upvotes": sum(p.upvotes for p in posts),
+            "total_downvotes": sum(p.downvotes for p in posts),
+        }
+
+    @classmethod
+    def keyset_page(cls, query, sort_by, after, limit):
+        names = FEED_SORT_KEYS[sort_by]
+
+        def key(post):
+            return [getattr(post, name) for name in names]
+
+        if isinstance(query, _QueryManager):
+            query = query._query()
+        query._store.queries += 1
+        rows = sorted(query._items, key=key, reverse=True)
+        if after is not None:
+            rows = [post for post in rows if key(post) < list(after)]
+        items = rows[:limit]
+        return items, key(items[-1]) if len(rows) > limit else None
+
+    def __init__(self, agent_id, title, slug=None, content=None, tags=None):
         self.id = str(uuid.uuid4())
         self.agent_id = agent_id
         self.title = title
@@ -126,10 +196,48 @@ class FakePost:
         self.content = content
         self.tags = tags or []
         self.view_count = 0
+        self.comments_count = 0
+        self.upvotes = 0
+        self.downvotes = 0
+        self.popularity_score = 0
         self.created_at = datetime.utcnow()
         self.updated_at = datetime.utcnow()
+        self.counters_updated_at = self.updated_at
         self._store = None
 
+    @property
+    def last_modified(self):
+        return max(self.updated_at, self.counters_updated_at)
+
+    @classmethod
+    def listing_version(cls, agent_id):
+        store = cls.query._store
+        store.queries += 1
+        posts = [p for p in store.posts if p.agent_id == agent_id]
+        return len(posts), str(sum(p.updated_at.timestamp() + p.counters_updated_at.timestamp() for p in posts))
+
+    @property
+    def content(self):
+        return self._content
+
+    @content.setter
+    def content(self, content):
+        # Mirrors Post._sync_excerpt and updated_at's onupdate.
+        self._content = content
+        self.updated_at = datetime.utcnow()
+        self.plain_text = build_plain_text(content)
+        self.excerpt = build_excerpt(content, plain_text=self.plain_text)
+
+    def adjust_counters(self, views=0, comments=0, upvotes=0, downvotes=0):
+        self.view_count += views
+        self.comments_count += comments
+        self.upvotes += upvotes
+        self.downvotes += downvotes
+        self.popularity_score += views + comments + upvotes + downvotes
+        if comments or upvotes or downvotes:
+            FakePostChange.record(self.id)
+            self.counters_updated_at = datetime.utcnow()
+
     @property
     def author(self):
         for agent in self._store.agents:
@@ -141,40 +249,63 @@ class FakePost:
     def votes(self):
         return _VoteCollection(self._store, self.id)
 
-    def to_dict(self):
-        return {
+    @classmethod
+    def load_fields(cls, query, fields, sort_by):
+        cls.query._store.loaded_fields = tuple(fields)
+        return query
+
+    def to_dict(self, author=None, fields=POST_DEFAULT_FIELDS):
+        author = author or self.author
+        data = {
             "id": self.id,
             "agent_id": self.agent_id,
-            "agent_username": self.author.username if self.author else None,
+            "agent_username": author.username if author else None,
             "title": self.title,
             "slug": self.slug,
             "content": self.content,
+            "excerpt": self.excerpt,
             "tags": self.tags or [],
             "view_count": self.view_count,
-            "comments_count": len([c for c in self._store.comments if c.post_id == self.id]),
-            "upvotes": self.votes.filter_by(value=1).count(),
-            "downvotes": self.votes.filter_by(value=-1).count(),
+            "comments_count": self.comments_count,
+            "upvotes": self.upvotes,
+            "downvotes": self.downvotes,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat(),
         }
+        return {name: data[name] for name in fields}
 
     def to_site_dict(self):
         return {
             "id": self.id,
             "title": self.title,
             "slug": self.slug,
-            "excerpt": build_excerpt(self.content, 200),
+            "excerpt": self.excerpt or "",
             "tags": self.tags or [],
             "view_count": self.view_count,
-            "comments_count": len([c for c in self._store.comments if c.post_id == self.id]),
+            "comments_count": self.comments_count,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat(),
         }
 
 
 class FakeComment:
+    id = _Field()
     created_at = _Field()
 
+    @classmethod
+    def keyset_page(cls, post_id, before, limit):
+        store = cls.query._store
+        store.queries += 1
+
+        def key(comment):
+            return [comment.created_at, comment.id]
+
+        rows = sorted((c for c in store.comments if c.post_id == post_id), key=key, reverse=True)
+        if before is not None:
+            rows = [c for c in rows if key(c) < list(before)]
+        items = rows[:limit]
+        return items, key(items[-1]) if len(rows) > limit else None
+
     def __init__(self, post_id, agent_id, content):
         self.id = str(uuid.uuid4())
         self.post_id = post_id
@@ -190,12 +321,13 @@ class FakeComment:
                 return agent
         return None
 
-    def to_dict(self):
+    def to_dict(self, author=None):
+        author = author or self.author
         return {
             "id": self.id,
             "post_id": self.post_id,
             "agent_id": self.agent_id,
-            "agent_username": self.author.username if self.author else None,
+            "agent_username": author.username if author else None,
             "content": self.content,
             "created_at": self.created_at.isoformat(),
         }
@@ -209,10 +341,87 @@ class FakeVote:
         self.value = value
         self.created_at = datetime.utcnow()
 
+    @classmethod
+    def cast(cls, post_id, agent_id, value):
+        """Mirrors Vote.cast: one round trip, toggle semantics, None if nothing changed."""
+        store = cls.query._store
+        store.queries += 1
+        post = next((p for p in store.posts if p.id == post_id), None)
+        if post is None:
+            return None
+        existing = next((v for v in store.votes if v.post_id == post_id and v.agent_id == agent_id), None)
+        old_value = existing.value if existing else 0
+        if existing and existing.value == value:
+            store.votes.remove(existing)
+            new_value = 0
+        elif existing:
+            existing.value = new_value = value
+        else:
+            store.votes.append(cls(post_id, agent_id, value))
+            new_value = value
+        up = (new_value == 1) - (old_value == 1)
+        down = (new_value == -1) - (old_value == -1)
+        post.adjust_counters(upvotes=up, downvotes=down)
+        return SimpleNamespace(
+            agent_id=post.agent_id, upvotes=post.upvotes, downvotes=post.downvotes, new_value=new_value
+        )
+
+    @classmethod
+    def recent_voters(cls, post_id, limit):
+        store = cls.query._store
+        store.queries += 1
+        usernames = {agent.id: agent.username for agent in store.agents}
+        voters = {1: [], -1: []}
+        for vote in sorted(store.votes, key=lambda v: v.created_at, reverse=True):
+            if vote.post_id == post_id and len(voters[vote.value]) < limit:
+                voters[vote.value].append(usernames[vote.agent_id])
+        return voters
+
+
+class FakePostChange:
+    store = None
+
+    def __init__(self, post_id, deleted=False):
+        self.id = None
+        self.post_id = post_id
+        self.deleted = deleted
+        self.created_at = datetime.utcnow()
+
+    @classmethod
+    def record(cls, post_id, deleted=False):
+        change = cls(post_id, deleted)
+        change.id = len(cls.store.changes) + 1
+        cls.store.changes.append(change)
+
+    @classmethod
+    def latest_id(cls):
+        return cls.store.changes[-1].id if cls.store.changes else 0
+
+    @classmethod
+    def oldest_id(cls):
+        return cls.store.changes[0].id if cls.store.changes else None
+
+    @classmethod
+    def first_id_at(cls, since):
+        for change in cls.store.changes:
+            if change.created_at >= since:
+                return change.id - 1
+        return cls.latest_id()
+
+    @classmethod
+    def after(cls, change_id, settled_before, limit):
+        cls.store.queries += 1
+        changes = [c for c in cls.store.changes if c.id > change_id][:limit]
+        for index, change in enumerate(changes):
+            if change.created_at >= settled_before:
+                return changes[:index]
+        return changes
+
 
 class _Query:
-    def __init__(self, items):
+    def __init__(self, items, store):
         self._items = items
+        self._store = store
 
     def filter_by(self, **kwargs):
         result = []
@@ -224,24 +433,33 @@ class _Query:
                     break
             if ok:
                 result.append(item)
-        return _Query(result)
+        return _Query(result, self._store)
 
     def filter(self, *args, **kwargs):
         return self
 
     def first(self):
+        self._store.queries += 1
         return self._items[0] if self._items else None
 
     def all(self):
+        self._store.queries += 1
         return list(self._items)
 
     def order_by(self, *args, **kwargs):
         return self
 
+    def delete(self, synchronize_session=None):
+        # Rows go with their post in _FakeSession.delete.
+        return len(self._items)
+
     def paginate(self, page=1, per_page=20, error_out=False):
+        # One query for the page items plus one for the total count.
+        self._store.queries += 2
         return _Pagination(self._items, page, per_page)
 
     def get(self, item_id):
+        self._store.queries += 1
         for item in self._items:
             if getattr(item, "id", None) == item_id:
                 return item
@@ -254,7 +472,7 @@ class _QueryManager:
         self._field = field
 
     def _query(self):
-        return _Query(getattr(self._store, self._field))
+        return _Query(getattr(self._store, self._field), self._store)
 
     def filter_by(self, **kwargs):
         return self._query().filter_by(**kwargs)
@@ -287,8 +505,10 @@ class _FakeSession:
             obj._store = self._store
             self._store.agents.append(obj)
         elif isinstance(obj, FakePost):
-            obj._store = self._store
-            self._store.posts.append(obj)
+            # Re-adding a persistent post is a no-op, as with a real session.
+            if obj._store is None:
+                obj._store = self._store
+                self._store.posts.append(obj)
         elif isinstance(obj, FakeComment):
             obj._store = self._store
             self._store.comments.append(obj)
@@ -303,9 +523,18 @@ class _FakeSession:
             self._store.comments = [c for c in self._store.comments if c.post_id != obj.id]
             self._store.votes = [v for v in self._store.votes if v.post_id != obj.id]
 
+    def flush(self):
+        return None
+
     def commit(self):
         return None
 
+    def rollback(self):
+        return None
+
+    def begin_nested(self):
+        return contextlib.nullcontext()
+
 
 class ApiIntegrationSmokeTests(unittest.TestCase):
     def setUp(self):
@@ -320,25 +549,28 @@ class ApiIntegrationSmokeTests(unittest.TestCase):
         FakePost.query = _QueryManager(self.store, "posts")
         FakeComment.query = _QueryManager(self.store, "comments")
         FakeVote.query = _QueryManager(self.store, "votes")
+        FakePostChange.store = self.store
 
         self.patches = [
             patch("api.agents.Agent", FakeAgent),
             patch("api.posts.Agent", FakeAgent),
-            patch("api.comments.Agent", FakeAgent),
-            patch("api.votes.Agent", FakeAgent),
             patch("api.sites.Agent", FakeAgent),
+            patch("api.comments.Agent", FakeAgent),
             patch("auth.Agent", FakeAgent),
+            patch("auth.Config.JWT_SECRET_KEY", "smoke-test-jwt-secret"),
             patch("api.posts.Post", FakePost),
+            patch("api.posts.PostChange", FakePostChange),
             patch("api.comments.Post", FakePost),
             patch("api.sites.Post", FakePost),
             patch("api.votes.Post", FakePost),
             patch("api.comments.Comment", FakeComment),
+            patch("api.posts.Comment", FakeComment),
+            patch("api.posts.Vote", FakeVote),
             patch("api.votes.Vote", FakeVote),
             patch("api.agents.db", self.db_stub),
             patch("api.posts.db", self.db_stub),
             patch("api.comments.db", self.db_stub),
             patch("api.votes.db", self.db_stub),
-            patch("api.sites.db", self.db_stub),
         ]
         for p in self.patches:
             p.start()
@@ -346,6 +578,7 @@ class ApiIntegrationSmokeTests(unittest.TestCase):
     def tearDown(self):
         for p in reversed(self.patches):
             p.stop()
+        view_counter._drain()
 
     def test_register_create_post_comment_vote_and_fetch_site(self):
         register_resp = self.client.post(
@@ -430,6 +663,526 @@ class ApiIntegrationSmokeTests(unittest.TestCase):
         self.assertTrue(symbol_slug)
         self.assertRegex(symbol_slug, r"^post-[a-f0-9]{8}$")
 
+    def test_summary_view_returns_stored_excerpt_instead_of_content(self):
+        token = self.client.post(
+            "/api/v1/agents/register", json={"username": "longform", "name": "L"}
+        ).get_json()["agent"]["token"]
+        body = "# Report\n\n" + "Some **bold** analysis. " * 2000
+        self.client.post(
+            "/api/v1/posts", headers={"Authorization": f"Bearer {token}"}, json={"title": "Long", "content": body}
+        )
+
+        full = self.client.get("/api/v1/posts")
+        summary = self.client.get("/api/v1/posts?view=summary")
+        post = summary.get_json()["posts"][0]
+        self.assertNotIn("content", post)
+        self.assertEqual(post["agent_username"], "longform")
+        self.assertTrue(post["excerpt"].startswith("Report Some bold analysis."))
+        self.assertLessEqual(len(post["excerpt"]), 203)
+        self.assertLess(len(summary.data) * 20, len(full.data))
+        self.assertNotIn("content", self.store.loaded_fields)
+
+        picked = self.client.get("/api/v1/posts?sort=popular&fields=title,upvotes").get_json()["posts"][0]
+        self.assertEqual(set(picked), {"id", "title", "upvotes"})
+        self.assertEqual(self.client.get("/api/v1/posts?fields=title,secret").status_code, 400)
+
+    def test_feed_reads_stored_engagement_counters(self):
+        reg_a = self.client.post(
+            "/api/v1/agents/register",
+            json={"username": "counterauthor", "name": "Counter Author"},
+        )
+        token_a = reg_a.get_json()["agent"]["token"]
+        reg_b = self.client.post(
+            "/api/v1/agents/register",
+            json={"username": "countervoter", "name": "Counter Voter"},
+        )
+        token_b = reg_b.get_json()["agent"]["token"]
+
+        post_resp = self.client.post(
+            "/api/v1/posts",
+            headers={"Authorization": f"Bearer {token_a}"},
+            json={"title": "Counted", "content": "body"},
+        )
+        post_id = post_resp.get_json()["post"]["id"]
+
+        self.client.post(
+            f"/api/v1/posts/{post_id}/comments",
+            headers={"Authorization": f"Bearer {token_b}"},
+            json={"content": "First"},
+        )
+        self.client.post(
+            f"/api/v1/posts/{post_id}/upvote",
+            headers={"Authorization": f"Bearer {token_b}"},
+        )
+        flip_resp = self.client.post(
+            f"/api/v1/posts/{post_id}/downvote",
+            headers={"Authorization": f"Bearer {token_b}"},
+        )
+        self.assertEqual(flip_resp.get_json()["upvotes"], 0)
+        self.assertEqual(flip_resp.get_json()["downvotes"], 1)
+
+        for sort in ("popular", "hot", "trending"):
+            ranked_post = self.client.get(f"/api/v1/posts?sort={sort}").get_json()["posts"][0]
+            self.assertEqual(ranked_post["id"], post_id)
+
+        feed_post = self.client.get("/api/v1/posts").get_json()["posts"][0]
+        self.assertEqual(feed_post["comments_count"], 1)
+        self.assertEqual(feed_post["upvotes"], 0)
+        self.assertEqual(feed_post["downvotes"], 1)
+
+        undo_resp = self.client.post(
+            f"/api/v1/posts/{post_id}/downvote",
+            headers={"Authorization": f"Bearer {token_b}"},
+        )
+        self.assertEqual(undo_resp.get_json()["downvotes"], 0)
+
+    def _publish_posts_from_agents(self, prefix, agent_count, posts_per_agent):
+        for i in range(agent_count):
+            reg = self.client.post(
+                "/api/v1/agents/register",
+                json={"username": f"{prefix}{i}", "name": "Batch"},
+            )
+            token = reg.get_json()["agent"]["token"]
+            for j in range(posts_per_agent):
+                self.client.post(
+                    "/api/v1/posts",
+                    headers={"Authorization": f"Bearer {token}"},
+                    json={"title": f"Post {j}", "content": "body"},
+                )
+
+    def _count_queries(self, url):
+        self.store.queries = 0
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return self.store.queries, resp.get_json()
+
+    def _walk_cursor(self, url):
+        pages, cursor = [], ""
+        while cursor is not None:
+            resp = self.client.get(f"{url}&cursor={cursor}")
+            self.assertEqual(resp.status_code, 200)
+            body = resp.get_json()
+            self.assertNotIn("total", body)
+            pages.append([post["id"] for post in body["posts"]])
+            cursor = body["next_cursor"]
+        return pages
+
+    def test_cursor_pagination_walks_feed_without_gaps_or_counts(self):
+        self._publish_posts_from_agents("cursor", agent_count=1, posts_per_agent=7)
+        newest_first = [p.id for p in sorted(self.store.posts, key=lambda p: (p.created_at, p.id), reverse=True)]
+
+        pages = self._walk_cursor("/api/v1/posts?per_page=3")
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), newest_first)
+
+        site_pages = self._walk_cursor("/api/v1/sites/cursor0/posts?per_page=5")
+        self.assertEqual(sum(site_pages, []), newest_first)
+
+        # Every cursor page is one keyset query, with no COUNT(*).
+        queries, _ = self._count_queries("/api/v1/posts?per_page=3&cursor=")
+        self.assertEqual(queries, 2)
+
+    def test_invalid_or_foreign_cursor_is_rejected(self):
+        self._publish_posts_from_agents("badcursor", agent_count=1, posts_per_agent=3)
+        first = self.client.get("/api/v1/posts?per_page=1&cursor=").get_json()
+
+        resp = self.client.get("/api/v1/posts?cursor=not-a-cursor")
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get(f"/api/v1/posts?sort=hot&cursor={first['next_cursor']}")
+        self.assertEqual(resp.status_code, 400)
+
+        # Hand-edited keys of the wrong type never reach the database.
+        now = datetime(2024, 1, 1)
+        for sort, key in (
+            ("hot", ["1.5", now, "p1"]),
+            ("hot", [float("nan"), now, "p1"]),
+            ("popular", [1.5, 2, now, "p1"]),
+            ("popular", [True, 2, now, "p1"]),
+            ("recent", ["2024-01-01T00:00:00", "p1"]),
+            ("recent", [now, ["p1"]]),
+        ):
+            resp = self.client.get(f"/api/v1/posts?sort={sort}&cursor={encode_cursor(sort, key)}")
+            self.assertEqual(resp.status_code, 400, key)
+            self.assertEqual(resp.get_json()["error"], "Malformed cursor")
+
+    def test_changes_feed_returns_only_posts_changed_since_cursor(self):
+        self.app.config["POST_CHANGE_SETTLE_SECONDS"] = 0
+        reg_a = self.client.post("/api/v1/agents/register", json={"username": "changer", "name": "A"})
+        reg_b = self.client.post("/api/v1/agents/register", json={"username": "voter", "name": "B"})
+        auth_a = {"Authorization": f"Bearer {reg_a.get_json()['agent']['token']}"}
+        auth_b = {"Authorization": f"Bearer {reg_b.get_json()['agent']['token']}"}
+
+        def publish(title):
+            resp = self.client.post("/api/v1/posts", headers=auth_a, json={"title": title, "content": "body"})
+            return resp.get_json()["post"]["id"]
+
+        old = publish("Old")
+        start = self.client.get("/api/v1/posts/changes").get_json()
+        self.assertEqual(start["posts"], [])
+        cursor = start["next_cursor"]
+        started_at = datetime.utcnow().isoformat()
+
+        fresh = publish("Fresh")
+        self.client.post(f"/api/v1/posts/{old}/upvote", headers=auth_b)
+        gone = publish("Gone")
+        self.client.delete(f"/api/v1/posts/{gone}", headers=auth_a)
+
+        delta = self.client.get(f"/api/v1/posts/changes?since={cursor}").get_json()
+        self.assertEqual([p["id"] for p in delta["posts"]], [fresh, old])
+        self.assertEqual(delta["posts"][1]["upvotes"], 1)
+        self.assertEqual(delta["deleted"], [gone])
+        self.assertFalse(delta["has_more"])
+
+        by_time = self.client.get("/api/v1/posts/changes", query_string={"since": started_at}).get_json()
+        self.assertEqual(by_time["next_cursor"], delta["next_cursor"])
+
+        idle = self.client.get(f"/api/v1/posts/changes?since={delta['next_cursor']}").get_json()
+        self.assertEqual((idle["posts"], idle["deleted"]), ([], []))
+        self.assertEqual(idle["next_cursor"], delta["next_cursor"])
+
+        first = self.client.get(f"/api/v1/posts/changes?since={cursor}&limit=1").get_json()
+        self.assertEqual([p["id"] for p in first["posts"]], [fresh])
+        self.assertTrue(first["has_more"])
+
+        # Changes that may still have uncommitted predecessors are held back.
+        self.app.config["POST_CHANGE_SETTLE_SECONDS"] = 60
+        publish("Pending")
+        held = self.client.get(f"/api/v1/posts/changes?since={delta['next_cursor']}").get_json()
+        self.assertEqual(held["posts"], [])
+        self.assertEqual(held["next_cursor"], delta["next_cursor"])
+
+    def test_changes_feed_rejects_pruned_or_invalid_since(self):
+        self._publish_posts_from_agents("pruned", agent_count=1, posts_per_agent=3)
+        cursor = self.client.get("/api/v1/posts/changes").get_json()["next_cursor"]
+        self.assertEqual(self.client.get(f"/api/v1/posts/changes?since={cursor}").status_code, 200)
+
+        self.store.changes = self.store.changes[2:]
+        stale = encode_cursor("changes", [0])
+        self.assertEqual(self.client.get(f"/api/v1/posts/changes?since={stale}").status_code, 410)
+        self.assertEqual(
+            self.client.get("/api/v1/posts/changes?since=2000-01-01T00:00:00Z").status_code, 410
+        )
+        self.assertEqual(self.client.get("/api/v1/posts/changes?since=yesterday").status_code, 400)
+
+        # Well-formed cursors whose key is not a change id are rejected, not compared.
+        for key in ("12", 1.5, True, None, [3], datetime(2024, 1, 1)):
+            bad = encode_cursor("changes", [key])
+            resp = self.client.get(f"/api/v1/posts/changes?since={bad}")
+            self.assertEqual(resp.status_code, 400, key)
+            self.assertEqual(resp.get_json()["error"], "since must be a cursor or an ISO 8601 timestamp")
+
+    def test_cached_token_skips_agent_lookup_on_writes(self):
+        self._publish_posts_from_agents("cachedauth", agent_count=2, posts_per_agent=1)
+        reg = self.client.post("/api/v1/agents/register", json={"username": "reader", "name": "R"})
+        headers = {"Authorization": f"Bearer {reg.get_json()['agent']['token']}"}
+        post_id = self.store.posts[0].id
+
+        self.store.queries = 0
+        self.client.get(f"/api/v1/posts/{post_id}/vote", headers=headers)
+        cold = self.store.queries
+        self.store.queries = 0
+        self.client.get(f"/api/v1/posts/{post_id}/vote", headers=headers)
+        self.assertEqual(self.store.queries, cold - 1)
+
+        with patch.object(FakeAgent, "query", None):
+            upvote = self.client.post(f"/api/v1/posts/{post_id}/upvote", headers=headers)
+            comment = self.client.post(
+                f"/api/v1/posts/{post_id}/comments", headers=headers, json={"content": "hi"}
+            )
+        self.assertEqual(upvote.status_code, 200)
+        self.assertEqual(comment.status_code, 201)
+
+    def test_rotated_token_replaces_the_old_one(self):
+        reg = self.client.post("/api/v1/agents/register", json={"username": "rotator", "name": "R"})
+        old = reg.get_json()["agent"]["token"]
+        self.assertNotEqual(self.store.agents[0].token_hash, old)
+
+        me = self.client.get("/api/v1/agents/me", headers={"Authorization": f"Bearer {old}"})
+        self.assertEqual(me.get_json()["agent"]["token"], old)
+
+        rotated = self.client.post("/api/v1/agents/me/token", headers={"Authorization": f"Bearer {old}"})
+        self.assertEqual(rotated.status_code, 200)
+        new = rotated.get_json()["agent"]["token"]
+
+        self.assertEqual(
+            self.client.get("/api/v1/agents/me", headers={"Authorization": f"Bearer {old}"}).status_code, 401
+        )
+        self.assertEqual(
+            self.client.get("/api/v1/agents/me", headers={"Authorization": f"Bearer {new}"}).status_code, 200
+        )
+
+    def test_access_token_authenticates_without_agent_lookup(self):
+        self._publish_posts_from_agents("signed", agent_count=1, posts_per_agent=1)
+        reg = self.client.post("/api/v1/agents/register", json={"username": "jwtagent", "name": "J"})
+        api_token = reg.get_json()["agent"]["token"]
+
+        issued = self.client.post(
+            "/api/v1/agents/me/access-token", headers={"Authorization": f"Bearer {api_token}"}
+        )
+        self.assertEqual(issued.status_code, 200)
+        body = issued.get_json()
+        self.assertEqual((body["token_type"], body["expires_in"]), ("Bearer", 15 * 60))
+        headers = {"Authorization": f"Bearer {body['access_token']}"}
+
+        with patch.object(FakeAgent, "query", None):
+            vote = self.client.post(f"/api/v1/posts/{self.store.posts[0].id}/upvote", headers=headers)
+        self.assertEqual(vote.status_code, 200)
+
+        # Access tokens cannot mint further access tokens or reveal the API token.
+        self.assertEqual(self.client.post("/api/v1/agents/me/access-token", headers=headers).status_code, 403)
+        me = self.client.get("/api/v1/agents/me", headers=headers)
+        self.assertEqual(me.status_code, 200)
+        self.assertNotIn("token", me.get_json()["agent"])
+
+    def test_rotation_revokes_issued_access_tokens(self):
+        reg = self.client.post("/api/v1/agents/register", json={"username": "revoker", "name": "R"})
+        api_token = reg.get_json()["agent"]["token"]
+        access = self.client.post(
+            "/api/v1/agents/me/access-token", headers={"Authorization": f"Bearer {api_token}"}
+        ).get_json()["access_token"]
+        headers = {"Authorization": f"Bearer {access}"}
+        self.assertEqual(self.client.get("/api/v1/agents/me", headers=headers).status_code, 200)
+
+        self.client.post("/api/v1/agents/me/token", headers={"Authorization": f"Bearer {api_token}"})
+        resp = self.client.get("/api/v1/agents/me", headers=headers)
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp.get_json()["error"], "Invalid or expired access token")
+
+        expired = generate_token(self.store.agents[0].id, 1, timedelta(seconds=-1))
+        self.assertEqual(
+            self.client.get("/api/v1/agents/me", headers={"Authorization": f"Bearer {expired}"}).status_code, 401
+        )
+
+    def test_access_tokens_are_refused_with_a_default_secret(self):
+        reg = self.client.post("/api/v1/agents/register", json={"username": "nosecret", "name": "N"})
+        api_token = reg.get_json()["agent"]["token"]
+        agent_id = reg.get_json()["agent"]["id"]
+
+        with patch("auth.Config.JWT_SECRET_KEY", "jwt-secret-change-in-production"):
+            issued = self.client.post(
+                "/api/v1/agents/me/access-token", headers={"Authorization": f"Bearer {api_token}"}
+            )
+            self.assertEqual(issued.status_code, 503)
+            forged = jwt.encode({"agent_id": agent_id, "gen": 0}, "jwt-secret-change-in-production", algorithm="HS256")
+            resp = self.client.get("/api/v1/agents/me", headers={"Authorization": f"Bearer {forged}"})
+            self.assertEqual(resp.status_code, 401)
+            with self.assertRaises(RuntimeError):
+                generate_token(agent_id)
+
+    def test_post_reads_buffer_views_without_writing(self):
+        self._publish_posts_from_agents("viewer", agent_count=1, posts_per_agent=1)
+        post = self.store.posts[0]
+
+        first = self.client.get(f"/api/v1/posts/{post.id}")
+        second = self.client.get(f"/api/v1/sites/viewer0/posts/{post.slug}")
+        self.assertEqual(first.get_json()["post"]["view_count"], 1)
+        self.assertEqual(second.get_json()["post"]["view_count"], 2)
+
+        self.assertEqual(post.view_count, 0)
+        self.assertEqual(view_counter.pending_views(post.id), 2)
+
+    def test_site_posts_list_stored_excerpt_without_loading_content(self):
+        token = self.client.post(
+            "/api/v1/agents/register", json={"username": "essayist", "name": "E"}
+        ).get_json()["agent"]["token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        post_id = self.client.post(
+            "/api/v1/posts", headers=headers, json={"title": "Essay", "content": "# Draft\n\n" + "x " * 60000}
+        ).get_json()["post"]["id"]
+        self.client.put(
+            f"/api/v1/posts/{post_id}", headers=headers, json={"content": "Final **cut** with a [link](http://x)"}
+        )
+
+        for url in ("/api/v1/sites/essayist/posts", "/api/v1/sites/essayist/posts?cursor="):
+            post = self.client.get(url).get_json()["posts"][0]
+            self.assertEqual(post["excerpt"], "Final cut with a link")
+            self.assertEqual(self.store.loaded_fields, POST_SITE_FIELDS)
+        self.assertEqual(self.store.posts[0].plain_text, "Final cut with a link")
+
+    def test_read_endpoints_answer_conditional_requests_with_304(self):
+        token = self.client.post(
+            "/api/v1/agents/register", json={"username": "poller", "name": "P"}
+        ).get_json()["agent"]["token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        post = self.client.post(
+            "/api/v1/posts", headers=headers, json={"title": "Polled", "content": "body"}
+        ).get_json()["post"]
+        urls = [
+            f"/api/v1/posts/{post['id']}",
+            f"/api/v1/posts/{post['id']}/comments",
+            "/api/v1/sites/poller",
+            "/api/v1/sites/poller/posts",
+            f"/api/v1/sites/poller/posts/{post['slug']}",
+            "/api/v1/posts",
+            "/api/v1/posts?sort=hot",
+        ]
+        first = {url: self.client.get(url) for url in urls}
+        for url, resp in first.items():
+            self.assertEqual(resp.headers["Cache-Control"], "public, no-cache", url)
+            again = self.client.get(url, headers={"If-None-Match": resp.headers["ETag"]})
+            self.assertEqual(again.status_code, 304, url)
+            self.assertEqual(again.data, b"", url)
+
+        single = first[urls[0]]
+        self.assertIn("Last-Modified", single.headers)
+        since = self.client.get(urls[0], headers={"If-Modified-Since": single.headers["Last-Modified"]})
+        self.assertEqual(since.status_code, 304)
+        self.assertGreaterEqual(view_counter.pending_views(post["id"]), 1)
+
+        self.client.post(f"/api/v1/posts/{post['id']}/comments", headers=headers, json={"content": "hi"})
+        for url in urls[:2] + urls[3:5]:
+            changed = self.client.get(url, headers={"If-None-Match": first[url].headers["ETag"]})
+            self.assertEqual(changed.status_code, 200, url)
+        self.assertEqual(self.client.get(f"/api/v1/posts/{post['id']}/comments").get_json()["total"], 1)
+
+        self.client.post("/api/v1/posts", headers=headers, json={"title": "Second", "content": "more"})
+        site = self.client.get(urls[2], headers={"If-None-Match": first[urls[2]].headers["ETag"]})
+        self.assertEqual(site.status_code, 200)
+        self.assertEqual(site.get_json()["site"]["posts_count"], 2)
+        self.assertEqual(self.client.get("/api/v1/posts/missing").headers.get("ETag"), None)
+
+    def test_compressed_post_revalidates_with_its_weak_etag(self):
+        token = self.client.post(
+            "/api/v1/agents/register", json={"username": "zipper", "name": "Z"}
+        ).get_json()["agent"]["token"]
+        post = self.client.post(
+            "/api/v1/posts", headers={"Authorization": f"Bearer {token}"},
+            json={"title": "Long", "content": "Long body. " * 500},
+        ).get_json()["post"]
+
+        zipped = self.client.get(f"/api/v1/posts/{post['id']}", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(zipped.headers["Content-Encoding"], "gzip")
+        self.assertTrue(zipped.headers["ETag"].startswith('W/"'))
+        self.assertEqual(json.loads(gzip.decompress(zipped.data))["post"]["content"], post["content"])
+        again = self.client.get(
+            f"/api/v1/posts/{post['id']}",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": zipped.headers["ETag"]},
+        )
+        self.assertEqual(again.status_code, 304)
+
+    def test_post_endpoints_serve_cached_html_with_format_html(self):
+        token = self.client.post(
+            "/api/v1/agents/register", json={"username": "renderer", "name": "R"}
+        ).get_json()["agent"]["token"]
+        post = self.client.post(
+            "/api/v1/posts",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"title": "Rendered", "content": "Hello <script>x</script>"},
+        ).get_json()["post"]
+        render_cache.clear_render_cache()
+
+        for url in (f"/api/v1/posts/{post['id']}?format=html", f"/api/v1/sites/renderer/posts/{post['slug']}?format=html"):
+            data = self.client.get(url).get_json()["post"]
+            self.assertNotIn("content", data)
+            self.assertIn("Hello", data["content_html"])
+            self.assertNotIn("<script>", data["content_html"])
+        self.assertEqual(render_cache.render_cache_stats(), {"hits": 1, "misses": 1})
+        self.assertEqual(
+            self.client.get(f"/api/v1/posts/{post['id']}").get_json()["post"]["content"], "Hello <script>x</script>"
+        )
+        self.assertEqual(self.client.get(f"/api/v1/posts/{post['id']}?format=pdf").status_code, 400)
+
+    def test_ranked_feed_hits_are_served_from_cached_body(self):
+        reg = self.client.post(
+            "/api/v1/agents/register",
+            json={"username": "cachedauthor", "name": "Cached Author"},
+        )
+        token = reg.get_json()["agent"]["token"]
+        self.client.post(
+            "/api/v1/posts",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"title": "Cached", "content": "# Big body"},
+        )
+
+        miss = self.client.get("/api/v1/posts?sort=popular")
+        hit = self.client.get("/api/v1/posts?sort=popular")
+        self.assertEqual(hit.status_code, 200)
+        self.assertEqual(hit.mimetype, "application/json")
+        self.assertEqual(hit.data, miss.data)
+        self.assertEqual(hit.get_json()["posts"][0]["title"], "Cached")
+        self.assertEqual(popular_cache.popular_cache_stats()["hits"], 1)
+
+    def test_comments_are_paged_by_cursor_with_batched_authors(self):
+        self._publish_posts_from_agents("commented", agent_count=1, posts_per_agent=1)
+        post = self.store.posts[0]
+        for i in range(3):
+            token = self.client.post(
+                "/api/v1/agents/register", json={"username": f"commenter{i}", "name": "C"}
+            ).get_json()["agent"]["token"]
+            for j in range(40):
+                self.client.post(
+                    f"/api/v1/posts/{post.id}/comments",
+                    headers={"Authorization": f"Bearer {token}"},
+                    json={"content": f"c{i}-{j}"},
+                )
+
+        seen, cursor, page_queries = [], "", []
+        while cursor is not None:
+            self.store.queries = 0
+            resp = self.client.get(f"/api/v1/posts/{post.id}/comments?limit=50&before={cursor}")
+            self.assertEqual(resp.status_code, 200)
+            page_queries.append(self.store.queries)
+            body = resp.get_json()
+            self.assertEqual(body["total"], 120)
+            self.assertTrue(all(c["agent_username"].startswith("commenter") for c in body["comments"]))
+            seen.extend(c["id"] for c in body["comments"])
+            cursor = body["next_cursor"]
+
+        self.assertEqual(len(page_queries), 3)
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), {c.id for c in self.store.comments})
+        self.assertLessEqual(max(page_queries), 3)
+
+        bad = self.client.get(f"/api/v1/posts/{post.id}/comments?before=not-a-cursor")
+        self.assertEqual(bad.status_code, 400)
+
+    def test_stats_are_one_cached_query_with_etag(self):
+        self._publish_posts_from_agents("stats", agent_count=2, posts_per_agent=2)
+        token = self.client.post(
+            "/api/v1/agents/register", json={"username": "statsvoter", "name": "V"}
+        ).get_json()["agent"]["token"]
+        self.client.post(
+            f"/api/v1/posts/{self.store.posts[0].id}/upvote", headers={"Authorization": f"Bearer {token}"}
+        )
+
+        queries, stats = self._count_queries("/api/v1/posts/stats")
+        self.assertEqual(queries, 1)
+        self.assertEqual(
+            (stats["total_posts"], stats["active_agents"], stats["total_upvotes"], stats["total_reactions"]),
+            (4, 2, 1, 1),
+        )
+
+        queries, _ = self._count_queries("/api/v1/posts/stats")
+        self.assertEqual(queries, 0)
+        etag = self.client.get("/api/v1/posts/stats").headers["ETag"]
+        not_modified = self.client.get("/api/v1/posts/stats", headers={"If-None-Match": etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.data, b"")
+
+    def test_gzipped_cache_bodies_are_negotiated(self):
+        reg = self.client.post(
+            "/api/v1/agents/register",
+            json={"username": "gzipauthor", "name": "Gzip Author"},
+        )
+        token = reg.get_json()["agent"]["token"]
+        self.client.post(
+            "/api/v1/posts",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"title": "Zipped", "content": "body"},
+        )
+
+        with patch.object(popular_cache, "POPULAR_CACHE_GZIP", True):
+            zipped = self.client.get(
+                "/api/v1/posts?sort=hot", headers={"Accept-Encoding": "gzip"}
+            )
+            plain = self.client.get("/api/v1/posts?sort=hot")
+
+        self.assertEqual(zipped.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", zipped.headers["Vary"])
+        self.assertEqual(json.loads(gzip.decompress(zipped.data)), plain.get_json())
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.get_json()["posts"][0]["title"], "Zipped")
+
     def test_get_recent_voters_returns_usernames(self):
         reg_a = self.client.post(
             "/api/v1/agents/register",
@@ -478,6 +1231,110 @@ class ApiIntegrationSmokeTests(unittest.TestCase):
         self.assertIn("voterup", voters_data["upvoters"])
         self.assertIn("voterdown", voters_data["downvoters"])
 
+    def test_batch_votes_run_in_one_request_with_per_item_results(self):
+        self._publish_posts_from_agents("batchvote", agent_count=3, posts_per_agent=1)
+        token = self.client.post(
+            "/api/v1/agents/register", json={"username": "busyvoter", "name": "B"}
+        ).get_json()["agent"]["token"]
+        first, second, third = (post.id for post in self.store.posts)
+
+        resp = self.client.post(
+            "/api/v1/posts/votes/batch",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"votes": [
+                {"post_id": first, "value": 1},
+                {"post_id": second, "value": -1},
+                {"post_id": "missing", "value": 1},
+                {"post_id": third, "value": 2},
+                {"post_id": first, "value": 1},
+            ]},
+        )
+        self.assertEqual(resp.status_code, 200)
+        results = resp.get_json()["results"]
+        self.assertEqual([r["ok"] for r in results], [True, True, False, False, True])
+        self.assertEqual((results[0]["vote"], results[0]["upvotes"]), (1, 1))
+        self.assertEqual(results[1]["downvotes"], 1)
+        self.assertEqual(results[2]["error"], "Post not found")
+        # Voting the same way again toggles the vote off, as with /upvote.
+        self.assertEqual((results[4]["vote"], results[4]["upvotes"]), (0, 0))
+        self.assertEqual(len(self.store.votes), 1)
+
+        too_many = self.client.post(
+            "/api/v1/posts/votes/batch",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"votes": [{"post_id": first, "value": 1}] * 51},
+        )
+        self.assertEqual(too_many.status_code, 400)
+
+    def test_batch_vote_failure_is_reported_per_item(self):
+        self._publish_posts_from_agents("flaky", agent_count=2, posts_per_agent=1)
+        token = self.client.post(
+            "/api/v1/agents/register", json={"username": "flakyvoter", "name": "F"}
+        ).get_json()["agent"]["token"]
+        first, second = (post.id for post in self.store.posts)
+        cast = FakeVote.cast
+
+        def failing_cast(post_id, agent_id, value):
+            if post_id == first:
+                raise OperationalError("UPDATE posts", {}, Exception("deadlock detected"))
+            return cast(post_id, agent_id, value)
+
+        with patch.object(FakeVote, "cast", failing_cast), self.assertLogs(self.app.logger, "ERROR"):
+            resp = self.client.post(
+                "/api/v1/posts/votes/batch",
+                headers={"Authorization": f"Bearer {token}"},
+                json={"votes": [{"post_id": first, "value": 1}, {"post_id": second, "value": 1}]},
+            )
+        self.assertEqual(resp.status_code, 200)
+        results = resp.get_json()["results"]
+        self.assertEqual(results[0], {"post_id": first, "ok": False, "error": "Vote failed"})
+        self.assertEqual((results[1]["ok"], results[1]["upvotes"]), (True, 1))
+        self.assertEqual([(v.post_id, v.value) for v in self.store.votes], [(second, 1)])
+
+    def test_batch_comments_update_counters_once_per_post(self):
+        self._publish_posts_from_agents("batchcomment", agent_count=2, posts_per_agent=1)
+        token = self.client.post(
+            "/api/v1/agents/register", json={"username": "chatty", "name": "C"}
+        ).get_json()["agent"]["token"]
+        first, second = (post.id for post in self.store.posts)
+
+        resp = self.client.post(
+            "/api/v1/posts/comments/batch",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"comments": [
+                {"post_id": first, "content": "one"},
+                {"post_id": first, "content": "two"},
+                {"post_id": second, "content": "   "},
+                {"post_id": "missing", "content": "lost"},
+                {"post_id": second, "content": "three"},
+                {"post_id": [first], "content": "unhashable"},
+            ]},
+        )
+        self.assertEqual(resp.status_code, 200)
+        results = resp.get_json()["results"]
+        self.assertEqual([r["ok"] for r in results], [True, True, False, False, True, False])
+        self.assertEqual(results[5], {"post_id": None, "ok": False, "error": "Post not found"})
+        self.assertEqual(results[1]["comment"]["content"], "two")
+        self.assertEqual(results[4]["comment"]["agent_username"], "chatty")
+        self.assertEqual([p.comments_count for p in self.store.posts], [2, 1])
+        self.assertEqual(len(self.store.comments), 3)
+
+    def test_recent_voters_is_one_query_per_request(self):
+        self._publish_posts_from_agents("voted", agent_count=1, posts_per_agent=1)
+        post_id = self.store.posts[0].id
+        for i in range(8):
+            token = self.client.post(
+                "/api/v1/agents/register", json={"username": f"fan{i}", "name": "F"}
+            ).get_json()["agent"]["token"]
+            self.client.post(f"/api/v1/posts/{post_id}/upvote", headers={"Authorization": f"Bearer {token}"})
+
+        self.store.queries = 0
+        voters = self.client.get(f"/api/v1/posts/{post_id}/voters?limit=3").get_json()
+        self.assertEqual(voters["upvoters"], ["fan7", "fan6", "fan5"])
+        self.assertEqual(voters["downvoters"], [])
+        # One query for the post, one for the voters.
+        self.assertLessEqual(self.store.queries, 2)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,17 +1,25 @@
+import hashlib
+import os
+import tempfile
 import unittest
 from types import SimpleNamespace
 from unittest.mock import patch
 
 from flask import Flask, jsonify, g
 
-from auth import token_auth
+import auth
+import popular_cache
+from auth import init_auth_cache, invalidate_token, token_auth
+from popular_cache import MemoryCacheBackend
 
 
 class _DummyQuery:
     def __init__(self, agent):
         self._agent = agent
+        self.lookups = []
 
     def filter_by(self, **kwargs):
+        self.lookups.append(kwargs)
         return self
 
     def first(self):
@@ -29,6 +37,11 @@ class TokenAuthSmokeTests(unittest.TestCase):
             return jsonify({"agent_id": g.agent_id})
 
         self.client = self.app.test_client()
+        self.cache_patch = patch.object(auth, "_TOKEN_CACHE", MemoryCacheBackend())
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
 
     def test_allows_authorization_bearer_header(self):
         agent = SimpleNamespace(id="agent-1")
@@ -64,6 +77,42 @@ class TokenAuthSmokeTests(unittest.TestCase):
         self.assertEqual(resp.status_code, 401)
         self.assertEqual(resp.get_json()["error"], "Missing API token")
 
+    def test_looks_up_token_hash_once_until_invalidated(self):
+        query = _DummyQuery(SimpleNamespace(id="agent-3"))
+        headers = {"Authorization": "Bearer token-xyz"}
+        token_hash = hashlib.sha256(b"token-xyz").hexdigest()
+
+        with patch("auth.Agent", SimpleNamespace(query=query)):
+            for _ in range(3):
+                self.assertEqual(self.client.get("/protected", headers=headers).status_code, 200)
+            self.assertEqual(query.lookups, [{"token_hash": token_hash, "is_active": True}])
+
+            invalidate_token(token_hash)
+            query._agent = None
+            self.assertEqual(self.client.get("/protected", headers=headers).status_code, 401)
+            self.assertEqual(len(query.lookups), 2)
+
+    def test_default_sqlite_files_keep_feed_cache_clears_away_from_tokens(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.addCleanup(popular_cache.configure_popular_cache, MemoryCacheBackend())
+        self.app.config.update(AUTH_CACHE_BACKEND="sqlite", POPULAR_CACHE_BACKEND="sqlite")
+        query = _DummyQuery(SimpleNamespace(id="agent-4"))
+        headers = {"Authorization": "Bearer token-sqlite"}
+
+        with patch.object(popular_cache, "SQLITE_CACHE_PATH", os.path.join(tmpdir.name, "feed.sqlite3")), \
+                patch.object(auth, "AUTH_CACHE_SQLITE_PATH", os.path.join(tmpdir.name, "auth.sqlite3")):
+            popular_cache.init_popular_cache(self.app)
+            init_auth_cache(self.app)
+        self.assertNotEqual(auth._TOKEN_CACHE.path, popular_cache._BACKEND.path)
+
+        with patch("auth.Agent", SimpleNamespace(query=query)):
+            self.assertEqual(self.client.get("/protected", headers=headers).status_code, 200)
+            popular_cache.clear_popular_posts_cache()
+            popular_cache.sweep_popular_cache()
+            self.assertEqual(self.client.get("/protected", headers=headers).status_code, 200)
+        self.assertEqual(len(query.lookups), 1)
+
 
 if __name__ == "__main__":
     unittest.main()
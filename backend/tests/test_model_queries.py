@@ -0,0 +1,239 @@
+"""
+Model query helpers against a real Postgres database.
+
+Skipped unless TEST_DATABASE_URL points at a disposable database; the tests
+create and drop their own schema. The API smoke tests replace these helpers
+with in-memory fakes, so this is where their SQL actually runs.
+"""
+
+import os
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import event, text
+
+from extensions import db
+from models import FEED_SORT_KEY_TYPES, FEED_SORT_KEYS, Agent, Comment, Post, Vote
+from pagination import decode_cursor, encode_cursor
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+SCHEMA = 'clawpress_test_models'
+AGENTS = 10
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, 'set TEST_DATABASE_URL to run Postgres model query tests')
+class ModelQueryTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = TEST_DATABASE_URL
+        cls.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {'options': f'-csearch_path={SCHEMA}'},
+        }
+        db.init_app(cls.app)
+        with cls.app.app_context():
+            db.session.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            db.session.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+            db.session.commit()
+            db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.session.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            db.session.commit()
+
+    def setUp(self):
+        self.now = datetime.utcnow().replace(microsecond=0)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.session.execute(text('TRUNCATE post_changes, votes, comments, posts, agents'))
+        for i in range(AGENTS):
+            db.session.add(Agent(id=f'a{i}', username=f'agent{i}', name='A', token_hash=f'{i:064x}'))
+        db.session.flush()
+        db.session.add(Post(id='p1', agent_id='a0', title='Target', slug='target', content='body',
+                            created_at=self.now))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.context.pop()
+
+    def _count_statements(self, func):
+        """Return func()'s result and the number of statements it executed."""
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            result = func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        return result, len(statements)
+
+    def test_recent_voters_are_newest_first_and_limited_per_value(self):
+        # a1..a5 upvote and a6..a9 downvote, one second apart, oldest first.
+        for i in range(1, AGENTS):
+            db.session.add(Vote(post_id='p1', agent_id=f'a{i}', value=1 if i <= 5 else -1,
+                                created_at=self.now + timedelta(seconds=i)))
+        db.session.add(Post(id='p2', agent_id='a0', title='Other', slug='other', content='body',
+                            created_at=self.now))
+        db.session.flush()
+        db.session.add(Vote(post_id='p2', agent_id='a1', value=-1, created_at=self.now + timedelta(hours=1)))
+        db.session.commit()
+
+        voters, statements = self._count_statements(lambda: Vote.recent_voters('p1', 3))
+        self.assertEqual(voters, {1: ['agent5', 'agent4', 'agent3'], -1: ['agent9', 'agent8', 'agent7']})
+        self.assertEqual(statements, 1)
+
+        self.assertEqual(Vote.recent_voters('p1', 10), {
+            1: ['agent5', 'agent4', 'agent3', 'agent2', 'agent1'],
+            -1: ['agent9', 'agent8', 'agent7', 'agent6'],
+        })
+        self.assertEqual(Vote.recent_voters('missing', 3), {1: [], -1: []})
+
+    def _walk_comments(self, limit):
+        pages, cursor = [], ''
+        while cursor is not None:
+            before = decode_cursor(cursor, 'comments', (datetime, str))
+            items, next_key = Comment.keyset_page('p1', before, limit)
+            pages.append([comment.id for comment in items])
+            cursor = encode_cursor('comments', next_key) if next_key else None
+        return pages
+
+    def test_comment_pages_break_created_at_ties_by_id(self):
+        # Five comments share one timestamp and straddle every page boundary below.
+        stamps = [self.now - timedelta(minutes=1)] + [self.now] * 5 + [self.now + timedelta(minutes=1)]
+        for i, created_at in enumerate(stamps):
+            db.session.add(Comment(id=f'c{i}', post_id='p1', agent_id=f'a{i}', content='hi', created_at=created_at))
+        db.session.commit()
+
+        newest_first = ['c6', 'c5', 'c4', 'c3', 'c2', 'c1', 'c0']
+        self.assertEqual(self._walk_comments(3), [newest_first[:3], newest_first[3:6], newest_first[6:]])
+        self.assertEqual(self._walk_comments(2), [newest_first[i:i + 2] for i in range(0, 7, 2)])
+        self.assertEqual(self._walk_comments(7), [newest_first])
+
+    def _walk_feed(self, sort_by, limit):
+        pages, cursor = [], ''
+        while cursor is not None:
+            after = decode_cursor(cursor, sort_by, FEED_SORT_KEY_TYPES[sort_by])
+            items, next_key = Post.keyset_page(Post.query, sort_by, after, limit)
+            pages.append([post.id for post in items])
+            cursor = encode_cursor(sort_by, next_key) if next_key else None
+        return pages
+
+    def test_feed_pages_break_ties_across_page_boundaries(self):
+        # Every sort column has runs of equal values, so each boundary below
+        # falls inside a tie that only later key columns can break.
+        for i in range(2, 10):
+            db.session.add(Post(
+                id=f'p{i}', agent_id='a0', title=f'Post {i}', slug=f'post-{i}', content='body',
+                created_at=self.now + timedelta(minutes=i // 3),
+                popularity_score=i % 2, view_count=i % 3,
+                hot_score=1.5 if i % 2 else 0.25, trending_score=0.0 if i < 6 else 2.0,
+            ))
+        db.session.commit()
+
+        for sort_by, names in FEED_SORT_KEYS.items():
+            rows = Post.query.all()
+            expected = [post.id for post in sorted(
+                rows, key=lambda post: tuple(getattr(post, name) for name in names), reverse=True
+            )]
+            for limit in (1, 2, 3, 4):
+                pages = self._walk_feed(sort_by, limit)
+                with self.subTest(sort=sort_by, limit=limit):
+                    self.assertEqual([post_id for page in pages for post_id in page], expected)
+                    self.assertTrue(all(len(page) == limit for page in pages[:-1]))
+
+    def test_platform_stats_sum_the_stored_counters(self):
+        db.session.add_all([
+            Post(id='p2', agent_id='a1', title='Two', slug='two', content='body', created_at=self.now,
+                 view_count=10, comments_count=2, upvotes=3, downvotes=1),
+            Post(id='p3', agent_id='a1', title='Three', slug='three', content='body', created_at=self.now,
+                 view_count=5, comments_count=0, upvotes=4, downvotes=2),
+        ])
+        db.session.commit()
+
+        stats, statements = self._count_statements(Post.platform_stats)
+        self.assertEqual(stats, {
+            'total_posts': 3, 'active_agents': 2, 'total_views': 15,
+            'total_comments': 2, 'total_upvotes': 7, 'total_downvotes': 3,
+        })
+        self.assertTrue(all(type(value) is int for value in stats.values()))
+        self.assertEqual(statements, 1)
+
+        Post.query.delete()
+        db.session.commit()
+        self.assertEqual(set(Post.platform_stats().values()), {0})
+
+    def test_view_counts_are_applied_in_one_update(self):
+        db.session.add(Post(id='p2', agent_id='a1', title='Two', slug='two', content='body', created_at=self.now,
+                            view_count=10, popularity_score=14))
+        db.session.commit()
+        edited_at = {post.id: post.updated_at for post in Post.query}
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            Post.apply_view_counts({'p1': 3, 'p2': 5, 'missing': 2})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        db.session.commit()
+        self.assertEqual(len(statements), 1)
+        self.assertIn('FROM (VALUES', statements[0])
+
+        db.session.expire_all()
+        posts = {post.id: post for post in Post.query}
+        self.assertEqual((posts['p1'].view_count, posts['p1'].popularity_score), (3, 3))
+        self.assertEqual((posts['p2'].view_count, posts['p2'].popularity_score), (15, 19))
+        # Views are not edits.
+        self.assertEqual({post_id: post.updated_at for post_id, post in posts.items()}, edited_at)
+
+    def test_listing_version_moves_on_edits_and_deletes_but_not_views(self):
+        version, statements = self._count_statements(lambda: Post.listing_version('a0'))
+        self.assertEqual(statements, 1)
+        self.assertEqual(version[0], 1)
+
+        Post.apply_view_counts({'p1': 4})
+        db.session.commit()
+        self.assertEqual(Post.listing_version('a0'), version)
+
+        post = db.session.get(Post, 'p1')
+        post.content = 'edited body'
+        db.session.commit()
+        edited = Post.listing_version('a0')
+        self.assertNotEqual(edited, version)
+
+        Vote.cast('p1', 'a1', 1)
+        db.session.commit()
+        voted = Post.listing_version('a0')
+        self.assertNotEqual(voted, edited)
+
+        db.session.add(Post(id='p2', agent_id='a0', title='Two', slug='two', content='body', created_at=self.now))
+        db.session.commit()
+        added = Post.listing_version('a0')
+        self.assertEqual(added[0], 2)
+
+        Post.query.filter_by(id='p2').delete()
+        db.session.commit()
+        deleted = Post.listing_version('a0')
+        self.assertNotEqual(deleted, added)
+        # The same posts in the same state give the same version back.
+        self.assertEqual(deleted, voted)
+
+        # Other agents' posts are not part of the listing.
+        db.session.add(Post(id='p3', agent_id='a1', title='Three', slug='three', content='body', created_at=self.now))
+        db.session.commit()
+        self.assertEqual(Post.listing_version('a0'), deleted)
+
+
+if __name__ == '__main__':
+    unittest.main()
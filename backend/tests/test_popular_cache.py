@@ -0,0 +1,309 @@
+import fnmatch
+import gzip
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import popular_cache
+from popular_cache import (
+    MemoryCacheBackend,
+    RedisCacheBackend,
+    SQLiteCacheBackend,
+    configure_popular_cache,
+    get_or_build_popular_posts,
+    get_popular_posts_cache,
+    invalidate_popular_posts_cache,
+    is_gzipped,
+    popular_cache_stats,
+    set_popular_posts_cache,
+    sweep_popular_cache,
+)
+
+
+class _FakeRedis:
+    """Local stand-in for the subset of the redis client API the backend uses."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if not entry:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            self.data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value, px=None, nx=False):
+        if nx and self.get(key) is not None:
+            return None
+        self.data[key] = (value, time.time() + px / 1000)
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match="*"):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+
+class _BackendContract:
+    def make_backends(self):
+        """Return two backend instances that stand in for two workers."""
+        raise NotImplementedError
+
+    def setUp(self):
+        self.worker_a, self.worker_b = self.make_backends()
+        self.original_backend = popular_cache._BACKEND
+
+    def tearDown(self):
+        configure_popular_cache(self.original_backend)
+
+    def test_round_trip_and_expiry(self):
+        self.worker_a.set("k", b"v", 1)
+        self.assertEqual(self.worker_a.get("k"), b"v")
+        self.worker_a.set("short", b"v", 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.worker_a.get("short"))
+
+    def test_payload_helpers_round_trip(self):
+        configure_popular_cache(self.worker_a)
+        body = b'{"posts": [{"id": "p1", "title": "Hello"}], "total": 1}'
+        set_popular_posts_cache(("popular", 1, 20), body)
+        self.assertEqual(get_popular_posts_cache(("popular", 1, 20)), body)
+        invalidate_popular_posts_cache()
+        self.assertIsNone(get_popular_posts_cache(("popular", 1, 20)))
+
+    def test_lost_generation_never_revives_old_pages(self):
+        configure_popular_cache(self.worker_a)
+        set_popular_posts_cache(("popular", 1, 20), b"v1")
+        invalidate_popular_posts_cache()
+        set_popular_posts_cache(("popular", 1, 20), b"v2")
+
+        # As if the generation entry had been evicted or had expired.
+        self.worker_a.delete(popular_cache._generation_key(popular_cache.GLOBAL_SCOPE))
+        self.assertIsNone(get_popular_posts_cache(("popular", 1, 20)))
+
+    def test_gzip_mode_stores_compressed_body(self):
+        configure_popular_cache(self.worker_a)
+        body = b'{"posts": []}'
+        with patch.object(popular_cache, "POPULAR_CACHE_GZIP", True):
+            stored = set_popular_posts_cache(("popular", 1, 20), body)
+        self.assertTrue(is_gzipped(stored))
+        self.assertEqual(get_popular_posts_cache(("popular", 1, 20)), stored)
+        self.assertEqual(gzip.decompress(stored), body)
+
+    def test_add_only_succeeds_once_until_expiry(self):
+        self.assertTrue(self.worker_a.add("lock", b"1", 1))
+        self.assertFalse(self.worker_a.add("lock", b"1", 1))
+        self.worker_a.delete("lock")
+        self.assertTrue(self.worker_a.add("lock", b"1", 1))
+
+    def test_concurrent_misses_build_once(self):
+        configure_popular_cache(self.worker_a)
+        builds = []
+        barrier = threading.Barrier(8)
+
+        def build():
+            builds.append(1)
+            time.sleep(0.1)
+            return b'{"posts": []}'
+
+        def request():
+            barrier.wait()
+            results.append(get_or_build_popular_posts(("popular", 1, 20), build))
+
+        results = []
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(results, [b'{"posts": []}'] * 8)
+        self.assertEqual(popular_cache_stats()["waits"], 7)
+
+    def test_stale_body_is_served_while_one_request_rebuilds(self):
+        configure_popular_cache(self.worker_a)
+        key = ("popular", 1, 20)
+        get_or_build_popular_posts(key, lambda: b"v1", ttl_seconds=1)
+        time.sleep(1.05)
+        self.assertIsNone(get_popular_posts_cache(key))
+
+        rebuilding = threading.Event()
+        release = threading.Event()
+
+        def slow_build():
+            rebuilding.set()
+            release.wait(2)
+            return b"v2"
+
+        rebuilder = threading.Thread(target=get_or_build_popular_posts, args=(key, slow_build))
+        rebuilder.start()
+        rebuilding.wait(2)
+        # Meanwhile other requests get the stale page without building.
+        self.assertEqual(get_or_build_popular_posts(key, self.fail), b"v1")
+        release.set()
+        rebuilder.join()
+
+        self.assertEqual(get_or_build_popular_posts(key, self.fail), b"v2")
+        stats = popular_cache_stats()
+        self.assertEqual(stats["stale_hits"], 1)
+        self.assertEqual(stats["stale_rebuilds"], 1)
+
+
+class _SweepContract:
+    def test_sweep_drops_expired_entries(self):
+        configure_popular_cache(self.worker_a)
+        self.worker_a.set("short", b"v", 0.01)
+        self.worker_a.set("long", b"v", 30)
+        time.sleep(0.02)
+
+        self.assertEqual(sweep_popular_cache(), 1)
+        self.assertEqual(popular_cache_stats()["entries"], 1)
+
+
+class TargetedInvalidationTests(unittest.TestCase):
+    def setUp(self):
+        self.original_backend = popular_cache._BACKEND
+        configure_popular_cache(MemoryCacheBackend())
+        self.key = ("popular", 1, 20)
+        set_popular_posts_cache(self.key, b"global")
+        set_popular_posts_cache(self.key, b"a", agent_id="agent-a")
+        set_popular_posts_cache(self.key, b"b", agent_id="agent-b")
+
+    def tearDown(self):
+        configure_popular_cache(self.original_backend)
+
+    def test_write_only_evicts_global_and_own_agent_scope(self):
+        invalidate_popular_posts_cache(agent_id="agent-a")
+        self.assertIsNone(get_popular_posts_cache(self.key))
+        self.assertIsNone(get_popular_posts_cache(self.key, agent_id="agent-a"))
+        self.assertEqual(get_popular_posts_cache(self.key, agent_id="agent-b"), b"b")
+
+    def test_engagement_bursts_are_coalesced_within_window(self):
+        invalidate_popular_posts_cache(agent_id="agent-a", coalesce=True)
+        set_popular_posts_cache(self.key, b"global-v2")
+
+        for _ in range(10):
+            invalidate_popular_posts_cache(agent_id="agent-a", coalesce=True)
+        self.assertEqual(get_popular_posts_cache(self.key), b"global-v2")
+
+        stats = popular_cache_stats()
+        self.assertEqual(stats["invalidations"], 2)
+        self.assertEqual(stats["coalesced_invalidations"], 20)
+        self.assertEqual(stats["hits"], 1)
+
+        # Once the window closes, the owed bump is applied on the next lookup.
+        with patch.object(popular_cache, "POPULAR_CACHE_COALESCE_SECONDS", 0):
+            self.assertIsNone(get_popular_posts_cache(self.key))
+        self.assertEqual(popular_cache_stats()["misses"], 1)
+
+
+class MemoryBackendTests(_SweepContract, _BackendContract, unittest.TestCase):
+    def make_backends(self):
+        return MemoryCacheBackend(), MemoryCacheBackend()
+
+    def test_workers_do_not_share_entries(self):
+        self.worker_a.set("k", b"v", 30)
+        self.assertIsNone(self.worker_b.get("k"))
+
+    def test_least_recently_used_entries_are_evicted_at_capacity(self):
+        backend = MemoryCacheBackend(max_entries=3)
+        for key in ("a", "b", "c"):
+            backend.set(key, b"v", 30)
+        backend.get("a")
+        backend.set("d", b"v", 30)
+
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual([backend.get(key) for key in ("a", "c", "d")], [b"v"] * 3)
+        self.assertEqual(backend.evictions, 1)
+
+    def test_byte_bound_counts_keys_and_values(self):
+        backend = MemoryCacheBackend(max_bytes=100)
+        backend.set("a", b"x" * 49, 30)
+        backend.set("b", b"x" * 49, 30)
+        self.assertEqual(backend.usage(), {"entries": 2, "bytes": 100})
+
+        backend.set("c", b"x" * 9, 30)
+        self.assertIsNone(backend.get("a"))
+        self.assertEqual(backend.usage(), {"entries": 2, "bytes": 60})
+
+        # A page that could never fit is not cached at all.
+        backend.set("huge", b"x" * 200, 30)
+        self.assertIsNone(backend.get("huge"))
+        self.assertEqual(backend.usage()["entries"], 2)
+
+    def test_crawling_pages_keeps_memory_bounded(self):
+        configure_popular_cache(MemoryCacheBackend(max_entries=50, max_bytes=10_000))
+        for page in range(1, 1001):
+            set_popular_posts_cache(("popular", page, 20), b"x" * 100)
+
+        stats = popular_cache_stats()
+        self.assertLessEqual(stats["entries"], 50)
+        self.assertLessEqual(stats["bytes"], 10_000)
+        self.assertGreater(stats["evictions"], 900)
+
+
+class _SharedBackendContract(_BackendContract):
+    def test_hits_and_invalidations_are_shared_between_workers(self):
+        self.worker_a.set(popular_cache.KEY_PREFIX + "k", b"v", 30)
+        self.assertEqual(self.worker_b.get(popular_cache.KEY_PREFIX + "k"), b"v")
+        self.worker_b.clear()
+        self.assertIsNone(self.worker_a.get(popular_cache.KEY_PREFIX + "k"))
+
+    def test_coalesced_write_reaches_other_workers_when_window_closes(self):
+        key = ("popular", 1, 20)
+        with patch.object(popular_cache, "POPULAR_CACHE_COALESCE_SECONDS", 0.2):
+            configure_popular_cache(self.worker_b)
+            set_popular_posts_cache(key, b"v1")
+
+            configure_popular_cache(self.worker_a)
+            invalidate_popular_posts_cache(coalesce=True)
+            configure_popular_cache(self.worker_b)
+            self.assertIsNone(get_popular_posts_cache(key))
+            set_popular_posts_cache(key, b"v2")
+
+            # Worker A's second write falls inside the window and is coalesced.
+            configure_popular_cache(self.worker_a)
+            invalidate_popular_posts_cache(coalesce=True)
+            self.assertEqual(popular_cache_stats()["coalesced_invalidations"], 1)
+            configure_popular_cache(self.worker_b)
+            self.assertEqual(get_popular_posts_cache(key), b"v2")
+
+            # Worker A never reads the feed again; B applies the owed bump.
+            time.sleep(0.25)
+            self.assertIsNone(get_popular_posts_cache(key))
+            set_popular_posts_cache(key, b"v3")
+
+            # The bump is applied once, not again by A's next lookup.
+            configure_popular_cache(self.worker_a)
+            self.assertEqual(get_popular_posts_cache(key), b"v3")
+
+
+class SQLiteBackendTests(_SweepContract, _SharedBackendContract, unittest.TestCase):
+    def make_backends(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmpdir.name, "cache.sqlite3")
+        return SQLiteCacheBackend(path), SQLiteCacheBackend(path)
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmpdir.cleanup()
+
+
+class RedisBackendTests(_SharedBackendContract, unittest.TestCase):
+    def make_backends(self):
+        server = _FakeRedis()
+        return RedisCacheBackend(client=server), RedisCacheBackend(client=server)
+
+
+if __name__ == "__main__":
+    unittest.main()
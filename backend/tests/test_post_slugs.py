@@ -0,0 +1,167 @@
+"""
+Post slug allocation against a real Postgres database.
+
+Skipped unless TEST_DATABASE_URL points at a disposable database; the tests
+create and drop their own schema.
+"""
+
+import os
+import threading
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from flask import Flask
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+
+from api.posts import save_with_free_slug
+from extensions import db
+from models import Agent, Post
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+SCHEMA = 'clawpress_test_slugs'
+RACERS = 3
+PUBLISHES = 1000
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, 'set TEST_DATABASE_URL to run Postgres slug tests')
+class PostSlugTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = TEST_DATABASE_URL
+        cls.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {'options': f'-csearch_path={SCHEMA}'},
+        }
+        db.init_app(cls.app)
+        with cls.app.app_context():
+            db.session.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            db.session.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+            db.session.commit()
+            db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.session.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            db.session.commit()
+
+    def setUp(self):
+        with self.app.app_context():
+            db.session.execute(text('TRUNCATE post_changes, votes, comments, posts, agents'))
+            for i in range(2):
+                db.session.add(Agent(id=f'a{i}', username=f'agent{i}', name='A', token_hash=f'{i:064x}'))
+            db.session.commit()
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.context.pop()
+
+    def _publish(self, title, base_slug, agent_id='a0'):
+        post = Post(agent_id=agent_id, title=title, content='body', created_at=datetime.utcnow())
+        save_with_free_slug(post, base_slug)
+        db.session.commit()
+        return post
+
+    def test_identically_titled_posts_get_sequential_slugs(self):
+        slugs = [self._publish('Hello', 'hello').slug for _ in range(5)]
+        self.assertEqual(slugs, ['hello', 'hello-1', 'hello-2', 'hello-3', 'hello-4'])
+        # Another agent's slugs don't count.
+        self.assertEqual(self._publish('Hello', 'hello', agent_id='a1').slug, 'hello')
+
+        # A freed suffix is reused; a post keeps its own slug when re-saved.
+        Post.query.filter_by(agent_id='a0', slug='hello-2').delete()
+        db.session.commit()
+        self.assertEqual(self._publish('Hello', 'hello').slug, 'hello-2')
+        first = Post.query.filter_by(agent_id='a0', slug='hello').one()
+        self.assertEqual(Post.next_free_slug('a0', 'hello', exclude_id=first.id), 'hello')
+
+    def test_many_identical_titles_cost_constant_statements_per_publish(self):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements[-1] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            posts = []
+            for _ in range(PUBLISHES):
+                statements.append(0)
+                posts.append(self._publish('Daily Report', 'daily-report'))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+        slugs = [post.slug for post in posts]
+        self.assertEqual(len(set(slugs)), PUBLISHES)
+        self.assertEqual(slugs[:3], ['daily-report', 'daily-report-1', 'daily-report-2'])
+        self.assertEqual(slugs[-1], f'daily-report-{PUBLISHES - 1}')
+        # Slug lookup is one statement however many posts share the base.
+        self.assertEqual(set(statements), {statements[0]})
+
+        # Retitling to the same base keeps a post's own slug.
+        for post in (posts[0], posts[-1]):
+            slug = post.slug
+            save_with_free_slug(post, 'daily-report')
+            db.session.commit()
+            self.assertEqual(post.slug, slug)
+
+    def test_numbers_from_titles_are_not_counters(self):
+        self._publish('Report', 'report')
+        self.assertEqual(self._publish('Report 2024', 'report-2024').slug, 'report-2024')
+        self.assertEqual(self._publish('Report 01', 'report-01').slug, 'report-01')
+        self.assertEqual(self._publish('Report', 'report').slug, 'report-1')
+        self.assertEqual(self._publish('Report', 'report').slug, 'report-2')
+        # A longer base sharing the prefix is a different slug family.
+        self.assertEqual(self._publish('Report card', 'report-card').slug, 'report-card')
+
+    def test_taken_slug_retries_on_uq_agent_slug(self):
+        self._publish('Race', 'race')
+        next_free_slug = Post.next_free_slug
+        calls = []
+
+        def stale_then_fresh(agent_id, base_slug, exclude_id=None):
+            # The first answer is what a publish racing the one above would have seen.
+            calls.append(base_slug)
+            if len(calls) == 1:
+                return base_slug
+            return next_free_slug(agent_id, base_slug, exclude_id=exclude_id)
+
+        with patch.object(Post, 'next_free_slug', stale_then_fresh):
+            post = self._publish('Race', 'race')
+        self.assertEqual((post.slug, len(calls)), ('race-1', 2))
+
+        # Every attempt losing gives up with the constraint error.
+        with patch.object(Post, 'next_free_slug', lambda agent_id, base_slug, exclude_id=None: base_slug):
+            with self.assertRaises(IntegrityError):
+                self._publish('Race', 'race')
+        db.session.rollback()
+        self.assertEqual(Post.query.filter_by(agent_id='a0').count(), 2)
+
+    def test_concurrent_publishes_get_distinct_slugs(self):
+        errors, slugs = [], []
+        start = threading.Barrier(RACERS)
+
+        def publish():
+            with self.app.app_context():
+                try:
+                    start.wait()
+                    slugs.append(self._publish('Same title', 'same-title').slug)
+                except Exception as exc:  # pragma: no cover - reported below
+                    db.session.rollback()
+                    errors.append(exc)
+
+        threads = [threading.Thread(target=publish) for _ in range(RACERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(slugs), ['same-title', 'same-title-1', 'same-title-2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
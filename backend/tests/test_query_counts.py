@@ -0,0 +1,116 @@
+"""
+Statements per feed and site page against a real Postgres database.
+
+Skipped unless TEST_DATABASE_URL points at a disposable database; the tests
+create and drop their own schema. Statements are counted on the engine, so
+the bounds hold for the real queries rather than for test doubles.
+"""
+
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, event, text
+
+from app import create_app
+from config import DevelopmentConfig, config
+from extensions import db
+from models import Agent, Post
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+SCHEMA = 'clawpress_test_query_counts'
+
+
+class QueryCountConfig(DevelopmentConfig):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = TEST_DATABASE_URL
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'options': f'-csearch_path={SCHEMA}'}}
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, 'set TEST_DATABASE_URL to run Postgres query count tests')
+class QueryCountTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.admin = create_engine(TEST_DATABASE_URL, isolation_level='AUTOCOMMIT')
+        with cls.admin.connect() as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            conn.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+        # create_app creates the tables and applies the schema patches.
+        with patch.dict(config, {'query-counts': QueryCountConfig}):
+            cls.app = create_app('query-counts')
+        cls.client = cls.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        with cls.admin.connect() as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+        cls.admin.dispose()
+
+    def setUp(self):
+        self.seeded = 0
+        with self.app.app_context():
+            db.session.execute(text('TRUNCATE post_changes, votes, comments, posts, agents'))
+            db.session.commit()
+
+    def _seed(self, prefix, agent_count, posts_per_agent):
+        started = datetime.utcnow() - timedelta(days=1)
+        with self.app.app_context():
+            for i in range(agent_count):
+                agent = Agent(id=f'{prefix}{i}', username=f'{prefix}{i}', name='A',
+                              token_hash=f'{prefix}{i}'.ljust(64, '0'))
+                db.session.add(agent)
+                db.session.flush()
+                for j in range(posts_per_agent):
+                    self.seeded += 1
+                    db.session.add(Post(agent_id=agent.id, title=f'Post {j}', slug=f'post-{j}',
+                                        content='body', created_at=started + timedelta(seconds=self.seeded)))
+            db.session.commit()
+
+    def _count_statements(self, url):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            resp = self.client.get(url)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        self.assertEqual(resp.status_code, 200)
+        return len(statements), resp.get_json()
+
+    def test_feed_page_is_three_statements_however_many_authors(self):
+        self._seed('small', agent_count=2, posts_per_agent=2)
+        small_statements, small = self._count_statements('/api/v1/posts?per_page=50')
+        self.assertEqual(len(small['posts']), 4)
+
+        self._seed('large', agent_count=6, posts_per_agent=5)
+        large_statements, large = self._count_statements('/api/v1/posts?per_page=50')
+        self.assertEqual(len(large['posts']), 34)
+        self.assertTrue(all(post['agent_username'] for post in large['posts']))
+
+        # Items, total and one batched author lookup.
+        self.assertEqual((small_statements, large_statements), (3, 3))
+
+    def test_site_page_is_four_statements_however_many_posts(self):
+        self._seed('site', agent_count=1, posts_per_agent=25)
+        small_statements, _ = self._count_statements('/api/v1/sites/site0/posts?per_page=2')
+        large_statements, large = self._count_statements('/api/v1/sites/site0/posts?per_page=25')
+        self.assertEqual(len(large['posts']), 25)
+        self.assertEqual(large['site']['posts_count'], 25)
+
+        # Agent, listing version (which also gives posts_count), items and total.
+        self.assertEqual((small_statements, large_statements), (4, 4))
+        cursor_statements, _ = self._count_statements('/api/v1/sites/site0/posts?per_page=25&cursor=')
+        self.assertEqual(cursor_statements, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from datetime import datetime, timedelta
+
+from ranking import TRENDING_WINDOW, hot_score, trending_score
+
+
+class RankingFormulaTests(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime(2026, 6, 1, 12, 0, 0)
+
+    def test_hot_score_rewards_engagement(self):
+        quiet = hot_score(0, 0, 0, self.now)
+        liked = hot_score(10, 0, 0, self.now)
+        disliked = hot_score(0, 10, 0, self.now)
+        self.assertGreater(liked, quiet)
+        self.assertLess(disliked, quiet)
+
+    def test_hot_score_lets_new_posts_overtake_old_viral_posts(self):
+        old_viral = hot_score(1000, 0, 0, self.now - timedelta(days=3))
+        fresh = hot_score(10, 0, 0, self.now)
+        self.assertGreater(fresh, old_viral)
+
+    def test_trending_score_decays_with_age(self):
+        young = trending_score(10, 0, 2, self.now - timedelta(hours=1), now=self.now)
+        older = trending_score(10, 0, 2, self.now - timedelta(hours=20), now=self.now)
+        self.assertGreater(young, older)
+        self.assertGreater(older, 0)
+
+    def test_trending_score_is_zero_outside_window_or_without_engagement(self):
+        stale = self.now - TRENDING_WINDOW - timedelta(minutes=1)
+        self.assertEqual(trending_score(500, 0, 0, stale, now=self.now), 0.0)
+        self.assertEqual(trending_score(0, 3, 0, self.now, now=self.now), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import patch
+
+import render_cache
+from popular_cache import MemoryCacheBackend
+from render_cache import (
+    apply_content_format,
+    clear_render_cache,
+    render_cache_stats,
+    render_markdown,
+    rendered_html,
+)
+
+
+class RenderCacheTests(unittest.TestCase):
+    def setUp(self):
+        clear_render_cache()
+
+    def test_each_content_revision_is_rendered_once(self):
+        with patch.object(render_cache, "render_markdown", wraps=render_markdown) as render:
+            first = rendered_html("# Title\n\nBody")
+            self.assertEqual(rendered_html("# Title\n\nBody"), first)
+            rendered_html("# Title\n\nEdited body")
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual(render_cache_stats(), {"hits": 1, "misses": 2})
+
+    def test_renderer_version_is_part_of_the_key(self):
+        rendered_html("same body")
+        with patch.object(render_cache, "RENDER_VERSION", render_cache.RENDER_VERSION + 1):
+            rendered_html("same body")
+        self.assertEqual(render_cache_stats()["misses"], 2)
+
+    def test_configured_backend_stores_encoded_bodies(self):
+        backend = MemoryCacheBackend()
+        with patch.object(render_cache, "_RENDER_CACHE", backend):
+            rendered_html("héllo")
+            self.assertEqual(backend.usage()["entries"], 1)
+            self.assertEqual(rendered_html("héllo"), render_markdown("héllo"))
+
+    def test_apply_content_format_swaps_content_for_html(self):
+        self.assertEqual(apply_content_format({"content": "x"}, "markdown"), {"content": "x"})
+        data = apply_content_format({"content": "x"}, "html")
+        self.assertEqual(set(data), {"content_html"})
+
+    @patch.object(render_cache, "markdown", None)
+    def test_fallback_without_renderer_escapes_markup(self):
+        body = render_markdown("<script>alert(1)</script>\n\nsecond\nline")
+        self.assertNotIn("<script>", body)
+        self.assertEqual(body, "<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>\n<p>second<br>\nline</p>\n")
+
+    @unittest.skipUnless(render_cache.markdown and render_cache.nh3, "Markdown and nh3 not installed")
+    def test_rendered_markdown_is_sanitized(self):
+        body = render_markdown(
+            "# Hi\n\n**bold** [ok](https://x.test) [bad](javascript:alert(1))\n\n"
+            "<script>alert(1)</script>\n\n```python\nprint(1)\n```"
+        )
+        self.assertIn("<h1>Hi</h1>", body)
+        self.assertIn("<strong>bold</strong>", body)
+        self.assertIn('href="https://x.test"', body)
+        self.assertNotIn("javascript:", body)
+        self.assertNotIn("<script>", body)
+        self.assertIn('<code class="language-python">', body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import gzip
+import json
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import patch
+
+from flask import Flask, Response, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+import compression
+import json_provider
+from compression import init_compression
+from json_provider import OrjsonProvider, init_json_provider
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    init_json_provider(app)
+    init_compression(app)
+
+    @app.route("/big")
+    def big():
+        return jsonify({"posts": [{"id": i, "content": "word " * 50} for i in range(20)]})
+
+    @app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    @app.route("/tagged")
+    def tagged():
+        response = jsonify({"body": "x" * 4096})
+        response.set_etag("v1")
+        return response
+
+    @app.route("/pre-encoded")
+    def pre_encoded():
+        response = Response(gzip.compress(b'{"a": 1}' * 500), mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+        return response
+
+    return app
+
+
+class CompressionTests(unittest.TestCase):
+    def setUp(self):
+        self.client = make_app().test_client()
+
+    def test_large_json_is_gzipped_for_clients_that_accept_it(self):
+        plain = self.client.get("/big")
+        zipped = self.client.get("/big", headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(zipped.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", zipped.headers["Vary"])
+        self.assertIn("Accept-Encoding", plain.headers["Vary"])
+        self.assertEqual(int(zipped.headers["Content-Length"]), len(zipped.data))
+        self.assertLess(len(zipped.data), len(plain.data))
+        self.assertEqual(json.loads(gzip.decompress(zipped.data)), plain.get_json())
+
+    def test_small_and_pre_encoded_bodies_are_left_alone(self):
+        small = self.client.get("/small", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", small.headers)
+        self.assertNotIn("Vary", small.headers)
+
+        pre = self.client.get("/pre-encoded", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(gzip.decompress(pre.data), b'{"a": 1}' * 500)
+
+    def test_compressed_responses_weaken_strong_etags(self):
+        self.assertEqual(self.client.get("/tagged").headers["ETag"], '"v1"')
+        zipped = self.client.get("/tagged", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(zipped.headers["ETag"], 'W/"v1"')
+
+    def test_brotli_is_preferred_when_available(self):
+        fake = type("FakeBrotli", (), {"compress": staticmethod(lambda data, quality: b"br:" + data[:10])})
+        with patch.object(compression, "brotli", fake):
+            resp = self.client.get("/big", headers={"Accept-Encoding": "gzip, br"})
+            self.assertEqual(resp.headers["Content-Encoding"], "br")
+            resp = self.client.get("/big", headers={"Accept-Encoding": "gzip;q=1.0, br;q=0.5"})
+            self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+
+    def test_compression_can_be_disabled(self):
+        client = make_app(COMPRESS_RESPONSES=False).test_client()
+        resp = client.get("/big", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", resp.headers)
+
+
+class JsonProviderTests(unittest.TestCase):
+    PAYLOAD = {
+        "b": [1, 2.5, None, True],
+        "a": {"when": datetime(2024, 1, 2, 3, 4, 5), "price": Decimal("1.10"), "name": "Zoë"},
+        "votes": {1: ["up"], -1: ["down"]},
+    }
+
+    @unittest.skipUnless(json_provider.orjson, "orjson not installed")
+    def test_orjson_output_matches_default_provider(self):
+        app = make_app()
+        self.assertIsInstance(app.json, OrjsonProvider)
+        default = DefaultJSONProvider(app)
+        self.assertEqual(app.json.dumps(self.PAYLOAD), default.dumps(self.PAYLOAD, ensure_ascii=False, separators=(",", ":")))
+        self.assertEqual(app.json.loads(app.json.dumps(self.PAYLOAD)), default.loads(default.dumps(self.PAYLOAD)))
+        with app.test_request_context():
+            self.assertEqual(
+                json.loads(app.json.response(self.PAYLOAD).get_data()), json.loads(default.response(self.PAYLOAD).get_data())
+            )
+
+    def test_default_provider_can_be_selected(self):
+        self.assertNotIsInstance(make_app(JSON_PROVIDER="default").json, OrjsonProvider)
+        with self.assertRaises(ValueError):
+            make_app(JSON_PROVIDER="simplejson")
+
+    @patch.object(json_provider, "orjson", None)
+    def test_missing_orjson_keeps_flask_provider(self):
+        self.assertNotIsInstance(make_app().json, OrjsonProvider)
+
+
+if __name__ == "__main__":
+    unittest.main()
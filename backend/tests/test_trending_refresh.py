@@ -0,0 +1,70 @@
+"""
+Scheduled trending refreshes against a real Postgres database.
+
+Skipped unless TEST_DATABASE_URL points at a disposable database; the tests
+create and drop their own schema.
+"""
+
+import os
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+from maintenance import refresh_trending_scores
+from models import Agent, Post
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+SCHEMA = 'clawpress_test_trending'
+INTERVAL = timedelta(minutes=5)
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, 'set TEST_DATABASE_URL to run Postgres trending tests')
+class TrendingRefreshTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = TEST_DATABASE_URL
+        cls.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {'options': f'-csearch_path={SCHEMA}'},
+        }
+        db.init_app(cls.app)
+        with cls.app.app_context():
+            db.session.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            db.session.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+            db.session.commit()
+            db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.session.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            db.session.commit()
+
+    def setUp(self):
+        with self.app.app_context():
+            db.session.execute(text('TRUNCATE maintenance_runs, post_changes, votes, comments, posts, agents'))
+            db.session.add(Agent(id='a0', username='agent0', name='A', token_hash=f'{0:064x}'))
+            db.session.flush()
+            db.session.add(Post(id='p1', agent_id='a0', title='Fresh', slug='fresh', content='body',
+                                upvotes=5, created_at=datetime.utcnow()))
+            db.session.commit()
+
+    def test_scheduled_refresh_runs_once_per_interval(self):
+        now = datetime.utcnow()
+        with self.app.app_context():
+            self.assertEqual(refresh_trending_scores(now, min_interval=INTERVAL), 1)
+            # Other workers' ticks within the interval skip the refresh.
+            self.assertIsNone(refresh_trending_scores(now + INTERVAL / 3, min_interval=INTERVAL))
+            self.assertIsNone(refresh_trending_scores(now + INTERVAL * 2 / 3, min_interval=INTERVAL))
+            self.assertEqual(refresh_trending_scores(now + INTERVAL, min_interval=INTERVAL), 1)
+            # Unscheduled refreshes (startup, `flask refresh-rankings`) always run.
+            self.assertEqual(refresh_trending_scores(now + INTERVAL), 1)
+            self.assertGreater(db.session.get(Post, 'p1').trending_score, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
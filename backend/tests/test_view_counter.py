@@ -0,0 +1,109 @@
+import threading
+import unittest
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import view_counter
+from view_counter import flush_view_counts, pending_views, record_view
+
+
+class _FakePostTable:
+    """Applies buffered views like the bulk UPDATE in Post.apply_view_counts."""
+
+    def __init__(self):
+        self.view_count = Counter()
+        self.updates = 0
+        self.fail = False
+
+    def apply_view_counts(self, counts):
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        self.updates += 1
+        self.view_count.update(counts)
+
+
+class _FakeSession:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class ViewCounterTests(unittest.TestCase):
+    def setUp(self):
+        view_counter._drain()
+        self.table = _FakePostTable()
+        self.session = _FakeSession()
+        self.patches = [
+            patch.object(view_counter, "Post", self.table),
+            patch.object(view_counter, "db", SimpleNamespace(session=self.session)),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        view_counter._drain()
+
+    def test_views_are_written_in_one_bulk_update(self):
+        self.assertEqual(record_view("p1"), 1)
+        self.assertEqual(record_view("p1"), 2)
+        record_view("p2")
+
+        self.assertEqual(flush_view_counts(), 3)
+        self.assertEqual(self.table.view_count, Counter({"p1": 2, "p2": 1}))
+        self.assertEqual((self.table.updates, self.session.commits), (1, 1))
+        self.assertEqual(pending_views("p1"), 0)
+
+        # Nothing buffered means no transaction at all.
+        self.assertEqual(flush_view_counts(), 0)
+        self.assertEqual(self.session.commits, 1)
+
+    def test_concurrent_views_are_not_lost(self):
+        threads_count, views_per_thread = 16, 500
+        stop = threading.Event()
+
+        def reader(post_id):
+            for _ in range(views_per_thread):
+                record_view(post_id)
+
+        def flusher():
+            while not stop.is_set():
+                flush_view_counts()
+
+        background = threading.Thread(target=flusher)
+        background.start()
+        readers = [threading.Thread(target=reader, args=(f"p{i % 4}",)) for i in range(threads_count)]
+        for thread in readers:
+            thread.start()
+        for thread in readers:
+            thread.join()
+        stop.set()
+        background.join()
+        flush_view_counts()
+
+        self.assertEqual(sum(self.table.view_count.values()), threads_count * views_per_thread)
+        self.assertEqual(self.table.view_count["p0"], 4 * views_per_thread)
+
+    def test_failed_flush_keeps_views_for_the_next_one(self):
+        record_view("p1", 5)
+        self.table.fail = True
+        with self.assertRaises(RuntimeError):
+            flush_view_counts()
+        self.assertEqual(self.session.rollbacks, 1)
+
+        record_view("p1")
+        self.table.fail = False
+        self.assertEqual(flush_view_counts(), 6)
+        self.assertEqual(self.table.view_count["p1"], 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
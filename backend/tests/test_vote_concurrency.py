@@ -0,0 +1,109 @@
+"""
+Concurrent voting against a real Postgres database.
+
+Skipped unless TEST_DATABASE_URL points at a disposable database; the tests
+create and drop their own schema. CI runs this module with
+`-W error::sqlalchemy.exc.SAWarning`, so a vote statement that SQLAlchemy
+warns about (e.g. a cartesian product) fails the build.
+"""
+
+import os
+import threading
+import unittest
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import func, text
+
+from extensions import db
+from models import Agent, Post, Vote
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+SCHEMA = 'clawpress_test_votes'
+AGENTS = 40
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, 'set TEST_DATABASE_URL to run Postgres concurrency tests')
+class VoteConcurrencyTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+        cls.app.config['SQLALCHEMY_DATABASE_URI'] = TEST_DATABASE_URL
+        cls.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {'options': f'-csearch_path={SCHEMA}'},
+            'pool_size': AGENTS,
+        }
+        db.init_app(cls.app)
+        with cls.app.app_context():
+            db.session.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            db.session.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+            db.session.commit()
+            db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.session.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            db.session.commit()
+
+    def setUp(self):
+        with self.app.app_context():
+            db.session.execute(text('TRUNCATE post_changes, votes, comments, posts, agents'))
+            for i in range(AGENTS):
+                db.session.add(Agent(id=f'a{i}', username=f'agent{i}', name='A', token_hash=f'{i:064x}'))
+            db.session.flush()
+            db.session.add(Post(id='p1', agent_id='a0', title='Target', slug='target', content='body',
+                                created_at=datetime.utcnow()))
+            db.session.commit()
+
+    def _hammer(self, votes):
+        """Run (agent_id, value) votes concurrently; return any exceptions raised."""
+        errors = []
+        start = threading.Barrier(len(votes))
+
+        def vote(agent_id, value):
+            with self.app.app_context():
+                try:
+                    start.wait()
+                    Vote.cast('p1', agent_id, value)
+                    db.session.commit()
+                except Exception as exc:  # pragma: no cover - reported below
+                    db.session.rollback()
+                    errors.append(exc)
+
+        threads = [threading.Thread(target=vote, args=item) for item in votes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def _assert_counters_match_votes(self):
+        with self.app.app_context():
+            post = db.session.get(Post, 'p1')
+            up = db.session.query(func.count(Vote.id)).filter_by(post_id='p1', value=1).scalar()
+            down = db.session.query(func.count(Vote.id)).filter_by(post_id='p1', value=-1).scalar()
+            self.assertEqual((post.upvotes, post.downvotes), (up, down))
+            self.assertEqual(post.popularity_score, up + down)
+            return up, down
+
+    def test_many_agents_voting_at_once_keep_exact_counters(self):
+        errors = self._hammer([(f'a{i}', 1 if i % 4 else -1) for i in range(AGENTS)])
+        self.assertEqual(errors, [])
+        self.assertEqual(self._assert_counters_match_votes(), (AGENTS * 3 // 4, AGENTS // 4))
+
+        # Everyone flips at once: upvoters switch to downvotes and vice versa.
+        errors = self._hammer([(f'a{i}', -1 if i % 4 else 1) for i in range(AGENTS)])
+        self.assertEqual(errors, [])
+        self.assertEqual(self._assert_counters_match_votes(), (AGENTS // 4, AGENTS * 3 // 4))
+
+    def test_same_agent_racing_itself_never_violates_the_unique_vote(self):
+        errors = self._hammer([('a1', 1)] * 16 + [('a1', -1)] * 16)
+        self.assertEqual(errors, [])
+        up, down = self._assert_counters_match_votes()
+        self.assertLessEqual(up + down, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
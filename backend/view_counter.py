@@ -0,0 +1,56 @@
+"""
+Buffered post view counts.
+
+Reading a post only bumps an in-process counter; a periodic flush (every
+`VIEW_FLUSH_SECONDS`) adds all pending views with one atomic
+``view_count = view_count + n`` UPDATE, and whatever is still buffered when a
+worker exits is flushed at shutdown.
+"""
+
+from collections import Counter
+from threading import Lock
+
+from extensions import db
+from models import Post
+
+
+_PENDING = Counter()
+_LOCK = Lock()
+
+
+def record_view(post_id, count=1):
+    """Buffer a view and return this post's views not yet written."""
+    with _LOCK:
+        _PENDING[post_id] += count
+        return _PENDING[post_id]
+
+
+def pending_views(post_id):
+    with _LOCK:
+        return _PENDING.get(post_id, 0)
+
+
+def _drain():
+    with _LOCK:
+        counts = dict(_PENDING)
+        _PENDING.clear()
+    return counts
+
+
+def flush_view_counts():
+    """Write buffered views to the database; returns how many were written.
+
+    On failure the views go back into the buffer for the next flush.
+    """
+    counts = _drain()
+    if not counts:
+        return 0
+    try:
+        Post.apply_view_counts(counts)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        with _LOCK:
+            _PENDING.update(counts)
+        raise
+    return sum(counts.values())
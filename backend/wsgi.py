@@ -1,3 +1,5 @@
 from app import create_app
+from background import start_background_tasks
 
 app = create_app('production')
+start_background_tasks(app)
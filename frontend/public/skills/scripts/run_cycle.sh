@@ -371,7 +371,7 @@ run() {
     exit 1
   fi
 
-  posts_resp="$(request_json GET "$API_BASE/posts?page=1&per_page=20")"
+  posts_resp="$(request_json GET "$API_BASE/posts?per_page=20&cursor=&fields=agent_id")"
   posts_code="${posts_resp%%|*}"
   posts_file="${posts_resp#*|}"
   if [[ "$posts_code" != "200" ]]; then
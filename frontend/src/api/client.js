@@ -119,8 +119,9 @@ class ApiClient {
   }
 
   // Comment APIs
-  async getComments(postId) {
-    return await this.request('GET', `/posts/${postId}/comments`)
+  async getComments(postId, params = {}) {
+    const query = new URLSearchParams(params).toString()
+    return await this.request('GET', `/posts/${postId}/comments${query ? '?' + query : ''}`)
   }
 
   async createComment(postId, content) {
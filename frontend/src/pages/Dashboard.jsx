@@ -29,7 +29,7 @@ function Dashboard() {
       api.setToken(token)
       const [agentData, postsData] = await Promise.all([
         api.getMe(),
-        api.getPosts()
+        api.getPosts({ view: 'summary' })
       ])
       setAgent(agentData.agent)
       setPosts(postsData.posts.filter(p => p.agent_id === agentData.agent.id))
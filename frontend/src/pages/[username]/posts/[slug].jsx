@@ -43,6 +43,8 @@ function SitePost({ initialSite, initialPost }) {
   const site = initialSite
   const post = initialPost
   const [comments, setComments] = useState([])
+  const [commentsTotal, setCommentsTotal] = useState(0)
+  const [commentsCursor, setCommentsCursor] = useState(null)
   const [shareUrl, setShareUrl] = useState('')
 
   useEffect(() => {
@@ -60,10 +62,13 @@ function SitePost({ initialSite, initialPost }) {
         const commentsData = await api.getComments(post.id)
         if (!cancelled) {
           setComments(commentsData.comments || [])
+          setCommentsTotal(commentsData.total || 0)
+          setCommentsCursor(commentsData.next_cursor || null)
         }
       } catch (error) {
         if (!cancelled) {
           setComments([])
+          setCommentsCursor(null)
         }
       }
     }
@@ -73,6 +78,17 @@ function SitePost({ initialSite, initialPost }) {
     }
   }, [post?.id])
 
+  const loadMoreComments = async () => {
+    if (!commentsCursor) return
+    try {
+      const commentsData = await api.getComments(post.id, { before: commentsCursor })
+      setComments(prev => [...prev, ...(commentsData.comments || [])])
+      setCommentsCursor(commentsData.next_cursor || null)
+    } catch (error) {
+      setCommentsCursor(null)
+    }
+  }
+
   useEffect(() => {
     if (typeof window === 'undefined') return
     setShareUrl(window.location.href.split('#')[0])
@@ -187,7 +203,7 @@ function SitePost({ initialSite, initialPost }) {
         <section className="site-comments site-comments--reading">
           <div className="site-comments-head">
             <h3>Replies</h3>
-            <span>{comments.length} replies</span>
+            <span>{Math.max(commentsTotal, comments.length)} replies</span>
           </div>
 
           {comments.length === 0 ? (
@@ -209,6 +225,14 @@ function SitePost({ initialSite, initialPost }) {
               ))}
             </div>
           )}
+
+          {commentsCursor && (
+            <div className="site-posts-load-more">
+              <button onClick={loadMoreComments} className="btn btn-secondary">
+                Load More
+              </button>
+            </div>
+          )}
         </section>
       </div>
     </div>
@@ -33,7 +33,7 @@ function Home() {
   const loadPosts = async (pageNum = 1, tab = feedTab) => {
     setLoading(true)
     try {
-      const params = { page: pageNum, per_page: 10 }
+      const params = { page: pageNum, per_page: 10, view: 'summary' }
       if (tab === 'popular') {
         params.sort = 'popular'
       }